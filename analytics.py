@@ -0,0 +1,292 @@
+"""
+Attendance Analytics
+Smart Attendance System
+
+Attendance percentages, department/section aggregates, streaks and
+defaulter lists, answered from an in-memory bit matrix instead of
+COUNT(DISTINCT date) queries over the attendance table:
+
+- one row per student, one bit per working day (the working_days
+  calendar up to today), packed 8 days to a byte: a year for 5,000
+  students is about 200 KB
+- a student's percentage counts the working days from their enrolment
+  date, like the student dashboard
+- built from the rollup tables on first use, then kept up to date after
+  each committed mark and registration, like today's counters
+- rebuilt every `resync_seconds` (and after a deletion or a mark for a
+  day it has not seen yet), which picks up other worker processes, and
+  before the next query whenever the calendar version changes, so
+  `flask calendar` edits apply at once
+
+Every query unpacks the requested day window once and works on whole
+columns with NumPy, so it costs milliseconds for thousands of students.
+"""
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+import numpy as np
+
+GROUPS = ('department', 'section')
+
+
+def percentages(present, eligible):
+    """present / eligible days in percent, 0 where nothing was eligible"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(eligible > 0, np.round(present / eligible * 100, 2), 0.0)
+
+
+def streaks(present):
+    """(current, longest) runs of present days per row of a boolean (students, days) matrix
+
+    The current streak is the run ending on the last day of the window.
+    """
+    rows, days = present.shape
+    if not days:
+        return np.zeros(rows, dtype=np.int64), np.zeros(rows, dtype=np.int64)
+    absent = ~present[:, ::-1]
+    current = np.where(absent.any(axis=1), absent.argmax(axis=1), days)
+
+    # Runs start where a row steps 0 -> 1 and end where it steps 1 -> 0;
+    # both come out of nonzero() row by row and left to right, so they pair up
+    edges = np.diff(np.pad(present.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    longest = np.zeros(rows, dtype=np.int64)
+    np.maximum.at(longest, start_rows, end_cols - start_cols)
+    return current.astype(np.int64), longest
+
+
+class AttendanceMatrix:
+    """Students x working days presence bits with vectorized queries
+
+    load() returns ([(student_id, name, department, section, enrolled_on)],
+    sorted list of working days, iterable of (day, [student_ids present])).
+    Days are 'YYYY-MM-DD' strings, so windows compare as text. version()
+    returns the calendar version (a DB read, called once per query).
+    """
+
+    def __init__(self, load, resync_seconds=300.0, version=None):
+        self.load = load
+        self.resync_seconds = resync_seconds
+        self.version = version
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._loaded_version = None
+        self._loaded_day = ''
+        self._reset()
+
+    def _reset(self, row_capacity=64, byte_capacity=8):
+        self._ids, self._names = [], []
+        self._index = {}
+        self._days, self._day_index = [], {}
+        self._bits = np.zeros((row_capacity, byte_capacity), dtype=np.uint8)
+        # Per group: labels list, label -> code, int32 code per student row
+        self._labels = {group: [] for group in GROUPS}
+        self._codes_of = {group: {} for group in GROUPS}
+        self._codes = {group: np.zeros(row_capacity, dtype=np.int32) for group in GROUPS}
+        # Column of each student's first working day on or after enrolment
+        self._first = np.zeros(row_capacity, dtype=np.int32)
+
+    # ---------- building ----------
+
+    def _rebuild(self, version=None):
+        self._loaded_day = date.today().strftime('%Y-%m-%d')
+        students, days, marks = self.load()
+        self._reset(max(64, len(students)), max(8, (len(days) + 7) // 8 * 2))
+        self._days = list(days)
+        self._day_index = {day: i for i, day in enumerate(self._days)}
+        for student in students:
+            self._add_row(*student)
+
+        dense = np.zeros((len(self._ids), len(self._days)), dtype=bool)
+        for day, student_ids in marks:
+            col = self._day_index.get(day)
+            if col is not None:
+                rows = [row for row in map(self._index.get, student_ids) if row is not None]
+                dense[rows, col] = True
+        packed = np.packbits(dense, axis=1, bitorder='little')
+        self._bits[:len(self._ids), :packed.shape[1]] = packed
+
+        self._loaded_at = time.monotonic()
+        self._loaded_version = version
+        self.rebuilds += 1
+
+    def _add_row(self, student_id, name, department, section, enrolled_on):
+        row = len(self._ids)
+        if row == self._bits.shape[0]:
+            self._bits = np.vstack([self._bits, np.zeros_like(self._bits)])
+            self._first = np.concatenate([self._first, np.zeros_like(self._first)])
+            for group in GROUPS:
+                self._codes[group] = np.concatenate([self._codes[group], np.zeros_like(self._codes[group])])
+        self._first[row] = bisect_left(self._days, enrolled_on)
+        self._ids.append(student_id)
+        self._names.append(name)
+        self._index[student_id] = row
+        for group, value in zip(GROUPS, (department, section)):
+            code = self._codes_of[group].get(value)
+            if code is None:
+                code = self._codes_of[group][value] = len(self._labels[group])
+                self._labels[group].append(value)
+            self._codes[group][row] = code
+
+    def _refresh(self):
+        """Rebuild when never loaded, invalidated, due a resync or the calendar changed (lock held)"""
+        version = self.version() if self.version is not None else None
+        if (self._loaded_at is None or version != self._loaded_version
+                or time.monotonic() - self._loaded_at > self.resync_seconds):
+            self._rebuild(version)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # ---------- updates, called after the change is committed ----------
+
+    def marked(self, day, student_ids):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            col = self._day_index.get(day)
+            if col is None:
+                # Up to the load date the calendar was read (and changes bump
+                # its version); a later day may be a working day since
+                if day > self._loaded_day:
+                    self._loaded_at = None
+                return
+            for student_id in student_ids:
+                row = self._index.get(student_id)
+                if row is not None:
+                    self._bits[row, col // 8] |= 1 << (col % 8)
+
+    def student_added(self, student_id, name, department, section, enrolled_on):
+        with self._lock:
+            if self._loaded_at is not None and student_id not in self._index:
+                self._add_row(student_id, name, department, section, enrolled_on)
+
+    def student_removed(self, student_id):
+        # Their attendance is deleted too, which can remove a working day
+        self.invalidate()
+
+    # ---------- queries ----------
+
+    def _window(self, start=None, end=None):
+        """Column range [lo, hi) of the working days between start and end, inclusive"""
+        lo = bisect_left(self._days, start) if start else 0
+        hi = bisect_right(self._days, end) if end else len(self._days)
+        return lo, max(lo, hi)
+
+    def _present(self, lo, hi, rows=slice(None)):
+        """Boolean (students, days) matrix for the day columns [lo, hi)"""
+        n = len(self._ids)
+        first = lo // 8
+        unpacked = np.unpackbits(self._bits[:n][rows, first:(hi + 7) // 8], axis=1, bitorder='little')
+        return unpacked[:, lo - first * 8:hi - first * 8].astype(bool)
+
+    def _selection(self, department=None, section=None):
+        """Row indices of the students in a department and/or section"""
+        mask = np.ones(len(self._ids), dtype=bool)
+        for group, value in zip(GROUPS, (department, section)):
+            if value:
+                code = self._codes_of[group].get(value, -1)
+                mask &= self._codes[group][:len(self._ids)] == code
+        return np.flatnonzero(mask)
+
+    def _eligible(self, lo, hi, rows=slice(None)):
+        """Working days in [lo, hi) on or after each student's enrolment"""
+        first = self._first[:len(self._ids)][rows]
+        return np.maximum(0, hi - np.maximum(lo, first))
+
+    def _describe(self, rows, present, eligible, with_streaks):
+        counts = present.sum(axis=1)
+        percent = percentages(counts, eligible)
+        if with_streaks:
+            current, longest = streaks(present)
+        students = []
+        for i, row in enumerate(rows):
+            student = {
+                'student_id': self._ids[row],
+                'name': self._names[row],
+                'department': self._labels['department'][self._codes['department'][row]],
+                'section': self._labels['section'][self._codes['section'][row]],
+                'present': int(counts[i]),
+                'eligible_days': int(eligible[i]),
+                'percentage': float(percent[i]),
+            }
+            if with_streaks:
+                student['current_streak'] = int(current[i])
+                student['longest_streak'] = int(longest[i])
+            students.append(student)
+        return students
+
+    def _period(self, lo, hi):
+        return {'start': self._days[lo] if hi > lo else None,
+                'end': self._days[hi - 1] if hi > lo else None,
+                'working_days': hi - lo}
+
+    def student(self, student_id, start=None, end=None):
+        """One student's present days, percentage and streaks; None when not enrolled"""
+        with self._lock:
+            self._refresh()
+            row = self._index.get(student_id)
+            if row is None:
+                return None
+            lo, hi = self._window(start, end)
+            rows = np.array([row])
+            return dict(self._period(lo, hi), **self._describe(
+                rows, self._present(lo, hi, rows), self._eligible(lo, hi, rows), True)[0])
+
+    def students(self, start=None, end=None, department=None, section=None, with_streaks=True):
+        """Every selected student's present days, percentage and streaks"""
+        with self._lock:
+            self._refresh()
+            lo, hi = self._window(start, end)
+            rows = self._selection(department, section)
+            return dict(self._period(lo, hi), students=self._describe(
+                rows, self._present(lo, hi, rows), self._eligible(lo, hi, rows), with_streaks))
+
+    def defaulters(self, threshold, start=None, end=None, department=None, section=None):
+        """Students below `threshold` percent, lowest first"""
+        with self._lock:
+            self._refresh()
+            lo, hi = self._window(start, end)
+            rows = self._selection(department, section)
+            present, eligible = self._present(lo, hi, rows), self._eligible(lo, hi, rows)
+            percent = percentages(present.sum(axis=1), eligible)
+            below = np.flatnonzero(percent < threshold)
+            below = below[np.argsort(percent[below], kind='stable')]
+            return dict(self._period(lo, hi), threshold=threshold,
+                        students=self._describe(rows[below], present[below], eligible[below], True))
+
+    def summary(self, group='department', start=None, end=None, threshold=75.0):
+        """Per department or section: students, average percentage, students below threshold"""
+        if group not in GROUPS:
+            raise ValueError(f"group must be one of: {', '.join(GROUPS)}")
+        with self._lock:
+            self._refresh()
+            lo, hi = self._window(start, end)
+            n = len(self._ids)
+            counts, eligible = self._present(lo, hi).sum(axis=1), self._eligible(lo, hi)
+            percent = percentages(counts, eligible)
+            codes, size = self._codes[group][:n], len(self._labels[group])
+            students = np.bincount(codes, minlength=size)
+            present = np.bincount(codes, weights=counts, minlength=size)
+            possible = np.bincount(codes, weights=eligible, minlength=size)
+            below = np.bincount(codes, weights=percent < threshold, minlength=size)
+            # Averages pool the days: total present / total eligible
+            average = percentages(present, possible)
+            groups = {}
+            for code in np.argsort(self._labels[group]):
+                if students[code]:
+                    groups[self._labels[group][code]] = {
+                        'students': int(students[code]),
+                        'average_percentage': float(average[code]),
+                        'below_threshold': int(below[code]),
+                    }
+            overall = percentages(np.array([counts.sum()]), np.array([eligible.sum()]))[0]
+            return dict(self._period(lo, hi), group=group, threshold=threshold,
+                        students=n, average_percentage=float(overall),
+                        below_threshold=int((percent < threshold).sum()), groups=groups)
@@ -17,20 +17,46 @@ Flow for Viva:
 5. View and export reports as needed
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, g, send_file
 import cv2
 import numpy as np
 import os
 import sqlite3
-import pandas as pd
-from datetime import datetime, date
-from functools import wraps
+from datetime import datetime, date, timezone
+from functools import partial, wraps
+import calendar
 import base64
+import json
+import struct
+import time
+import threading
+import io
+import csv
+import click
 import warnings
 warnings.filterwarnings('ignore')
 
 import os
 
+from db import ConnectionPool
+from migrations import migrate
+from attendance_writer import WriteBehindQueue
+from report_export import ReportCache, csv_chunks, iter_rows, write_xlsx
+from jobs import JobQueue
+from video_pipeline import Broadcaster, VideoPipeline, draw_watermark, open_source
+from lbph_model import LBPHModel
+from face_tracker import TrackingAnalyzer
+from photo_recognition import PyramidDetector
+from bulk_import import PhotoSet, import_students, read_roster
+from face_engine import create_engine
+from today_stats import TodayStats
+from analytics import AttendanceMatrix
+from student_stats import StudentStatsCache, refresh_eligible_days
+from event_bus import EventBus
+from face_matcher import FaceGallery, summarize_samples
+from descriptor_codec import (DESCRIPTOR_SIZE, LEGACY_CROP_SIZE, encode_descriptors, decode_descriptor,
+                              decode_descriptors, decode_legacy, is_packed)
+
 app = Flask(__name__)
 
 # Use environment variables with fallbacks
@@ -39,6 +65,126 @@ app.secret_key = os.environ.get('SECRET_KEY', 'smart_attendance_system_secret_ke
 # Configuration
 DATABASE = os.environ.get('DATABASE_PATH', 'attendance.db')
 UPLOAD_FOLDER = 'static/student_images'
+RECOGNITION_THRESHOLD = float(os.environ.get('RECOGNITION_THRESHOLD', 0.6))
+
+# Descriptor index: 'flat' (exact) or 'ivf' (approximate, for very large galleries).
+# Higher DESCRIPTOR_INDEX_NPROBE = better recall, slower lookups.
+DESCRIPTOR_INDEX = os.environ.get('DESCRIPTOR_INDEX', 'flat')
+DESCRIPTOR_INDEX_PATH = os.environ.get(
+    'DESCRIPTOR_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(DATABASE)), 'descriptor_index.npz'))
+DESCRIPTOR_INDEX_OPTIONS = {}
+if DESCRIPTOR_INDEX == 'ivf':
+    DESCRIPTOR_INDEX_OPTIONS = {
+        'nlist': int(os.environ.get('DESCRIPTOR_INDEX_NLIST', 0)),
+        'nprobe': int(os.environ.get('DESCRIPTOR_INDEX_NPROBE', 8)),
+    }
+
+# SQLite connection pool (per process): size and lock wait in milliseconds
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+
+# Enrolment keeps several descriptor samples per student. Matching uses either
+# the per-student centroid ('centroid') or the k nearest samples ('kbest').
+MATCH_MODE = os.environ.get('MATCH_MODE', 'centroid')
+MATCH_K = int(os.environ.get('MATCH_K', 3))
+MAX_DESCRIPTOR_SAMPLES = int(os.environ.get('MAX_DESCRIPTOR_SAMPLES', 10))
+DESCRIPTOR_OUTLIER_DISTANCE = float(os.environ.get('DESCRIPTOR_OUTLIER_DISTANCE', 0.4))
+
+# Attendance marks arriving within this window share one commit (0 = commit
+# each mark on its own). Batched marks may carry a client timestamp; those
+# outside the accepted clock skew / age are rejected per item.
+ATTENDANCE_WRITE_WINDOW_MS = int(os.environ.get('ATTENDANCE_WRITE_WINDOW_MS', 20))
+ATTENDANCE_BATCH_LIMIT = int(os.environ.get('ATTENDANCE_BATCH_LIMIT', 500))
+ATTENDANCE_CLOCK_SKEW_SECONDS = int(os.environ.get('ATTENDANCE_CLOCK_SKEW_SECONDS', 300))
+ATTENDANCE_MAX_MARK_AGE_HOURS = float(os.environ.get('ATTENDANCE_MAX_MARK_AGE_HOURS', 12))
+
+# Report exports run as background jobs; finished files are cached here
+# (outside static/) and reused while the period's attendance is unchanged
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+REPORT_CACHE_DIR = os.environ.get(
+    'REPORT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(DATABASE)), 'report_cache'))
+REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', 200))
+
+# Live video feed: VIDEO_SOURCE is a camera index, a video file path or
+# 'synthetic'; VIDEO_WORKERS threads run face detection/recognition
+VIDEO_SOURCE = os.environ.get('VIDEO_SOURCE', '0')
+VIDEO_WORKERS = int(os.environ.get('VIDEO_WORKERS', 2))
+VIDEO_JPEG_QUALITY = int(os.environ.get('VIDEO_JPEG_QUALITY', 80))
+VIDEO_IDLE_SECONDS = float(os.environ.get('VIDEO_IDLE_SECONDS', 5))
+
+# Faces are followed between detection passes: 'mosse'/'kcf' track without
+# detecting for VIDEO_DETECT_INTERVAL seconds, 'iou' detects every frame but
+# only recognizes new faces, 'off' re-detects and re-recognizes everything
+VIDEO_TRACKER = os.environ.get('VIDEO_TRACKER', 'mosse')
+VIDEO_DETECT_INTERVAL = float(os.environ.get('VIDEO_DETECT_INTERVAL', 1.0))
+
+# Trained LBPH model for the video feed, and how often a running stream
+# checks for students registered/deleted by other worker processes
+LBPH_MODEL_PATH = os.environ.get(
+    'LBPH_MODEL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(DATABASE)), 'lbph_model.yml.gz'))
+LBPH_SYNC_SECONDS = float(os.environ.get('LBPH_SYNC_SECONDS', 30))
+
+# Group photo recognition (POST /api/attendance/photo): detection threads,
+# smallest face searched (pixels), and the longest side photos are scaled to
+PHOTO_WORKERS = int(os.environ.get('PHOTO_WORKERS', min(4, os.cpu_count() or 1)))
+PHOTO_MIN_FACE = int(os.environ.get('PHOTO_MIN_FACE', 24))
+PHOTO_MAX_SIDE = int(os.environ.get('PHOTO_MAX_SIDE', 2048))
+PHOTO_MAX_FILES = int(os.environ.get('PHOTO_MAX_FILES', 10))
+
+# Server-side face engine for group photos and bulk enrolment: 'haar' or
+# 'dnn' with local model files (YuNet .onnx or SSD .caffemodel + prototxt),
+# plus an optional 128-d embedder model (face-api.js compatibility unverified,
+# see face_engine.py)
+FACE_ENGINE = os.environ.get('FACE_ENGINE', 'haar')
+FACE_DETECTOR_MODEL = os.environ.get('FACE_DETECTOR_MODEL')
+FACE_DETECTOR_CONFIG = os.environ.get('FACE_DETECTOR_CONFIG')
+FACE_EMBEDDER_MODEL = os.environ.get('FACE_EMBEDDER_MODEL')
+FACE_EMBEDDER_CONFIG = os.environ.get('FACE_EMBEDDER_CONFIG')
+FACE_ENGINE_INPUT_SIZE = int(os.environ.get('FACE_ENGINE_INPUT_SIZE', 320))
+FACE_EMBEDDER_INPUT_SIZE = int(os.environ.get('FACE_EMBEDDER_INPUT_SIZE', 150))
+FACE_DETECTOR_SCORE = float(os.environ.get('FACE_DETECTOR_SCORE', 0.6))
+FACE_ENGINE_THREADS = int(os.environ.get('FACE_ENGINE_THREADS', 0))
+# Whether to match photo faces on embedder descriptors, against the gallery
+# of browser (face-api.js) descriptors. Off until an operator has checked the
+# two are comparable; LBPH recognizes photos meanwhile
+FACE_EMBEDDER_MATCHING = os.environ.get('FACE_EMBEDDER_MATCHING', '0') == '1'
+FACE_EMBEDDER_THRESHOLD = float(os.environ.get('FACE_EMBEDDER_THRESHOLD', RECOGNITION_THRESHOLD))
+
+# Bulk enrolment (POST /api/students/bulk, `flask import-students`): face
+# processing processes and rows committed per transaction
+BULK_IMPORT_WORKERS = int(os.environ.get('BULK_IMPORT_WORKERS', os.cpu_count() or 1))
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', 200))
+
+# Today's dashboard counters are kept in memory and rebuilt from the
+# database this often (picks up marks made by other worker processes)
+STATS_RESYNC_SECONDS = float(os.environ.get('STATS_RESYNC_SECONDS', 60))
+
+# Attendance analytics (see analytics.py): how often each worker rebuilds
+# its student x day matrix, and the default defaulter cut-off in percent
+ANALYTICS_RESYNC_SECONDS = float(os.environ.get('ANALYTICS_RESYNC_SECONDS', 300))
+ATTENDANCE_THRESHOLD = float(os.environ.get('ATTENDANCE_THRESHOLD', 75))
+
+# Student dashboard: student_stats rows cached per worker (see student_stats.py)
+STUDENT_STATS_CACHE_SIZE = int(os.environ.get('STUDENT_STATS_CACHE_SIZE', 4096))
+STUDENT_STATS_CACHE_SECONDS = float(os.environ.get('STUDENT_STATS_CACHE_SECONDS', 60))
+
+# Live attendance push (GET /api/attendance/stream): events kept for
+# Last-Event-ID resume, idle keep-alive interval, and how long one
+# connection lasts before the browser reconnects (frees the thread)
+ATTENDANCE_STREAM_HISTORY = int(os.environ.get('ATTENDANCE_STREAM_HISTORY', 1000))
+ATTENDANCE_STREAM_HEARTBEAT = float(os.environ.get('ATTENDANCE_STREAM_HEARTBEAT', 15))
+ATTENDANCE_STREAM_MAX_SECONDS = float(os.environ.get('ATTENDANCE_STREAM_MAX_SECONDS', 300))
+# How often each worker looks for marks committed by other processes
+ATTENDANCE_STREAM_POLL_SECONDS = float(os.environ.get('ATTENDANCE_STREAM_POLL_SECONDS', 1))
+
+# Attendance browser (view_attendance, GET /api/attendance): rows per page,
+# and the most rows counted exactly when no rollup can answer the count
+ATTENDANCE_PAGE_SIZE = int(os.environ.get('ATTENDANCE_PAGE_SIZE', 50))
+ATTENDANCE_PAGE_SIZE_MAX = int(os.environ.get('ATTENDANCE_PAGE_SIZE_MAX', 500))
+ATTENDANCE_COUNT_CAP = int(os.environ.get('ATTENDANCE_COUNT_CAP', 10000))
 
 # Render environment
 RENDER = os.environ.get('RENDER', False)
@@ -48,6 +194,37 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
 face_cascade = cv2.CascadeClassifier(cascade_path)
 
+# Detector/embedder backend (see face_engine.py); the settings are plain
+# values so bulk import worker processes can build their own copy
+FACE_ENGINE_SETTINGS = {
+    'backend': FACE_ENGINE,
+    'cascade_path': cascade_path,
+    'detector_model': FACE_DETECTOR_MODEL,
+    'detector_config': FACE_DETECTOR_CONFIG,
+    'embedder_model': FACE_EMBEDDER_MODEL,
+    'embedder_config': FACE_EMBEDDER_CONFIG,
+    'input_size': FACE_ENGINE_INPUT_SIZE,
+    'embedder_input_size': FACE_EMBEDDER_INPUT_SIZE,
+    'score_threshold': FACE_DETECTOR_SCORE,
+    'threads': FACE_ENGINE_THREADS,
+    'descriptor_size': DESCRIPTOR_SIZE,
+}
+try:
+    face_engine = create_engine(**FACE_ENGINE_SETTINGS)
+except (ValueError, cv2.error) as e:
+    print(f"⚠️ Face engine '{FACE_ENGINE}' unavailable ({e}), falling back to the Haar cascade")
+    FACE_ENGINE_SETTINGS.update(backend='haar', embedder_model=None)
+    face_engine = create_engine(**FACE_ENGINE_SETTINGS)
+
+embedder_matching = FACE_EMBEDDER_MATCHING and face_engine.can_embed
+if face_engine.can_embed and not embedder_matching:
+    print("⚠️ Face embedder loaded but FACE_EMBEDDER_MATCHING is off: photos are recognized with LBPH")
+
+def crop_face(gray, box):
+    """100x100 grayscale face crop, the format stored for LBPH"""
+    x, y, w, h = box[:4]
+    return cv2.resize(gray[y:y+h, x:x+w], (100, 100))
+
 # Initialize database
 def init_db():
     """Initialize database tables"""
@@ -100,15 +277,329 @@ def init_db():
                        ('admin', 'admin123', 'Administrator', 'admin'))
         conn.commit()
     except sqlite3.IntegrityError:
-        pass
+        conn.rollback()
+    
+    # Bring older databases up to the current schema (see migrations.py)
+    migrate(conn)
     
     conn.close()
 
-# Database connection helper
+# Database connection helpers: one pooled connection per request/app context,
+# returned to the pool at teardown. Code outside a request (streaming
+# generators, background threads) uses `with db_pool.connection() as conn`.
+db_pool = ConnectionPool(DATABASE, max_size=DB_POOL_SIZE, busy_timeout_ms=DB_BUSY_TIMEOUT_MS)
+
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Return this request's pooled connection (do not close it)"""
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+# Create/upgrade tables on import too: gunicorn never runs the __main__ block
+init_db()
+
+# ==================== FACE GALLERY ====================
+
+# Face descriptor gallery for server-side matching (built lazily from the DB)
+face_gallery = FaceGallery(DESCRIPTOR_INDEX, DESCRIPTOR_INDEX_PATH, match_mode=MATCH_MODE,
+                           k_best=MATCH_K, **DESCRIPTOR_INDEX_OPTIONS)
+
+def get_gallery_state(conn):
+    """Return (version, last_modified datetime) of the descriptor gallery"""
+    row = conn.execute('SELECT version, updated_at FROM gallery_state WHERE id = 1').fetchone()
+    return row['version'], datetime.fromisoformat(row['updated_at'])
+
+def bump_gallery_version(conn):
+    """Increment the gallery version inside the caller's transaction"""
+    return conn.execute('''
+        UPDATE gallery_state SET version = version + 1, updated_at = ? WHERE id = 1
+        RETURNING version
+    ''', (datetime.now(timezone.utc).isoformat(timespec='seconds'),)).fetchone()[0]
+
+def write_student_samples(conn, student_id, samples, centroid):
+    """Replace a student's enrolment samples and centroid inside the caller's transaction"""
+    gallery_version = bump_gallery_version(conn)
+    conn.execute('DELETE FROM face_descriptors WHERE student_id = ?', (student_id,))
+    conn.executemany('INSERT INTO face_descriptors (student_id, descriptor) VALUES (?, ?)',
+                     [(student_id, encode_descriptors(sample)) for sample in samples])
+    conn.execute('UPDATE students SET encoding_data = ?, descriptor_version = ? WHERE student_id = ?',
+                 (encode_descriptors(centroid), gallery_version, student_id))
+    conn.execute('DELETE FROM descriptor_tombstones WHERE student_id = ?', (student_id,))
+    return gallery_version
+
+def fetch_student_samples(conn, since=None):
+    """Return {student_id: (n, 128) samples} for students changed after `since`"""
+    if since is None:
+        rows = conn.execute('SELECT student_id, descriptor FROM face_descriptors ORDER BY student_id, id')
+    else:
+        rows = conn.execute('''
+            SELECT student_id, descriptor FROM face_descriptors
+            WHERE student_id IN (SELECT student_id FROM students WHERE descriptor_version > ?)
+            ORDER BY student_id, id
+        ''', (since,))
+    samples = {}
+    for row in rows:
+        samples.setdefault(row['student_id'], []).append(decode_descriptors(row['descriptor']))
+    return {student_id: np.concatenate(blocks) for student_id, blocks in samples.items()}
+
+def fetch_gallery_changes(conn, since=None, with_samples=False):
+    """Return ([(student_id, name, descriptor, samples)], [deleted ids]) changed after `since`
+
+    since=None returns the full gallery with no deletions. samples is None
+    unless with_samples is set (and for students enrolled with one capture).
+    """
+    if since is None:
+        students = conn.execute(
+            'SELECT student_id, name, encoding_data FROM students WHERE encoding_data IS NOT NULL'
+        ).fetchall()
+        deleted = []
+    else:
+        students = conn.execute('''
+            SELECT student_id, name, encoding_data FROM students
+            WHERE descriptor_version > ? AND encoding_data IS NOT NULL
+        ''', (since,)).fetchall()
+        deleted = [row['student_id'] for row in conn.execute(
+            'SELECT student_id FROM descriptor_tombstones WHERE version > ?', (since,))]
+    
+    samples = fetch_student_samples(conn, since) if with_samples else {}
+    upserts = []
+    for student in students:
+        descriptor = decode_descriptor(student['encoding_data'])
+        if descriptor is not None and len(descriptor) == DESCRIPTOR_SIZE:
+            upserts.append((student['student_id'], student['name'], descriptor,
+                            samples.get(student['student_id'])))
+    return upserts, deleted
+
+def get_face_gallery():
+    """Return the descriptor gallery, synced with the students table
+
+    Costs one primary-key lookup when nothing changed; other workers'
+    edits are applied as a delta via the gallery version counter.
+    """
+    conn = get_db_connection()
+    version, _ = get_gallery_state(conn)
+    
+    if not face_gallery.loaded:
+        names = conn.execute(
+            'SELECT student_id, name FROM students WHERE encoding_data IS NOT NULL'
+        ).fetchall()
+        if face_gallery.load_saved({row['student_id']: row['name'] for row in names}, version):
+            print(f"✓ Face gallery loaded from {DESCRIPTOR_INDEX_PATH} ({len(face_gallery)} descriptors)")
+        else:
+            upserts, _ = fetch_gallery_changes(conn, with_samples=MATCH_MODE == 'kbest')
+            face_gallery.load(upserts, version)
+            print(f"✓ Face gallery loaded with {len(face_gallery)} descriptors")
+    elif face_gallery.version != version:
+        upserts, deleted = fetch_gallery_changes(conn, face_gallery.version,
+                                                 with_samples=MATCH_MODE == 'kbest')
+        face_gallery.apply_changes(upserts, deleted, version)
+    
+    return face_gallery
+
+# ==================== TODAY'S COUNTERS ====================
+
+def load_today_stats(day):
+    """Students with their (department, section), who is present on `day` and the newest attendance id"""
+    with db_pool.connection() as conn:
+        students = {row['student_id']: (row['department'], row['section'])
+                    for row in conn.execute('SELECT student_id, department, section FROM students')}
+        # One statement, one snapshot: the id covers exactly these marks
+        last_id, present = conn.execute("""
+            SELECT (SELECT COALESCE(MAX(id), 0) FROM attendance), group_concat(student_id, char(10))
+            FROM attendance WHERE date = ?
+        """, (day,)).fetchone()
+    return students, set(present.split('\n')) if present else set(), last_id
+
+# Polled by the dashboard and attendance page; updated by the write paths below
+today_stats = TodayStats(load_today_stats, resync_seconds=STATS_RESYNC_SECONDS)
+
+# ==================== ATTENDANCE ANALYTICS ====================
+
+def get_calendar_version():
+    """Version of the working-day calendar, bumped by triggers on every change"""
+    with db_pool.connection() as conn:
+        return conn.execute('SELECT version FROM calendar_state WHERE id = 1').fetchone()[0]
+
+def load_attendance_matrix():
+    """Students, working days so far and who was present on each day, from the rollups"""
+    today = date.today().strftime('%Y-%m-%d')
+    with db_pool.connection() as conn:
+        students = [tuple(row) for row in conn.execute('''
+            SELECT s.student_id, s.name, s.department, s.section, COALESCE(st.enrolled_on, '')
+            FROM students s LEFT JOIN student_stats st ON st.student_id = s.student_id
+            ORDER BY s.id
+        ''')]
+        days = [row[0] for row in conn.execute(
+            'SELECT date FROM working_days WHERE date <= ? ORDER BY date', (today,))]
+        # One row per day keeps a year of marks to a few hundred fetched rows
+        marks = [(day, student_ids.split('\n')) for day, student_ids in conn.execute("""
+            SELECT date, group_concat(student_id, char(10)) FROM attendance_daily_summary
+            WHERE present > 0 GROUP BY date
+        """)]
+    return students, days, marks
+
+# Percentages, streaks and defaulters; updated by the write paths below
+attendance_matrix = AttendanceMatrix(load_attendance_matrix, resync_seconds=ANALYTICS_RESYNC_SECONDS,
+                                     version=get_calendar_version)
+
+# ==================== STUDENT STATS ====================
+
+def load_student_stats(student_id, today):
+    """A student's student_stats row as a dict, eligible days counted up to `today`"""
+    with db_pool.connection() as conn:
+        row = conn.execute('SELECT * FROM student_stats WHERE student_id = ?', (student_id,)).fetchone()
+        if row is not None and row['eligible_as_of'] != today:
+            # First read of the day (or after a calendar change): one
+            # UPDATE brings every stale row up to date
+            refresh_eligible_days(conn, today)
+            conn.commit()
+            row = conn.execute('SELECT * FROM student_stats WHERE student_id = ?', (student_id,)).fetchone()
+    if row is None:
+        return None
+    stats = dict(row)
+    stats['recent'] = json.loads(row['recent'])
+    # Marks dated after today count before their day is eligible, so cap at 100
+    stats['percentage'] = (min(100.0, round(row['present_days'] / row['eligible_days'] * 100, 2))
+                           if row['eligible_days'] > 0 else 0.0)
+    return stats
+
+# Read by the student dashboard; marks and deletions below invalidate entries
+student_stats_cache = StudentStatsCache(load_student_stats, max_entries=STUDENT_STATS_CACHE_SIZE,
+                                        ttl_seconds=STUDENT_STATS_CACHE_SECONDS,
+                                        version=get_calendar_version)
+
+# ==================== ATTENDANCE MARKING ====================
+
+def fetch_attendance_events(conn, after_id, limit):
+    """Attendance rows after `after_id` as 'mark' events (see event_bus.py)"""
+    if after_id is None:
+        rows = conn.execute('SELECT * FROM attendance ORDER BY id DESC LIMIT 1').fetchall()
+    else:
+        rows = conn.execute('SELECT * FROM attendance WHERE id > ? ORDER BY id LIMIT ?',
+                            (after_id, limit)).fetchall()
+    return [(row['id'], 'mark', {'student_id': row['student_id'], 'name': row['name'],
+                                 'department': row['department'], 'date': row['date'], 'time': row['time']})
+            for row in rows]
+
+def attendance_marked(events):
+    """Keep the in-memory counters in step with marks committed by any process"""
+    today_stats.marked([(event_id, data['date'], data['student_id']) for event_id, _, data in events])
+    marked = {}
+    for _, _, data in events:
+        marked.setdefault(data['date'], []).append(data['student_id'])
+    for day, student_ids in marked.items():
+        attendance_matrix.marked(day, student_ids)
+        student_stats_cache.invalidate(student_ids)
+
+# Every committed mark, from any worker, is pushed to /api/attendance/stream
+# subscribers and to the counters above
+attendance_events = EventBus(fetch_attendance_events, db_pool.connection, history=ATTENDANCE_STREAM_HISTORY,
+                             poll_seconds=ATTENDANCE_STREAM_POLL_SECONDS, on_events=attendance_marked)
+attendance_events.start()
+
+def mark_attendance_rows(conn, marks):
+    """Mark (student_id, date, time) tuples in one transaction
+
+    Returns one result dict per mark, in order, with status 'success',
+    'already_marked' or 'not_found'. A student listed twice for the same
+    day is marked once; the repeat reports already_marked.
+    """
+    results = []
+    try:
+        for student_id, day, mark_time in marks:
+            # Copies name/department from students; a no-op when the
+            # UNIQUE(student_id, date) index already has a row
+            marked = conn.execute('''
+                INSERT INTO attendance (student_id, name, department, date, time, status)
+                SELECT student_id, name, department, ?, ?, 'Present' FROM students WHERE student_id = ?
+                ON CONFLICT(student_id, date) DO NOTHING
+                RETURNING student_id, name, time
+            ''', (day, mark_time, student_id)).fetchall()
+            if marked:
+                results.append({'student_id': student_id, 'status': 'success', 'date': day,
+                                'name': marked[0]['name'], 'time': marked[0]['time']})
+            else:
+                results.append(None)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    # Nothing inserted: either already marked that day or an unknown student
+    for i, (student_id, day, _) in enumerate(marks):
+        if results[i] is not None:
+            continue
+        existing = conn.execute(
+            'SELECT name, time FROM attendance WHERE student_id = ? AND date = ?',
+            (student_id, day)
+        ).fetchone()
+        if existing:
+            results[i] = {'student_id': student_id, 'status': 'already_marked', 'date': day,
+                          'name': existing['name'], 'time': existing['time']}
+        else:
+            results[i] = {'student_id': student_id, 'status': 'not_found', 'date': day}
+    
+    # Committed: update the counters and stream subscribers now rather
+    # than at the next background poll
+    if any(result['status'] == 'success' for result in results):
+        try:
+            attendance_events.poll(conn)
+        except Exception as e:
+            print(f"⚠️ Attendance event poll failed: {e}")
+    return results
+
+def write_attendance_marks(marks):
+    """Write-behind handler: one pooled connection and one commit per batch"""
+    with db_pool.connection() as conn:
+        results = mark_attendance_rows(conn, marks)
+    if len(marks) > 1:
+        print(f"✓ Wrote {len(marks)} attendance marks in one transaction")
+    return results
+
+# Single /mark_attendance calls are queued here and committed together
+attendance_writer = WriteBehindQueue(write_attendance_marks,
+                                     window=ATTENDANCE_WRITE_WINDOW_MS / 1000)
+
+def mark_attendance(student_id, day, mark_time):
+    """Mark one student, through the write-behind queue when it is enabled"""
+    if ATTENDANCE_WRITE_WINDOW_MS <= 0:
+        return mark_attendance_rows(get_db_connection(), [(student_id, day, mark_time)])[0]
+    return attendance_writer.submit((student_id, day, mark_time)).result(timeout=30)
+
+def resolve_mark_time(timestamp, now):
+    """Return (date, time) strings for a client timestamp, or raise ValueError
+
+    Accepts epoch milliseconds (JavaScript Date.now()) or an ISO 8601 string;
+    None means "now". Aware timestamps are converted to server local time.
+    """
+    try:
+        if timestamp is None:
+            moment = now
+        elif isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+            moment = datetime.fromtimestamp(timestamp / 1000)
+        elif isinstance(timestamp, str):
+            moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            if moment.tzinfo is not None:
+                moment = moment.astimezone().replace(tzinfo=None)
+        else:
+            raise ValueError('Invalid timestamp')
+    except (OverflowError, OSError) as e:
+        # Out of the platform's range (1e20, inf, year 1 in a far time zone)
+        raise ValueError('Invalid timestamp') from e
+    
+    age = (now - moment).total_seconds()
+    if age < -ATTENDANCE_CLOCK_SKEW_SECONDS:
+        raise ValueError('Timestamp is in the future')
+    if age > ATTENDANCE_MAX_MARK_AGE_HOURS * 3600:
+        raise ValueError('Timestamp is too old')
+    moment = min(moment, now)
+    return moment.strftime('%Y-%m-%d'), moment.strftime('%H:%M:%S')
 
 # Login required decorator
 def login_required(f):
@@ -140,7 +631,6 @@ def login():
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM users WHERE username = ? AND password = ?',
                           (username, password)).fetchone()
-        conn.close()
         
         if user:
             session['user_id'] = user['id']
@@ -165,17 +655,9 @@ def logout():
 @login_required
 def dashboard():
     """Admin Dashboard with statistics"""
-    conn = get_db_connection()
-    
-    # Get total students
-    total_students = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
-    
-    # Get today's date and attendance
-    today = date.today().strftime('%Y-%m-%d')
-    today_present = conn.execute(
-        'SELECT COUNT(DISTINCT student_id) FROM attendance WHERE date = ?',
-        (today,)
-    ).fetchone()[0]
+    # Today's totals from the in-memory counters; the marks after the last
+    # event they include are pushed to the page
+    today, total_students, today_present, last_event_id = today_stats.totals()
     
     # Calculate absent (total students - present today)
     today_absent = total_students - today_present
@@ -183,17 +665,23 @@ def dashboard():
     # Get current date and time
     current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    conn.close()
-    
     return render_template('dashboard.html',
                            total_students=total_students,
                            today_present=today_present,
                            today_absent=today_absent,
+                           today=today,
+                           last_event_id=last_event_id,
                            current_datetime=current_datetime,
                            user_name=session['name'])
 
 # ==================== STUDENT REGISTRATION ROUTES ====================
 
+def is_descriptor(value):
+    """True for a JSON list of DESCRIPTOR_SIZE finite numbers"""
+    return (isinstance(value, list) and len(value) == DESCRIPTOR_SIZE and
+            all(isinstance(x, (int, float)) and not isinstance(x, bool) and np.isfinite(x)
+                for x in value))
+
 @app.route('/register', methods=['GET', 'POST'])
 @login_required
 def register_student():
@@ -215,6 +703,7 @@ def register_student():
             year = data.get('year')
             section = data.get('section')
             encoding = data.get('encoding')  # Array of 128 floats from face-api.js
+            encodings = data.get('encodings')  # Optional burst of captures
             image_data = data.get('image_data')  # Fallback to base64 image
         else:
             # Handle form data (legacy)
@@ -225,6 +714,15 @@ def register_student():
             section = request.form['section']
             image_data = request.form.get('image_data')
             encoding = None
+            encodings = None
+        
+        # Several captures are pruned of outliers and averaged into one centroid
+        samples = encodings or ([encoding] if encoding else [])
+        if not isinstance(samples, list):
+            samples = [samples]
+        summary = None
+        if samples and all(is_descriptor(sample) for sample in samples):
+            summary = summarize_samples(samples, DESCRIPTOR_OUTLIER_DISTANCE, MAX_DESCRIPTOR_SAMPLES)
         
         conn = get_db_connection()
         
@@ -233,8 +731,12 @@ def register_student():
         
         if existing:
             message = {'type': 'error', 'text': 'Student with this ID already exists!'}
-        elif not encoding and not image_data:
+        elif not samples and not image_data:
             message = {'type': 'error', 'text': 'Please capture face image!'}
+        elif samples and summary is None:
+            message = {'type': 'error', 'text': f'Face descriptor must have {DESCRIPTOR_SIZE} values!'}
+        elif summary and summary[1] is None:
+            message = {'type': 'error', 'text': 'Face captures are inconsistent, please capture again!'}
         else:
             # Save image if base64 data provided
             image_path = None
@@ -248,13 +750,9 @@ def register_student():
                 except Exception as e:
                     print(f"Error saving image: {e}")
             
-            # Store face encoding as JSON (from face-api.js)
-            encoding_data = None
-            if encoding:
-                import json
-                encoding_data = json.dumps(encoding)
-                print(f"✓ Stored face descriptor with {len(encoding)} values for {student_id}")
-            elif image_data:
+            # Face descriptors (from face-api.js) are stored after the insert
+            face_crop = None
+            if not samples and image_data:
                 # Fallback: Create encoding from image using OpenCV
                 try:
                     full_path = os.path.join('static', image_path)
@@ -263,54 +761,117 @@ def register_student():
                         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
                         faces = face_cascade.detectMultiScale(gray, 1.3, 5)
                         if len(faces) > 0:
-                            x, y, w, h = faces[0]
-                            face_roi = gray[y:y+h, x:x+w]
-                            face_roi = cv2.resize(face_roi, (100, 100))
-                            encoding_data = face_roi.tobytes()
+                            face_crop = crop_face(gray, faces[0]).tobytes()
                 except Exception as e:
                     print(f"Error creating encoding: {e}")
             
             # Insert into database
-            conn.execute('''
-                INSERT INTO students (student_id, name, department, year, section, image_path, encoding_data)
+            label = conn.execute('''
+                INSERT INTO students (student_id, name, department, year, section, image_path, face_crop)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (student_id, name, department, year, section, image_path, encoding_data))
+            ''', (student_id, name, department, year, section, image_path, face_crop)).lastrowid
+            if summary:
+                kept, centroid, pruned = summary
+                gallery_version = write_student_samples(conn, student_id, kept, centroid)
+                print(f"✓ Stored {len(kept)} face descriptor samples for {student_id} ({pruned} pruned)")
             conn.commit()
+            if summary:
+                face_gallery.upsert(student_id, name, centroid, gallery_version, samples=kept)
+            today_stats.student_added(student_id, department, section)
+            attendance_matrix.student_added(student_id, name, department, section,
+                                            date.today().strftime('%Y-%m-%d'))
+            if face_crop:
+                lbph_model.add(label, {'id': student_id, 'name': name, 'department': department},
+                               np.frombuffer(face_crop, np.uint8).reshape((100, 100)))
             message = {'type': 'success', 'text': f'Student {name} registered successfully!'}
             print(f"✓ Student {student_id} ({name}) registered successfully")
         
-        conn.close()
-        
         # Return JSON for AJAX requests
         if is_json_request:
             return jsonify(message)
     
     return render_template('register.html', message=message)
 
+# ==================== BULK ENROLMENT ====================
+
+def bulk_import_batch(students):
+    """Add a committed bulk import batch to the LBPH model and the descriptor gallery"""
+    lbph_model.add_many([(student['label'], {'id': student['student_id'], 'name': student['name'],
+                                             'department': student['department']}, student['crop'])
+                         for student in students])
+    for student in students:
+        today_stats.student_added(student['student_id'], student['department'], student['section'])
+        attendance_matrix.student_added(student['student_id'], student['name'], student['department'],
+                                        student['section'], date.today().strftime('%Y-%m-%d'))
+        if student['descriptor'] is not None:
+            face_gallery.upsert(student['student_id'], student['name'], student['descriptor'],
+                                student['gallery_version'], samples=student['descriptor'][None])
+
+def run_bulk_import(roster_stream, photo_source):
+    """Import a roster CSV and its photos (see bulk_import.py); returns (report, counts)"""
+    roster = read_roster(roster_stream)
+    photos = PhotoSet(photo_source)
+    # Embedder descriptors join the kiosks' face-api.js gallery only once
+    # the two are known to be comparable (FACE_EMBEDDER_MATCHING)
+    engine_settings, write_samples = FACE_ENGINE_SETTINGS, write_student_samples
+    if not embedder_matching:
+        engine_settings, write_samples = dict(FACE_ENGINE_SETTINGS, embedder_model=None), None
+    try:
+        with db_pool.connection() as conn:
+            report = import_students(conn, roster, photos, UPLOAD_FOLDER, engine_settings,
+                                     workers=BULK_IMPORT_WORKERS, batch_size=BULK_IMPORT_BATCH_SIZE,
+                                     write_samples=write_samples, on_batch=bulk_import_batch)
+    finally:
+        photos.close()
+    counts = {'imported': 0, 'exists': 0, 'error': 0}
+    for entry in report:
+        counts[entry['status']] += 1
+    print(f"✅ Bulk import: {counts['imported']} imported, {counts['exists']} already enrolled, "
+          f"{counts['error']} errors")
+    return report, counts
+
+@app.route('/api/students/bulk', methods=['POST'])
+@login_required
+def bulk_import_students():
+    """Enrol students from a roster CSV ('roster') and a zip of photos ('photos')
+
+    Safe to repeat: students already enrolled are reported as 'exists'.
+    """
+    roster_file = request.files.get('roster')
+    photos_file = request.files.get('photos')
+    if not roster_file or not photos_file:
+        return jsonify({'status': 'error', 'message': 'Please upload a roster CSV and a zip of photos'})
+    
+    try:
+        report, counts = run_bulk_import(io.TextIOWrapper(roster_file.stream, encoding='utf-8-sig'),
+                                         photos_file.stream)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    except Exception as e:
+        print(f"❌ Error in bulk import: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+    
+    return jsonify({'status': 'success', **counts, 'report': report})
+
 # ==================== ATTENDANCE ROUTES ====================
 
 @app.route('/attendance')
 @login_required
 def attendance():
     """Take attendance page"""
-    return render_template('attendance.html')
+    return render_template('attendance.html', recognition_threshold=RECOGNITION_THRESHOLD)
 
 @app.route('/get_attendance_status')
 @login_required
 def get_attendance_status():
     """Get current attendance status for today"""
     conn = get_db_connection()
-    today = date.today().strftime('%Y-%m-%d')
-    
-    # Get total students count
-    total_students = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+    today, total_students, _, _ = today_stats.totals()
     
     present_students = conn.execute('''
         SELECT * FROM attendance WHERE date = ? ORDER BY time DESC
     ''', (today,)).fetchall()
     
-    conn.close()
-    
     return jsonify({
         'date': today,
         'total_students': total_students,
@@ -318,336 +879,757 @@ def get_attendance_status():
         'students': [dict(row) for row in present_students]
     })
 
-# Global variables for camera control
-camera = None
-is_camera_running = False
+# ==================== LIVE VIDEO PIPELINE ====================
 
-def generate_frames():
-    """Generate frames for video streaming with face detection"""
-    global camera, is_camera_running
-    
-    if camera is None:
-        camera = cv2.VideoCapture(0)
-        camera.set(3, 640)
-        camera.set(4, 480)
-    
-    is_camera_running = True
-    
-    # Load registered students
-    conn = get_db_connection()
-    students = conn.execute('SELECT student_id, name, image_path, encoding_data FROM students').fetchall()
-    conn.close()
-    
-    # Create a simple face matching system using LBPH
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    
-    # Train recognizer with registered faces
-    train_images = []
-    train_labels = []
-    label_to_student = {}
-    
-    for idx, student in enumerate(students):
-        if student['encoding_data']:
-            nparr = np.frombuffer(student['encoding_data'], np.uint8)
-            face_img = nparr.reshape((100, 100))
-            train_images.append(face_img)
-            train_labels.append(idx)
-            label_to_student[idx] = {'name': student['name'], 'id': student['student_id']}
-    
-    if train_images:
-        recognizer.train(train_images, np.array(train_labels))
-    
-    marked_today = set()
-    today = date.today().strftime('%Y-%m-%d')
-    
-    # Load already marked attendance for today
-    conn = get_db_connection()
-    marked = conn.execute('SELECT student_id FROM attendance WHERE date = ?', (today,)).fetchall()
-    conn.close()
-    for m in marked:
-        marked_today.add(m['student_id'])
-    
-    frame_count = 0
-    process_every_n_frames = 3
+# Students with an LBPH training crop: the face_crop column, or a legacy
+# 100x100 crop still in encoding_data (before `flask migrate-descriptors`)
+HAS_FACE_CROP_SQL = f'(face_crop IS NOT NULL OR length(encoding_data) = {LEGACY_CROP_SIZE})'
+
+def load_face_crops(labels=None):
+    """Yield (label, info, crop) for LBPH training; the label is students.id"""
+    query = f'SELECT id, student_id, name, department, encoding_data, face_crop FROM students WHERE {HAS_FACE_CROP_SQL}'
+    params = ()
+    if labels is not None:
+        labels = sorted(labels)
+        query += f" AND id IN ({','.join('?' * len(labels))})"
+        params = labels
+    with db_pool.connection() as conn:
+        students = conn.execute(query, params).fetchall()
     
-    while is_camera_running:
-        success, frame = camera.read()
-        
-        if not success:
-            break
+    for student in students:
+        if student['face_crop']:
+            face_img = np.frombuffer(student['face_crop'], np.uint8).reshape((100, 100))
+        else:
+            kind, face_img = decode_legacy(student['encoding_data'])
+            if kind != 'crop':
+                continue
+        yield student['id'], {'id': student['student_id'], 'name': student['name'],
+                              'department': student['department']}, face_img
+
+def list_face_crop_labels():
+    with db_pool.connection() as conn:
+        return {row[0] for row in conn.execute(f'SELECT id FROM students WHERE {HAS_FACE_CROP_SQL}')}
+
+# Trained once, saved next to the database and updated incrementally
+lbph_model = LBPHModel(LBPH_MODEL_PATH, load_face_crops, list_face_crop_labels)
+lbph_model.start()
+
+def make_frame_analyzer():
+    """Build the detect + recognize + mark step run by the pipeline's workers"""
+    lbph_model.sync()
+    synced = {'at': time.monotonic()}
+    marked = {'date': None, 'students': set()}
+    marked_lock = threading.Lock()
+    
+    def already_marked(student_id):
+        # Marks are written behind the stream; this set avoids re-queueing them
+        today = date.today().strftime('%Y-%m-%d')
+        with marked_lock:
+            if marked['date'] != today:
+                with db_pool.connection() as conn:
+                    rows = conn.execute('SELECT student_id FROM attendance WHERE date = ?', (today,)).fetchall()
+                marked['date'], marked['students'] = today, {row['student_id'] for row in rows}
+            if student_id in marked['students']:
+                return True
+            marked['students'].add(student_id)
+            return False
+    
+    def detect(frame, gray):
+        if time.monotonic() - synced['at'] > LBPH_SYNC_SECONDS:
+            # Registrations/deletions handled by other worker processes
+            synced['at'] = time.monotonic()
+            lbph_model.sync()
+        return face_cascade.detectMultiScale(gray, 1.3, 5)
+    
+    def identify(gray, box):
+        """Recognize one face and mark attendance: (label, color, identified)"""
+        if not lbph_model.ready:
+            # No trained faces - just detect without recognition
+            return 'Face Detected', (255, 0, 0), False
         
-        frame_count += 1
+        student_info, confidence = lbph_model.predict(crop_face(gray, box))
         
-        # Convert to grayscale for face detection
+        # Lower confidence = better match
+        if not student_info or confidence >= 100:
+            return 'Unknown', (0, 0, 255), False
+        if already_marked(student_info['id']):
+            return f"{student_info['name']} (Already Marked)", (0, 255, 255), True
+        now = datetime.now()
+        future = attendance_writer.submit((student_info['id'], now.strftime('%Y-%m-%d'),
+                                           now.strftime('%H:%M:%S')))
+        # Nobody waits on the result; a failed write must still be logged
+        future.add_done_callback(partial(log_failed_mark, student_info['name']))
+        return student_info['name'], (0, 255, 0), True
+    
+    if VIDEO_TRACKER != 'off':
+        return TrackingAnalyzer(detect, identify, kind=VIDEO_TRACKER,
+                                detect_interval=VIDEO_DETECT_INTERVAL)
+    
+    def analyze(frame):
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-        
-        # Process faces for attendance (every few frames)
-        if frame_count % process_every_n_frames == 0:
-            for (x, y, w, h) in faces:
-                # Extract and recognize face
-                face_roi = gray[y:y+h, x:x+w]
-                face_roi = cv2.resize(face_roi, (100, 100))
-                
-                if train_images:
-                    label, confidence = recognizer.predict(face_roi)
-                    
-                    # Lower confidence = better match
-                    if confidence < 100:  # Threshold for recognition
-                        student_info = label_to_student.get(label)
-                        if student_info:
-                            student_id = student_info['id']
-                            student_name = student_info['name']
-                            
-                            # Mark attendance if not already marked today
-                            if student_id and student_id not in marked_today:
-                                conn = get_db_connection()
-                                dept_info = conn.execute(
-                                    'SELECT department FROM students WHERE student_id = ?',
-                                    (student_id,)
-                                ).fetchone()
-                                dept = dept_info['department'] if dept_info else 'Unknown'
-                                
-                                current_time = datetime.now().strftime('%H:%M:%S')
-                                conn.execute('''
-                                    INSERT INTO attendance (student_id, name, department, date, time, status)
-                                    VALUES (?, ?, ?, ?, ?, 'Present')
-                                ''', (student_id, student_name, dept, today, current_time))
-                                conn.commit()
-                                conn.close()
-                                marked_today.add(student_id)
-                                
-                                # Draw green box for recognized face
-                                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                                cv2.putText(frame, f"{student_name}", (x, y-10),
-                                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                            else:
-                                # Already marked - show in yellow
-                                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 255), 2)
-                                cv2.putText(frame, f"{student_name} (Already Marked)", (x, y-10),
-                                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-                        else:
-                            # Unknown face - red box
-                            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
-                            cv2.putText(frame, "Unknown", (x, y-10),
-                                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-                    else:
-                        # Low confidence - red box
-                        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
-                        cv2.putText(frame, "Unknown", (x, y-10),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-                else:
-                    # No trained faces - just detect without recognition
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-                    cv2.putText(frame, "Face Detected", (x, y-10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
-            else:
-                # No face detected
-                pass
-        
-        # Add watermark
-        cv2.putText(frame, 'Smart Attendance System', (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.putText(frame, f'Date: {today}', (10, 60),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        
-        # Encode frame
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        boxes = []
+        for box in detect(frame, gray):
+            box = tuple(int(v) for v in box)
+            label, color, _ = identify(gray, box)
+            boxes.append((*box, label, color))
+        return boxes
+    
+    return analyze
+
+def log_failed_mark(name, future):
+    """Done-callback for camera marks, which nobody waits on"""
+    if future.exception() is not None:
+        print(f"❌ Camera mark for {name} was not saved: {future.exception()}")
+
+def create_video_pipeline():
+    """Pipeline for the broadcaster; the recognizer is trained once per start"""
+    print(f"✓ Video pipeline starting on source {VIDEO_SOURCE} with {VIDEO_WORKERS} analysis workers")
+    return VideoPipeline(lambda: open_source(VIDEO_SOURCE), make_frame_analyzer(),
+                         overlay=draw_watermark, workers=VIDEO_WORKERS,
+                         jpeg_quality=VIDEO_JPEG_QUALITY)
+
+# One producer per process: every /video_feed viewer gets the same encoded
+# JPEG bytes, and the camera runs while anyone is watching or has started it
+video_broadcaster = Broadcaster(create_video_pipeline, linger=VIDEO_IDLE_SECONDS)
+
+def camera_holder():
+    return f"user-{session.get('user_id')}"
 
 @app.route('/video_feed')
 @login_required
 def video_feed():
     """Video streaming route"""
-    return Response(generate_frames(),
+    return Response(video_broadcaster.subscribe(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/start_camera', methods=['POST'])
 @login_required
 def start_camera():
-    """Start the camera"""
-    global camera, is_camera_running
-    if not is_camera_running:
-        camera = cv2.VideoCapture(0)
-        is_camera_running = True
+    """Start the camera (kept running until this user stops it)"""
+    video_broadcaster.acquire(camera_holder())
     return jsonify({'status': 'success', 'message': 'Camera started'})
 
 @app.route('/stop_camera', methods=['POST'])
 @login_required
 def stop_camera():
-    """Stop the camera"""
-    global camera, is_camera_running
-    is_camera_running = False
-    if camera:
-        camera.release()
-        camera = None
+    """Stop the camera (once no one else is using it)"""
+    video_broadcaster.release(camera_holder())
     return jsonify({'status': 'success', 'message': 'Camera stopped'})
 
+@app.route('/api/video/stats')
+@login_required
+def video_stats():
+    """Per-stage fps and latency of the live video pipeline, plus viewer counts"""
+    return jsonify(video_broadcaster.stats())
+
+# ==================== GROUP PHOTO RECOGNITION ====================
+
+# Size-banded pyramid detection on a thread pool (see photo_recognition.py)
+photo_detector = PyramidDetector(cascade_path, workers=PHOTO_WORKERS, min_face=PHOTO_MIN_FACE)
+
+def read_uploaded_photos():
+    """Raw bytes of the uploaded photos
+
+    Multipart files under 'photos' (or 'photo'), or JSON {"images": [...]}
+    with base64 strings or data URLs like the registration capture.
+    """
+    files = request.files.getlist('photos') + request.files.getlist('photo')
+    if files:
+        return [f.read() for f in files]
+    data = request.get_json(silent=True) or {}
+    images = data.get('images') or ([data['image']] if data.get('image') else [])
+    return [base64.b64decode(image.split(',', 1)[-1]) for image in images]
+
+def decode_photo(raw, color=False):
+    """Image capped at PHOTO_MAX_SIDE, and the scale applied (or None, None)
+
+    Grayscale unless color is set (DNN detectors and embedders want BGR).
+    """
+    image = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None, None
+    scale = min(1.0, PHOTO_MAX_SIDE / max(image.shape[:2]))
+    if scale < 1.0:
+        image = cv2.resize(image, (round(image.shape[1] * scale), round(image.shape[0] * scale)),
+                           interpolation=cv2.INTER_AREA)
+    return image, scale
+
+def recognize_photo_faces(images, boxes):
+    """Return ('descriptor' | 'lbph', [(student_id, name, distance)] per face)
+
+    With FACE_EMBEDDER_MATCHING, descriptors from the face engine's embedder
+    are matched against the gallery in one search; otherwise the LBPH model
+    is used.
+    """
+    if embedder_matching:
+        descriptors = np.concatenate(face_engine.embed(images, boxes))
+        if len(descriptors) == 0:
+            return 'descriptor', []
+        matches = get_face_gallery().match(descriptors, FACE_EMBEDDER_THRESHOLD)
+        return 'descriptor', [(match['student_id'], match['student_id'] and match['name'], match['distance'])
+                              for match in matches]
+    
+    lbph_model.sync()
+    crops = [crop_face(image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), box)
+             for image, image_boxes in zip(images, boxes) for box in image_boxes]
+    results = []
+    for student_info, confidence in lbph_model.predict_many(crops):
+        # Lower confidence = better match
+        if student_info and confidence < 100:
+            results.append((student_info['id'], student_info['name'], round(confidence, 1)))
+        else:
+            results.append((None, None, None if confidence is None else round(confidence, 1)))
+    return 'lbph', results
+
+@app.route('/api/attendance/photo', methods=['POST'])
+@login_required
+def mark_attendance_from_photo():
+    """Detect, recognize and mark every face in one or more classroom photos
+
+    Returns one entry per detected face with its box (in the uploaded
+    photo's pixels), the matched student and the marking status. All
+    recognized students are marked in a single transaction; a student found
+    more than once is marked for their best match, other faces report
+    'duplicate'.
+    """
+    started = time.perf_counter()
+    try:
+        uploads = read_uploaded_photos()
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid image data'})
+    if not uploads:
+        return jsonify({'status': 'error', 'message': 'No photos provided'})
+    if len(uploads) > PHOTO_MAX_FILES:
+        return jsonify({'status': 'error', 'message': f'At most {PHOTO_MAX_FILES} photos per request'})
+    
+    color = face_engine.name != 'haar' or embedder_matching
+    photos = []
+    for index, raw in enumerate(uploads):
+        image, scale = decode_photo(raw, color)
+        if image is None:
+            return jsonify({'status': 'error', 'message': f'Photo {index + 1} is not a readable image'})
+        photos.append((image, scale))
+    images = [image for image, _ in photos]
+    decoded = time.perf_counter()
+    
+    if face_engine.name == 'haar':
+        boxes = photo_detector.detect_many([image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+                                            for image in images])
+    else:
+        # Full detections: the embedder aligns on YuNet's landmarks
+        boxes = face_engine.detect(images)
+    detected = time.perf_counter()
+    
+    # One recognition pass over every face of every photo
+    matcher, matches = recognize_photo_faces(images, boxes)
+    recognized = time.perf_counter()
+    
+    located = [(index, box) for index, image_boxes in enumerate(boxes) for box in image_boxes]
+    faces, best = [], {}
+    for (index, box), (student_id, name, distance) in zip(located, matches):
+        scale = photos[index][1]
+        face = {'photo': index, 'box': [round(v / scale) for v in box[:4]],
+                'student_id': student_id, 'name': name, 'distance': distance, 'status': 'unknown'}
+        if student_id:
+            current = best.get(student_id)
+            if current is None or distance < current['distance']:
+                best[student_id] = face
+        faces.append(face)
+    
+    now = datetime.now()
+    day, mark_time = now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S')
+    try:
+        results = mark_attendance_rows(get_db_connection(),
+                                       [(student_id, day, mark_time) for student_id in best])
+    except Exception as e:
+        print(f"❌ Error marking photo attendance: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+    statuses = {result['student_id']: result['status'] for result in results}
+    for face in faces:
+        if face['student_id']:
+            face['status'] = statuses[face['student_id']] if best[face['student_id']] is face else 'duplicate'
+    finished = time.perf_counter()
+    
+    counts = {'success': 0, 'already_marked': 0}
+    for status in statuses.values():
+        counts[status] = counts.get(status, 0) + 1
+    print(f"✅ Photo attendance: {len(faces)} faces in {len(photos)} photo(s), "
+          f"{counts['success']} marked in {(finished - started) * 1000:.0f}ms")
+    
+    return jsonify({
+        'status': 'success',
+        'photos': len(photos),
+        'faces': faces,
+        'marked': counts['success'],
+        'already_marked': counts['already_marked'],
+        'unknown': sum(1 for face in faces if face['status'] == 'unknown'),
+        'matcher': matcher,
+        'recognizer_ready': embedder_matching or lbph_model.ready,
+        'timings_ms': {
+            'decode': round((decoded - started) * 1000, 1),
+            'detect': round((detected - decoded) * 1000, 1),
+            'recognize': round((recognized - detected) * 1000, 1),
+            'mark': round((finished - recognized) * 1000, 1),
+        }
+    })
+
 # ==================== VIEW ATTENDANCE ROUTES ====================
 
+ATTENDANCE_FILTERS = ('date', 'department', 'section', 'student_id')
+
+def encode_cursor(row):
+    """Opaque keyset cursor for an attendance row: its (date, time, id)"""
+    raw = json.dumps([row['date'], row['time'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Return (date, time, id) from a cursor; ValueError when it is malformed"""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        day, mark_time, row_id = value
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid page cursor') from e
+    if not isinstance(day, str) or not isinstance(mark_time, str) or not isinstance(row_id, int):
+        raise ValueError('Invalid page cursor')
+    return day, mark_time, row_id
+
+def attendance_where(filters):
+    """(JOIN clause, WHERE clause, params) for the attendance browser filters"""
+    join, where, params = '', ['1=1'], []
+    if filters['date']:
+        where.append('a.date = ?')
+        params.append(filters['date'])
+    if filters['department']:
+        where.append('a.department = ?')
+        params.append(filters['department'])
+    if filters['student_id']:
+        where.append('a.student_id = ?')
+        params.append(filters['student_id'])
+    if filters['section']:
+        # Section lives on the student, not on the attendance row. CROSS JOIN
+        # keeps attendance as the outer loop, so rows come in index order and
+        # a page stops after `limit` matches instead of sorting the section
+        join = 'CROSS JOIN students s ON s.student_id = a.student_id'
+        where.append('s.section = ?')
+        params.append(filters['section'])
+    return join, ' AND '.join(where), params
+
+def fetch_attendance_page(conn, filters, after=None, before=None, limit=ATTENDANCE_PAGE_SIZE):
+    """One page of attendance, newest first, with keyset cursors
+
+    `after` continues with older rows than its cursor, `before` with newer
+    ones. Returns (rows, older cursor or None, newer cursor or None); the
+    cost depends on the page size, not on how deep the page is.
+    """
+    join, where, params = attendance_where(filters)
+    order = 'DESC'
+    if after:
+        where += ' AND (a.date, a.time, a.id) < (?, ?, ?)'
+        params += list(decode_cursor(after))
+    elif before:
+        where += ' AND (a.date, a.time, a.id) > (?, ?, ?)'
+        params += list(decode_cursor(before))
+        order = 'ASC'
+    rows = conn.execute(f'''
+        SELECT a.id, a.student_id, a.name, a.department, a.date, a.time, a.status
+        FROM attendance a {join}
+        WHERE {where}
+        ORDER BY a.date {order}, a.time {order}, a.id {order}
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return rows, None, None
+    if before:
+        # Fetched oldest first, walking back towards the newest rows
+        rows.reverse()
+        has_older, has_newer = True, more
+    else:
+        has_older, has_newer = more, bool(after)
+    return (rows, encode_cursor(rows[-1]) if has_older else None,
+            encode_cursor(rows[0]) if has_newer else None)
+
+def count_attendance(conn, filters):
+    """Return (count, exact) for the browser filters
+
+    Date/department filters are answered from the attendance_department_daily
+    rollup (one row per day and department). Section and student filters
+    count the matching rows, stopping at ATTENDANCE_COUNT_CAP.
+    """
+    if not filters['section'] and not filters['student_id']:
+        query = 'SELECT COALESCE(SUM(present), 0) FROM attendance_department_daily WHERE 1=1'
+        params = []
+        if filters['date']:
+            query += ' AND date = ?'
+            params.append(filters['date'])
+        if filters['department']:
+            query += ' AND department = ?'
+            params.append(filters['department'])
+        return conn.execute(query, params).fetchone()[0], True
+    
+    join, where, params = attendance_where(filters)
+    count = conn.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM attendance a {join} WHERE {where} LIMIT ?)',
+                         params + [ATTENDANCE_COUNT_CAP + 1]).fetchone()[0]
+    return min(count, ATTENDANCE_COUNT_CAP), count <= ATTENDANCE_COUNT_CAP
+
+def read_attendance_browser_args(args):
+    filters = {name: args.get(name, '').strip() for name in ATTENDANCE_FILTERS}
+    limit = min(max(args.get('limit', ATTENDANCE_PAGE_SIZE, type=int) or ATTENDANCE_PAGE_SIZE, 1),
+                ATTENDANCE_PAGE_SIZE_MAX)
+    return filters, args.get('after'), args.get('before'), limit
+
 @app.route('/view_attendance', methods=['GET', 'POST'])
 @login_required
 def view_attendance():
-    """View attendance records with filters"""
+    """View attendance records with filters, one page at a time"""
     conn = get_db_connection()
+    filters, after, before, limit = read_attendance_browser_args(request.args)
     
-    # Get filter parameters
-    filter_date = request.args.get('date', '')
-    filter_department = request.args.get('department', '')
-    filter_section = request.args.get('section', '')
-    
-    query = 'SELECT * FROM attendance WHERE 1=1'
-    params = []
-    
-    if filter_date:
-        query += ' AND date = ?'
-        params.append(filter_date)
-    
-    if filter_department:
-        query += ' AND department = ?'
-        params.append(filter_department)
-    
-    if filter_section:
-        query += " AND student_id LIKE ?"
-        params.append(f'%{filter_section}%')
-    
-    query += ' ORDER BY date DESC, time DESC'
-    
-    attendance_records = conn.execute(query, params).fetchall()
-    
-    # Get departments for filter dropdown
-    departments = conn.execute('SELECT DISTINCT department FROM students').fetchall()
+    try:
+        attendance_records, older, newer = fetch_attendance_page(conn, filters, after, before, limit)
+    except ValueError:
+        # Stale or hand-edited cursor: start again from the newest rows
+        attendance_records, older, newer = fetch_attendance_page(conn, filters, limit=limit)
+    total_records, total_exact = count_attendance(conn, filters)
     
-    # Calculate stats
-    total_records = len(attendance_records)
+    # Get departments and sections for the filter dropdowns
+    departments = conn.execute('SELECT DISTINCT department FROM students ORDER BY department').fetchall()
+    sections = [row['section'] for row in conn.execute('SELECT DISTINCT section FROM students ORDER BY section')]
     
-    conn.close()
+    filter_args = {name: value for name, value in filters.items() if value}
+    if limit != ATTENDANCE_PAGE_SIZE:
+        filter_args['limit'] = limit
     
     return render_template('view_attendance.html',
                          records=attendance_records,
                          departments=departments,
-                         filter_date=filter_date,
-                         filter_department=filter_department,
-                         filter_section=filter_section,
-                         total_records=total_records)
+                         sections=sections,
+                         filter_date=filters['date'],
+                         filter_department=filters['department'],
+                         filter_section=filters['section'],
+                         filter_student_id=filters['student_id'],
+                         total_records=total_records,
+                         total_exact=total_exact,
+                         older_url=url_for('view_attendance', after=older, **filter_args) if older else None,
+                         newer_url=url_for('view_attendance', before=newer, **filter_args) if newer else None)
+
+@app.route('/api/attendance')
+@login_required
+def list_attendance():
+    """JSON attendance browser: same filters and cursors as view_attendance
+
+    ?date=&department=&section=&student_id=&limit=&after=<cursor>|before=<cursor>
+    """
+    conn = get_db_connection()
+    filters, after, before, limit = read_attendance_browser_args(request.args)
+    try:
+        rows, older, newer = fetch_attendance_page(conn, filters, after, before, limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    total, total_exact = count_attendance(conn, filters)
+    
+    return jsonify({
+        'status': 'success',
+        'records': [dict(row) for row in rows],
+        'next_cursor': older,
+        'prev_cursor': newer,
+        'total': total,
+        'total_exact': total_exact
+    })
+
+# ==================== REPORT QUERIES ====================
+
+report_jobs = JobQueue(max_workers=REPORT_WORKERS)
+report_cache = ReportCache(REPORT_CACHE_DIR, max_entries=REPORT_CACHE_MAX_ENTRIES)
+
+def month_range(month):
+    """'YYYY-MM' -> ('YYYY-MM-01', 'YYYY-MM-<last day>')"""
+    year, month_num = (int(part) for part in month.split('-'))
+    last_day = calendar.monthrange(year, month_num)[1]
+    return f'{year:04d}-{month_num:02d}-01', f'{year:04d}-{month_num:02d}-{last_day:02d}'
+
+# Per-student attendance between two dates (inclusive), from the daily rollup.
+# Counted like student_stats: total_days is the working days from the later
+# of the period start and the student's enrolment date to the period end,
+# and only Present marks on working days count towards it.
+PERIOD_SUMMARY_SQL = '''
+    SELECT student_id, name, department, total_present, total_days,
+           COALESCE(ROUND(100.0 * total_present / NULLIF(total_days, 0), 1), 0.0) AS percentage
+    FROM (
+        SELECT s.student_id, MAX(s.name) AS name, MAX(s.department) AS department,
+               SUM(s.present * (s.date IN (SELECT date FROM working_days))) AS total_present,
+               (SELECT COUNT(*) FROM working_days w
+                WHERE w.date BETWEEN MAX(?, COALESCE(st.enrolled_on, '')) AND ?) AS total_days
+        FROM attendance_daily_summary s
+        LEFT JOIN student_stats st ON st.student_id = s.student_id
+        WHERE s.date BETWEEN ? AND ?
+        GROUP BY s.student_id
+    )
+    ORDER BY student_id
+'''
+
+DAILY_REPORT_SQL = '''
+    SELECT student_id, name, department, date, time, status
+    FROM attendance WHERE date = ? ORDER BY time, student_id
+'''
+
+def fetch_period_summary(conn, start, end):
+    """Per-student attendance rows between two dates (see PERIOD_SUMMARY_SQL)"""
+    return conn.execute(PERIOD_SUMMARY_SQL, (start, end, start, end)).fetchall()
+
+def report_query(form):
+    """Return (sql, params, filename stem, (start, end)) for a report form
+
+    Raises ValueError for an unknown report type or a bad period.
+    """
+    report_type = form.get('report_type')
+    if report_type == 'daily':
+        day = form.get('month') or form.get('date')
+        if not day:
+            raise ValueError('No date selected')
+        return DAILY_REPORT_SQL, (day,), f'daily_attendance_{day}', (day, day)
+    if report_type == 'monthly':
+        start, end = month_range(form.get('month') or form.get('date') or '')
+        return (PERIOD_SUMMARY_SQL, (start, end, start, end),
+                f'monthly_attendance_{start[:4]}_{start[5:7]}', (start, end))
+    if report_type == 'range':
+        start, end = form.get('start_date'), form.get('end_date')
+        if not start or not end or start > end:
+            raise ValueError('Invalid date range')
+        return PERIOD_SUMMARY_SQL, (start, end, start, end), f'attendance_{start}_to_{end}', (start, end)
+    raise ValueError('Unknown report type')
+
+def report_fingerprint(conn, start, end):
+    """Cheap version of the attendance rows in a period (an index-only range scan)
+
+    Any insert raises MAX(id) and any delete lowers COUNT(*), so a cached
+    report is reused exactly while the period's data is unchanged. The
+    calendar version covers working days added or removed by hand.
+    """
+    count, max_id, version = conn.execute(
+        'SELECT COUNT(*), MAX(id), (SELECT version FROM calendar_state WHERE id = 1) '
+        'FROM attendance WHERE date BETWEEN ? AND ?', (start, end)
+    ).fetchone()
+    return f'{count}-{max_id or 0}-{version}'
+
+REPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def build_report(artifact_id, sql, params, export_format, filename):
+    """Job body: write a report into the cache from a pooled connection"""
+    def write(f):
+        with db_pool.connection() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            if export_format == 'csv':
+                for chunk in csv_chunks(columns, iter_rows(cursor)):
+                    f.write(chunk.encode('utf-8'))
+            else:
+                write_xlsx(columns, iter_rows(cursor), f)
+    
+    started = time.monotonic()
+    report_cache.set_state(artifact_id, 'running')
+    try:
+        artifact = report_cache.write(artifact_id, filename, REPORT_MIMETYPES[export_format], write)
+    except Exception as e:
+        report_cache.set_state(artifact_id, 'failed', str(e))
+        raise
+    print(f"✓ Generated {filename} in {time.monotonic() - started:.2f}s")
+    return artifact['filename']
+
+def job_response(job_id, job=None):
+    """JSON status for a job
+
+    Jobs run in the worker process that took the POST; other workers find
+    finished artifacts and the state of unfinished jobs in the shared cache.
+    """
+    artifact = report_cache.get(job_id)
+    if job is None:
+        if artifact is not None:
+            job = {'id': job_id, 'state': 'done', 'kind': 'report', 'error': None}
+        else:
+            shared = report_cache.state(job_id)
+            if shared is None:
+                return jsonify({'status': 'error', 'message': 'Job not found'})
+            job = {'id': job_id, 'state': shared['state'], 'kind': 'report', 'error': shared['error']}
+    elif job['state'] == 'done' and artifact is None:
+        job = dict(job, state='failed', error='Report file is no longer available')
+    
+    payload = {'status': 'success', 'job': {key: job.get(key) for key in
+                                            ('id', 'state', 'kind', 'error', 'created_at', 'finished_at')}}
+    if job['state'] == 'done':
+        payload['download_url'] = url_for('download_job_artifact', job_id=job_id)
+    return jsonify(payload)
 
 # ==================== REPORTS ROUTES ====================
 
 @app.route('/reports', methods=['GET', 'POST'])
 @login_required
 def reports():
-    """Reports page"""
+    """Reports page; POST queues an export job (or finds it already cached)"""
     conn = get_db_connection()
     
     if request.method == 'POST':
-        report_type = request.form.get('report_type')
-        month = request.form.get('month')
         export_format = request.form.get('export_format', 'csv')
+        if export_format not in REPORT_MIMETYPES:
+            return jsonify({'status': 'error', 'message': 'Unknown export format'})
+        try:
+            sql, params, filename, (start, end) = report_query(request.form)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)})
         
-        if report_type == 'daily':
-            # Daily report
-            records = conn.execute('''
-                SELECT * FROM attendance WHERE date = ?
-            ''', (month,)).fetchall()
-            
-            if export_format == 'csv':
-                df = pd.DataFrame([dict(row) for row in records])
-                filename = f'daily_attendance_{month}.csv'
-                os.makedirs('static/reports', exist_ok=True)
-                df.to_csv(f'static/reports/{filename}', index=False)
-                return jsonify({'status': 'success', 'filename': filename})
-            
-            elif export_format == 'excel':
-                df = pd.DataFrame([dict(row) for row in records])
-                filename = f'daily_attendance_{month}.xlsx'
-                os.makedirs('static/reports', exist_ok=True)
-                df.to_excel(f'static/reports/{filename}', index=False)
-                return jsonify({'status': 'success', 'filename': filename})
+        key = ('export', request.form.get('report_type'), start, end, export_format,
+               report_fingerprint(conn, start, end))
+        job_id = report_cache.key_id(key)
+        if report_cache.get(job_id) is not None:
+            return job_response(job_id)
         
-        elif report_type == 'monthly':
-            # Monthly report
-            year, month_num = month.split('-')
-            records = conn.execute('''
-                SELECT student_id, name, department,
-                       COUNT(CASE WHEN date IS NOT NULL THEN 1 END) as total_present,
-                       COUNT(*) as total_days
-                FROM attendance 
-                WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                GROUP BY student_id
-            ''', (year, month_num)).fetchall()
-            
-            if export_format == 'csv':
-                df = pd.DataFrame([dict(row) for row in records])
-                filename = f'monthly_attendance_{year}_{month_num}.csv'
-                os.makedirs('static/reports', exist_ok=True)
-                df.to_csv(f'static/reports/{filename}', index=False)
-                return jsonify({'status': 'success', 'filename': filename})
-            
-            elif export_format == 'excel':
-                df = pd.DataFrame([dict(row) for row in records])
-                filename = f'monthly_attendance_{year}_{month_num}.xlsx'
-                os.makedirs('static/reports', exist_ok=True)
-                df.to_excel(f'static/reports/{filename}', index=False)
-                return jsonify({'status': 'success', 'filename': filename})
-    
-    # Get statistics
-    total_students = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
-    total_attendance = conn.execute('SELECT COUNT(*) FROM attendance').fetchone()[0]
+        job = report_jobs.get(job_id)
+        if job is None or job['state'] == 'failed':
+            shared = report_cache.state(job_id)
+            if job is None and shared is not None and shared['state'] != 'failed':
+                # Another worker process is generating it
+                return job_response(job_id)
+            # Visible to every worker before any poll can arrive
+            report_cache.set_state(job_id, 'queued')
+        
+        extension = 'csv' if export_format == 'csv' else 'xlsx'
+        job = report_jobs.submit(job_id, build_report, job_id, sql, params, export_format,
+                                 f'{filename}.{extension}', kind='report')
+        return job_response(job_id, job)
     
-    # Get unique dates
-    unique_dates = conn.execute('SELECT DISTINCT date FROM attendance ORDER BY date DESC').fetchall()
+    # Get statistics (from the department rollup: one row per department per day)
+    total_students = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+    total_attendance = conn.execute(
+        'SELECT COALESCE(SUM(present), 0) FROM attendance_department_daily'
+    ).fetchone()[0]
     
-    conn.close()
+    # Get the most recent dates with attendance
+    unique_dates = conn.execute(
+        'SELECT DISTINCT date FROM attendance_department_daily ORDER BY date DESC LIMIT 10'
+    ).fetchall()
     
     return render_template('reports.html',
                          total_students=total_students,
                          total_attendance=total_attendance,
                          unique_dates=unique_dates)
 
-@app.route('/download_report/<filename>')
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    """Poll a background job"""
+    return job_response(job_id, report_jobs.get(job_id))
+
+@app.route('/api/jobs/<job_id>/download')
 @login_required
-def download_report(filename):
-    """Download a report file"""
-    return redirect(url_for('static', filename=f'reports/{filename}'))
+def download_job_artifact(job_id):
+    """Download the file produced by a finished report job"""
+    artifact = report_cache.get(job_id)
+    if artifact is None:
+        return jsonify({'status': 'error', 'message': 'Report is not ready'})
+    return send_file(artifact['path'], mimetype=artifact['mimetype'],
+                     as_attachment=True, download_name=artifact['filename'])
 
 @app.route('/print_report', methods=['POST'])
 @login_required
 def print_report():
-    """Generate printable report"""
+    """Generate printable report (cached like exports)"""
     report_type = request.form.get('report_type')
-    date_param = request.form.get('date')
     
     conn = get_db_connection()
     
-    if report_type == 'daily':
-        records = conn.execute('SELECT * FROM attendance WHERE date = ?', (date_param,)).fetchall()
-        title = f"Daily Attendance Report - {date_param}"
-    else:
-        year, month = date_param.split('-')
-        records = conn.execute('''
-            SELECT student_id, name, department,
-                   COUNT(*) as present_count
-            FROM attendance 
-            WHERE strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            GROUP BY student_id
-        ''', (year, month)).fetchall()
-        title = f"Monthly Attendance Report - {year}-{month}"
-    
-    conn.close()
-    
-    # Pass datetime as template variable
-    current_datetime = datetime.now()
+    try:
+        sql, params, _, (start, end) = report_query(request.form)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
     
-    return render_template('print_report.html',
-                         records=records,
-                         title=title,
-                         report_type=report_type,
-                         current_datetime=current_datetime)
+    # Rendering from the rollup is quick, so it stays in the request; the
+    # page is cached so a closed month is only rendered once
+    artifact_id = report_cache.key_id(('print', report_type, start, end,
+                                       report_fingerprint(conn, start, end)))
+    artifact = report_cache.get(artifact_id)
+    if artifact is None:
+        if report_type == 'daily':
+            title = f"Daily Attendance Report - {start}"
+        elif report_type == 'range':
+            title = f"Attendance Report - {start} to {end}"
+        else:
+            title = f"Monthly Attendance Report - {start[:7]}"
+        
+        html = render_template('print_report.html',
+                               records=conn.execute(sql, params).fetchall(),
+                               title=title,
+                               report_type=report_type,
+                               current_datetime=datetime.now())
+        artifact = report_cache.write(artifact_id, f'{artifact_id}.html', 'text/html',
+                                      lambda f: f.write(html.encode('utf-8')))
+    
+    return send_file(artifact['path'], mimetype='text/html')
+
+# ==================== ANALYTICS ROUTES ====================
+
+def analytics_args():
+    """Common ?start=&end=&department=&section= filters (dates as YYYY-MM-DD)"""
+    args = {name: request.args.get(name, '').strip() or None
+            for name in ('start', 'end', 'department', 'section')}
+    for name in ('start', 'end'):
+        if args[name]:
+            try:
+                datetime.strptime(args[name], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'{name} must be a YYYY-MM-DD date') from None
+    return args
+
+@app.route('/api/analytics/students')
+@login_required
+def analytics_students():
+    """Attendance percentage and streaks of every student, optionally filtered"""
+    try:
+        args = analytics_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    return jsonify(dict(attendance_matrix.students(**args), status='success'))
+
+@app.route('/api/analytics/students/<student_id>')
+@login_required
+def analytics_student(student_id):
+    """One student's attendance percentage and streaks"""
+    try:
+        args = analytics_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    stats = attendance_matrix.student(student_id, args['start'], args['end'])
+    if stats is None:
+        return jsonify({'status': 'error', 'message': 'Student not found'})
+    return jsonify(dict(stats, status='success'))
+
+@app.route('/api/analytics/summary')
+@login_required
+def analytics_summary():
+    """Average attendance and defaulter counts per department (or ?group=section)"""
+    try:
+        args = analytics_args()
+        threshold = float(request.args.get('threshold', ATTENDANCE_THRESHOLD))
+        summary = attendance_matrix.summary(request.args.get('group', 'department'),
+                                            args['start'], args['end'], threshold)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    return jsonify(dict(summary, status='success'))
+
+@app.route('/api/analytics/defaulters')
+@login_required
+def analytics_defaulters():
+    """Students below ?threshold= percent (default ATTENDANCE_THRESHOLD), lowest first"""
+    try:
+        args = analytics_args()
+        threshold = float(request.args.get('threshold', ATTENDANCE_THRESHOLD))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    return jsonify(dict(attendance_matrix.defaulters(threshold, **args), status='success'))
 
 # ==================== STUDENT OPTIONAL ROUTES ====================
 
@@ -662,7 +1644,6 @@ def student_login():
         conn = get_db_connection()
         student = conn.execute('SELECT * FROM students WHERE student_id = ?',
                               (student_id,)).fetchone()
-        conn.close()
         
         if student:
             session['student_id'] = student['student_id']
@@ -679,28 +1660,11 @@ def student_dashboard():
     if 'student_id' not in session:
         return redirect(url_for('student_login'))
     
-    conn = get_db_connection()
     student_id = session['student_id']
     
-    # Get total attendance
-    total_days_result = conn.execute('SELECT COUNT(DISTINCT date) FROM attendance').fetchone()[0]
-    total_days = total_days_result if total_days_result else 0
-    
-    present_days_result = conn.execute(
-        'SELECT COUNT(DISTINCT date) FROM attendance WHERE student_id = ?',
-        (student_id,)
-    ).fetchone()[0]
-    present_days = present_days_result if present_days_result else 0
-    
-    # Get recent attendance
-    recent = conn.execute('''
-        SELECT * FROM attendance WHERE student_id = ? ORDER BY date DESC, time DESC LIMIT 10
-    ''', (student_id,)).fetchall()
-    
-    conn.close()
-    
-    # Calculate percentage safely (avoid division by zero)
-    percentage = round((present_days / total_days * 100), 2) if total_days > 0 else 0.0
+    # One cached primary-key lookup of student_stats (see student_stats.py)
+    stats = student_stats_cache.get(student_id) or {
+        'eligible_days': 0, 'present_days': 0, 'percentage': 0.0, 'last_seen': None, 'recent': []}
     
     # Get current datetime for template
     current_datetime = datetime.now()
@@ -708,11 +1672,12 @@ def student_dashboard():
     return render_template('student_dashboard.html',
                          student_name=session['student_name'],
                          student_id=student_id,
-                         total_days=total_days,
-                         present_days=present_days,
-                         percentage=percentage,
+                         total_days=stats['eligible_days'],
+                         present_days=stats['present_days'],
+                         percentage=stats['percentage'],
+                         last_seen=stats['last_seen'],
                          current_datetime=current_datetime,
-                         recent=recent)
+                         recent=stats['recent'])
 
 @app.route('/student_logout')
 def student_logout():
@@ -729,7 +1694,6 @@ def get_students():
     """Get all students as JSON (without encoding data)"""
     conn = get_db_connection()
     students = conn.execute('SELECT id, student_id, name, department, year, section, image_path FROM students ORDER BY name').fetchall()
-    conn.close()
     return jsonify([dict(row) for row in students])
 
 @app.route('/api/students/<student_id>', methods=['DELETE'])
@@ -742,19 +1706,27 @@ def delete_student(student_id):
     student = conn.execute('SELECT * FROM students WHERE student_id = ?', (student_id,)).fetchone()
     
     if not student:
-        conn.close()
         return jsonify({'status': 'error', 'message': 'Student not found'})
     
     # Get image path for deletion
     image_path = student['image_path']
     
     try:
-        # Delete attendance records first (foreign key constraint)
+        # Delete attendance records and face samples first (foreign key constraint)
         conn.execute('DELETE FROM attendance WHERE student_id = ?', (student_id,))
+        conn.execute('DELETE FROM face_descriptors WHERE student_id = ?', (student_id,))
         
-        # Delete student
+        # Delete student, leaving a tombstone for descriptor delta sync
         conn.execute('DELETE FROM students WHERE student_id = ?', (student_id,))
+        gallery_version = bump_gallery_version(conn)
+        conn.execute('INSERT OR REPLACE INTO descriptor_tombstones (student_id, version) VALUES (?, ?)',
+                    (student_id, gallery_version))
         conn.commit()
+        face_gallery.remove(student_id, gallery_version)
+        lbph_model.remove(student['id'])
+        today_stats.student_removed(student_id)
+        attendance_matrix.student_removed(student_id)
+        student_stats_cache.invalidate([student_id])
         
         # Delete image file if exists
         if image_path:
@@ -763,76 +1735,82 @@ def delete_student(student_id):
                 os.remove(full_path)
         
         print(f"✓ Deleted student: {student_id} ({student['name']})")
-        conn.close()
         return jsonify({'status': 'success', 'message': f'Student {student_id} deleted successfully'})
     except Exception as e:
-        conn.close()
         print(f"✗ Error deleting student {student_id}: {e}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+# Binary gallery layout (all little-endian):
+#   header  magic b'FDG1', uint32 version, uint32 since, uint32 count, uint32 dim, uint32 table bytes
+#   floats  count * dim float32 values, one row per student
+#   table   UTF-8 JSON {"students": [[student_id, name], ...], "deleted": [student_id, ...]}
+GALLERY_MAGIC = b'FDG1'
+GALLERY_HEADER = struct.Struct('<4sIIIII')
+
+def pack_gallery(version, since, upserts, deleted):
+    """Pack descriptors as one Float32Array plus an id/name table"""
+    vectors = np.zeros((len(upserts), DESCRIPTOR_SIZE), dtype='<f4')
+    for row, entry in enumerate(upserts):
+        vectors[row] = entry[2]
+    table = json.dumps({
+        'students': [[entry[0], entry[1]] for entry in upserts],
+        'deleted': deleted
+    }, ensure_ascii=False).encode('utf-8')
+    header = GALLERY_HEADER.pack(GALLERY_MAGIC, version, since or 0, len(upserts),
+                                 DESCRIPTOR_SIZE, len(table))
+    return header + vectors.tobytes() + table
+
+def set_gallery_validators(response, etag, version, last_modified):
+    """Attach ETag/Last-Modified so clients revalidate instead of re-downloading"""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Gallery-Version'] = str(version)
+    response.vary.add('Accept')
+    return response
+
 @app.route('/api/students/descriptors')
 @login_required
 def get_student_descriptors():
-    """Get student face descriptors for client-side recognition"""
-    conn = get_db_connection()
-    students = conn.execute('SELECT student_id, name, encoding_data FROM students').fetchall()
-    conn.close()
+    """Get student face descriptors for client-side recognition
+
+    ?format=bin (or Accept: application/octet-stream) returns the packed
+    binary gallery; ?since=<version> returns only students added, changed
+    or deleted after that gallery version. Responses carry an ETag and
+    Last-Modified derived from the gallery version, so unchanged galleries
+    revalidate with a 304.
+    """
+    binary = (request.args.get('format') == 'bin' or
+              request.accept_mimetypes.best == 'application/octet-stream')
+    since = request.args.get('since', type=int)
     
-    descriptors = []
-    for student in students:
-        if not student['encoding_data']:
-            continue
-            
-        encoding = None
-        raw_data = student['encoding_data']
-        
-        # Try different formats
-        try:
-            import json
-            # Case 1: Already a JSON string
-            if isinstance(raw_data, str):
-                encoding = json.loads(raw_data)
-                print(f"✓ Parsed JSON string for {student['student_id']}")
-            else:
-                # Case 2: Try parsing as JSON from bytes
-                encoding = json.loads(raw_data.decode('utf-8'))
-                print(f"✓ Parsed JSON bytes for {student['student_id']}")
-        except Exception as e:
-            # Case 3: Try numpy array (old OpenCV format - 100x100 grayscale = 10000 values)
-            try:
-                import numpy as np
-                # Old format: 100x100 grayscale image as bytes
-                arr = np.frombuffer(raw_data, np.uint8)
-                if len(arr) == 10000:  # 100x100 pixels
-                    # Convert grayscale values to face-api.js compatible descriptor
-                    # We need 128 float values - extract normalized values from the image
-                    img = arr.reshape(100, 100)
-                    # Create a simple 128-d descriptor from the image
-                    encoding = img.flatten().astype(np.float64).tolist()[:128]
-                    if len(encoding) < 128:
-                        encoding.extend([0.0] * (128 - len(encoding)))
-                    print(f"✓ Converted OpenCV grayscale for {student['student_id']} ({len(encoding)} values)")
-                else:
-                    # Try as float64
-                    arr = np.frombuffer(raw_data, np.float64)
-                    encoding = arr.tolist()
-                    print(f"✓ Parsed float64 array for {student['student_id']} ({len(encoding)} values)")
-            except Exception as e2:
-                print(f"✗ Failed to parse encoding for {student['student_id']}: {e} {e2}")
-                continue
-        
-        if encoding and len(encoding) == 128:
-            descriptors.append({
-                'student_id': student['student_id'],
-                'name': student['name'],
-                'encoding': encoding
-            })
-            print(f"✓ Added descriptor for {student['name']}")
-        else:
-            print(f"✗ Invalid encoding length for {student['student_id']}: {len(encoding) if encoding else 'None'}")
+    conn = get_db_connection()
+    version, last_modified = get_gallery_state(conn)
+    
+    etag = f"gallery-{version}-{'bin' if binary else 'json'}-{'full' if since is None else since}"
+    not_modified = set_gallery_validators(Response(), etag, version, last_modified)
+    not_modified.make_conditional(request)
+    if not_modified.status_code == 304:
+        return not_modified
+    
+    upserts, deleted = fetch_gallery_changes(conn, since)
+    
+    if binary:
+        response = Response(pack_gallery(version, since, upserts, deleted),
+                            mimetype='application/octet-stream')
+    elif since is None:
+        response = jsonify([{'student_id': student_id, 'name': name, 'encoding': descriptor.tolist()}
+                            for student_id, name, descriptor, _ in upserts])
+    else:
+        response = jsonify({
+            'version': version,
+            'since': since,
+            'students': [{'student_id': student_id, 'name': name, 'encoding': descriptor.tolist()}
+                         for student_id, name, descriptor, _ in upserts],
+            'deleted': deleted
+        })
     
-    print(f"Total descriptors returned: {len(descriptors)}")
-    return jsonify(descriptors)
+    return set_gallery_validators(response, etag, version, last_modified)
 
 @app.route('/api/students/descriptor', methods=['POST'])
 @login_required
@@ -845,17 +1823,94 @@ def save_student_descriptor():
     if not student_id or not descriptor:
         return jsonify({'status': 'error', 'message': 'Missing data'})
     
-    import json
+    if len(descriptor) != DESCRIPTOR_SIZE:
+        return jsonify({'status': 'error', 'message': f'Descriptor must have {DESCRIPTOR_SIZE} values'})
+    
     conn = get_db_connection()
     
-    # Update student with new descriptor
-    conn.execute('UPDATE students SET encoding_data = ? WHERE student_id = ?',
-                (json.dumps(descriptor), student_id))
+    student = conn.execute('SELECT name FROM students WHERE student_id = ?', (student_id,)).fetchone()
+    if not student:
+        return jsonify({'status': 'error', 'message': 'Student not found'})
+    
+    # Replace the student's samples with this single descriptor
+    gallery_version = write_student_samples(conn, student_id, [descriptor], descriptor)
     conn.commit()
-    conn.close()
+    
+    face_gallery.upsert(student_id, student['name'], descriptor, gallery_version, samples=[descriptor])
     
     return jsonify({'status': 'success', 'message': 'Descriptor saved'})
 
+@app.route('/api/students/<student_id>/descriptors', methods=['POST'])
+@login_required
+def enrol_student_descriptors(student_id):
+    """Enrol a burst of face descriptors for a student
+
+    New samples are added to the stored ones (or replace them with
+    "replace": true); outliers are pruned and the centroid recomputed.
+    """
+    data = request.json or {}
+    descriptors = data.get('descriptors') or []
+    replace = bool(data.get('replace', False))
+    
+    if not descriptors:
+        return jsonify({'status': 'error', 'message': 'No descriptors provided'})
+    if any(len(descriptor) != DESCRIPTOR_SIZE for descriptor in descriptors):
+        return jsonify({'status': 'error', 'message': f'Descriptors must have {DESCRIPTOR_SIZE} values'})
+    
+    conn = get_db_connection()
+    student = conn.execute('SELECT name FROM students WHERE student_id = ?', (student_id,)).fetchone()
+    if not student:
+        return jsonify({'status': 'error', 'message': 'Student not found'})
+    
+    samples = np.asarray(descriptors, dtype=np.float32)
+    if not replace:
+        existing = fetch_student_samples(conn).get(student_id)
+        if existing is not None:
+            samples = np.concatenate([existing, samples])
+    
+    kept, centroid, pruned = summarize_samples(samples, DESCRIPTOR_OUTLIER_DISTANCE, MAX_DESCRIPTOR_SAMPLES)
+    if centroid is None:
+        return jsonify({'status': 'error', 'message': 'Face captures are inconsistent, please capture again'})
+    
+    gallery_version = write_student_samples(conn, student_id, kept, centroid)
+    conn.commit()
+    
+    face_gallery.upsert(student_id, student['name'], centroid, gallery_version, samples=kept)
+    
+    return jsonify({
+        'status': 'success',
+        'message': f'{len(kept)} samples stored for {student["name"]}',
+        'samples': len(kept),
+        'pruned': pruned
+    })
+
+@app.route('/api/recognize', methods=['POST'])
+@login_required
+def recognize_faces():
+    """Match one or more 128-d descriptors against the enrolled gallery"""
+    data = request.json or {}
+    descriptors = data.get('descriptors')
+    if descriptors is None and data.get('descriptor') is not None:
+        descriptors = [data.get('descriptor')]
+    
+    if not descriptors:
+        return jsonify({'status': 'error', 'message': 'No descriptors provided'})
+    
+    try:
+        # A caller may only tighten matching, never loosen it
+        threshold = min(float(data.get('threshold', RECOGNITION_THRESHOLD)), RECOGNITION_THRESHOLD)
+        if not threshold > 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid threshold'})
+    
+    try:
+        matches = get_face_gallery().match(descriptors, threshold)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)})
+    
+    return jsonify({'status': 'success', 'matches': matches})
+
 @app.route('/mark_attendance', methods=['POST'])
 @login_required
 def mark_attendance_api():
@@ -869,85 +1924,294 @@ def mark_attendance_api():
         if not student_id:
             return jsonify({'status': 'error', 'message': 'No student ID provided'})
         
-        conn = get_db_connection()
-        
-        # Check if student exists
-        student = conn.execute('SELECT * FROM students WHERE student_id = ?',
-                              (student_id,)).fetchone()
+        now = datetime.now()
+        result = mark_attendance(student_id, now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'))
         
-        if not student:
-            conn.close()
+        if result['status'] == 'not_found':
             print(f"❌ Student not found: {student_id}")
             return jsonify({'status': 'error', 'message': 'Student not found'})
         
-        today = date.today().strftime('%Y-%m-%d')
-        current_time = datetime.now().strftime('%H:%M:%S')
-        
-        print(f"📝 Attempting to mark attendance for: {student['name']} ({student_id})")
-        
-        # Check if already marked today
-        existing = conn.execute(
-            'SELECT * FROM attendance WHERE student_id = ? AND date = ?',
-            (student_id, today)
-        ).fetchone()
-        
-        if existing:
-            conn.close()
-            print(f"⚠️ Already marked today: {student['name']}")
+        student = {
+            'student_id': result['student_id'],
+            'name': result['name'],
+            'time': result['time']
+        }
+        if result['status'] == 'success':
+            print(f"✅ Successfully marked attendance for: {student['name']} at {student['time']}")
             return jsonify({
-                'status': 'already_marked',
-                'message': f'{student["name"]} is already marked present today',
-                'student': {
-                    'student_id': student['student_id'],
-                    'name': student['name'],
-                    'time': existing['time']
-                }
+                'status': 'success',
+                'message': f'Attendance marked for {student["name"]}',
+                'student': student
             })
         
-        # Mark attendance
-        conn.execute('''
-            INSERT INTO attendance (student_id, name, department, date, time, status)
-            VALUES (?, ?, ?, ?, ?, 'Present')
-        ''', (student_id, student['name'], student['department'], today, current_time))
-        conn.commit()
-        conn.close()
-        
-        print(f"✅ Successfully marked attendance for: {student['name']} at {current_time}")
-        
+        print(f"⚠️ Already marked today: {student['name']}")
         return jsonify({
-            'status': 'success',
-            'message': f'Attendance marked for {student["name"]}',
-            'student': {
-                'student_id': student['student_id'],
-                'name': student['name'],
-                'time': current_time
-            }
+            'status': 'already_marked',
+            'message': f'{student["name"]} is already marked present today',
+            'student': student
         })
     except Exception as e:
         print(f"❌ Error in mark_attendance: {e}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/attendance/batch', methods=['POST'])
+@login_required
+def mark_attendance_batch():
+    """Mark many students in one transaction
+
+    Body: {"marks": [{"student_id": "...", "timestamp": 1718000000000}, ...]}
+    (timestamp optional) or {"student_ids": [...]}. Returns one result per
+    mark, in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    marks = data.get('marks')
+    if marks is None:
+        marks = [{'student_id': student_id} for student_id in data.get('student_ids') or []]
+    
+    if not isinstance(marks, list) or not marks:
+        return jsonify({'status': 'error', 'message': 'No marks provided'})
+    if len(marks) > ATTENDANCE_BATCH_LIMIT:
+        return jsonify({'status': 'error',
+                        'message': f'At most {ATTENDANCE_BATCH_LIMIT} marks per batch'})
+    
+    now = datetime.now()
+    results = [None] * len(marks)
+    valid, positions = [], []
+    for i, mark in enumerate(marks):
+        student_id = mark.get('student_id') if isinstance(mark, dict) else None
+        if not student_id:
+            results[i] = {'student_id': student_id, 'status': 'error',
+                          'message': 'No student ID provided'}
+            continue
+        try:
+            day, mark_time = resolve_mark_time(mark.get('timestamp'), now)
+        except ValueError as e:
+            results[i] = {'student_id': student_id, 'status': 'error', 'message': str(e)}
+            continue
+        valid.append((str(student_id), day, mark_time))
+        positions.append(i)
+    
+    try:
+        if valid:
+            for i, result in zip(positions, mark_attendance_rows(get_db_connection(), valid)):
+                results[i] = result
+    except Exception as e:
+        print(f"❌ Error in attendance batch: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+    
+    counts = {'success': 0, 'already_marked': 0, 'not_found': 0, 'error': 0}
+    for result in results:
+        counts[result['status']] += 1
+    print(f"✅ Attendance batch: {counts['success']} marked, "
+          f"{counts['already_marked']} already marked, "
+          f"{counts['not_found'] + counts['error']} rejected")
+    
+    return jsonify({
+        'status': 'success',
+        'marked': counts['success'],
+        'already_marked': counts['already_marked'],
+        'rejected': counts['not_found'] + counts['error'],
+        'results': results
+    })
+
+def sse_message(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+@app.route('/api/attendance/stream')
+@login_required
+def attendance_stream():
+    """Server-Sent Events: one 'mark' event per attendance mark, as it is committed
+
+    Browsers resume with the Last-Event-ID header after a reconnect; a
+    'reset' event means events were missed and the client should reload.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    def generate():
+        yield 'retry: 3000\n\n'
+        for event in attendance_events.listen(last_event_id, heartbeat=ATTENDANCE_STREAM_HEARTBEAT,
+                                              max_seconds=ATTENDANCE_STREAM_MAX_SECONDS):
+            yield ': keep-alive\n\n' if event is None else sse_message(*event)
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/attendance/stream/stats')
+@login_required
+def attendance_stream_stats():
+    """Event stream metrics for this worker process"""
+    return jsonify(attendance_events.stats())
+
 @app.route('/api/attendance_today')
 @login_required
 def get_attendance_today():
-    """Get today's attendance summary"""
+    """Get today's attendance summary, with per-department and per-section counts
+
+    last_event_id is where a client should start /api/attendance/stream to
+    receive every mark made after this summary.
+    """
+    return jsonify(today_stats.snapshot())
+
+@app.route('/api/db/pool')
+@login_required
+def db_pool_stats():
+    """Connection pool metrics for this worker process"""
+    return jsonify(db_pool.stats())
+
+@app.route('/api/attendance/writer/stats')
+@login_required
+def attendance_writer_stats():
+    """Write-behind mark queue metrics for this worker process"""
+    return jsonify(attendance_writer.stats())
+
+# ==================== MAINTENANCE COMMANDS ====================
+
+@app.cli.command('migrate-descriptors')
+def migrate_descriptors_command():
+    """Rewrite JSON/legacy encoding_data rows into the packed float32 format"""
     conn = get_db_connection()
-    today = date.today().strftime('%Y-%m-%d')
+    rows = conn.execute('SELECT id, student_id, encoding_data FROM students WHERE encoding_data IS NOT NULL').fetchall()
     
-    total = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
-    present = conn.execute(
-        'SELECT COUNT(DISTINCT student_id) FROM attendance WHERE date = ?',
-        (today,)
-    ).fetchone()[0]
+    converted = crops = skipped = 0
+    for row in rows:
+        raw_data = row['encoding_data']
+        if is_packed(raw_data):
+            continue
+        kind, value = decode_legacy(raw_data)
+        if kind == 'descriptor':
+            conn.execute('UPDATE students SET encoding_data = ? WHERE id = ?',
+                        (encode_descriptors(value), row['id']))
+            converted += 1
+        elif kind == 'crop':
+            # Not a descriptor: keep it for LBPH training in its own column
+            conn.execute('UPDATE students SET face_crop = ?, encoding_data = NULL WHERE id = ?',
+                        (value.tobytes(), row['id']))
+            crops += 1
+        else:
+            print(f"✗ Unrecognised encoding for {row['student_id']}, left unchanged")
+            skipped += 1
+    conn.commit()
     
-    conn.close()
+    before = conn.execute('PRAGMA page_count').fetchone()[0]
+    conn.execute('VACUUM')
+    after = conn.execute('PRAGMA page_count').fetchone()[0]
     
-    return jsonify({
-        'date': today,
-        'total_students': total,
-        'present': present,
-        'absent': total - present
-    })
+    face_gallery.loaded = False
+    print(f"✓ Converted {converted} descriptors, moved {crops} legacy crops, skipped {skipped}")
+    print(f"✓ Database pages: {before} -> {after}")
+
+@app.cli.command('import-students')
+@click.argument('roster', type=click.Path(exists=True, dir_okay=False))
+@click.argument('photos', type=click.Path(exists=True))
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False),
+              help='Write the per-row report to this CSV file')
+def import_students_command(roster, photos, report_path):
+    """Enrol students from ROSTER (CSV) and PHOTOS (directory or zip); safe to re-run"""
+    with open(roster, newline='', encoding='utf-8-sig') as f:
+        report, counts = run_bulk_import(f, photos)
+    
+    for entry in report:
+        if entry['status'] == 'error':
+            print(f"✗ Row {entry['row']} ({entry['student_id'] or 'no ID'}): {entry['message']}")
+    if report_path:
+        with open(report_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['row', 'student_id', 'status', 'message'])
+            writer.writeheader()
+            writer.writerows(report)
+        print(f"✓ Report written to {report_path}")
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+def calendar_dates(start, end, weekdays):
+    """Dates from start to end inclusive (YYYY-MM-DD) falling on the given weekday names"""
+    try:
+        first = datetime.strptime(start, '%Y-%m-%d').date()
+        last = datetime.strptime(end or start, '%Y-%m-%d').date()
+    except ValueError:
+        raise click.BadParameter('Dates must be YYYY-MM-DD')
+    days = {WEEKDAYS.index(day.strip().lower()[:3]) for day in weekdays.split(',')
+            if day.strip().lower()[:3] in WEEKDAYS}
+    return [date.fromordinal(n).strftime('%Y-%m-%d') for n in range(first.toordinal(), last.toordinal() + 1)
+            if date.fromordinal(n).weekday() in days]
+
+@app.cli.group('calendar')
+def calendar_command():
+    """Working-day calendar used for attendance percentages"""
+
+def set_calendar_auto(conn, auto):
+    """Switch adding the days attendance is taken on to the calendar on or off"""
+    changed = conn.execute('UPDATE calendar_state SET auto = ? WHERE id = 1 AND auto != ?',
+                           (int(auto), int(auto))).rowcount
+    if changed and auto:
+        print("✓ Days attendance is taken on are added to the calendar again")
+    elif changed:
+        print("✓ Calendar is now managed manually: marks on other days no longer add working days")
+
+@calendar_command.command('add')
+@click.argument('start')
+@click.argument('end', required=False)
+@click.option('--term', default='', help='Term name stored with the days')
+@click.option('--weekdays', default='mon,tue,wed,thu,fri', show_default=True,
+              help='Comma-separated weekdays to add within the range')
+@click.option('--note', default='', help='Free-text note stored with the days')
+def calendar_add_command(start, end, term, weekdays, note):
+    """Add the working days from START to END (inclusive)"""
+    days = calendar_dates(start, end, weekdays)
+    if not days:
+        print("✗ No matching days in that range")
+        return
+    conn = get_db_connection()
+    set_calendar_auto(conn, False)
+    existing = {row[0] for row in conn.execute(
+        'SELECT date FROM working_days WHERE date BETWEEN ? AND ?', (days[0], days[-1]))}
+    # Re-adding a day only updates its term and note
+    conn.executemany('''
+        INSERT INTO working_days (date, term, note) VALUES (?, ?, ?)
+        ON CONFLICT(date) DO UPDATE SET term = excluded.term, note = excluded.note
+    ''', [(day, term, note) for day in days])
+    conn.commit()
+    print(f"✓ Added {len(set(days) - existing)} working days from {days[0]} to {days[-1]}"
+          f" ({len(set(days) & existing)} already in the calendar)")
+
+@calendar_command.command('remove')
+@click.argument('start')
+@click.argument('end', required=False)
+@click.option('--weekdays', default=','.join(WEEKDAYS), help='Only remove these weekdays (default: every day)')
+def calendar_remove_command(start, end, weekdays):
+    """Remove working days (holidays, cancelled days) from START to END"""
+    days = calendar_dates(start, end, weekdays)
+    conn = get_db_connection()
+    set_calendar_auto(conn, False)
+    removed = sum(conn.execute('DELETE FROM working_days WHERE date = ?', (day,)).rowcount for day in days)
+    conn.commit()
+    print(f"✓ Removed {removed} working days")
+
+@calendar_command.command('auto')
+@click.argument('mode', type=click.Choice(['on', 'off']), required=False)
+def calendar_auto_command(mode):
+    """Show or set whether days attendance is taken on become working days"""
+    conn = get_db_connection()
+    if mode is not None:
+        set_calendar_auto(conn, mode == 'on')
+        conn.commit()
+    auto = conn.execute('SELECT auto FROM calendar_state WHERE id = 1').fetchone()[0]
+    print(f"✓ Automatic calendar is {'on' if auto else 'off'}")
+
+@calendar_command.command('list')
+@click.option('--term', default=None, help='Only days of this term')
+@click.option('--from', 'start', default=None, help='First date (YYYY-MM-DD)')
+@click.option('--to', 'end', default=None, help='Last date (YYYY-MM-DD)')
+def calendar_list_command(term, start, end):
+    """Print the working days with their term and note"""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT date, term, note FROM working_days
+        WHERE (? IS NULL OR term = ?) AND date >= COALESCE(?, '') AND date <= COALESCE(?, '9999-12-31')
+        ORDER BY date
+    ''', (term, term, start, end)).fetchall()
+    for row in rows:
+        print('  '.join(value for value in (row['date'], row['term'], row['note']) if value))
+    print(f"✓ {len(rows)} working days")
 
 # ==================== MAIN ENTRY POINT ====================
 
@@ -955,9 +2219,6 @@ if __name__ == '__main__':
     # Initialize database
     init_db()
     
-    # Create reports directory
-    os.makedirs('static/reports', exist_ok=True)
-    
     print("="*60)
     print("SMART ATTENDANCE SYSTEM")
     print("="*60)
@@ -0,0 +1,85 @@
+"""
+Write-behind Attendance Queue
+Smart Attendance System
+
+When a whole class walks past the camera, every /mark_attendance request
+would otherwise commit (and fsync) on its own. Marks submitted here are
+collected by one background thread for a short window and written by a
+single handler call, i.e. one transaction for the whole group. Each caller
+still gets its own result through a Future.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteBehindQueue:
+    """Coalesce items arriving within `window` seconds into one handler call"""
+
+    def __init__(self, handler, window=0.02, max_batch=200):
+        # handler(items) -> list of results, one per item, in order
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self._pid = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._metrics = {'items': 0, 'batches': 0, 'largest_batch': 0, 'failed_batches': 0, 'failed_items': 0}
+
+    def _ensure_started(self):
+        # Started lazily, and again in each forked gunicorn worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, item):
+        """Queue one item; the returned Future resolves after its batch commits"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.handler(items)
+            except Exception as e:
+                self._metrics['failed_batches'] += 1
+                self._metrics['failed_items'] += len(batch)
+                print(f"❌ Attendance write of {len(batch)} marks failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self._metrics['items'] += len(batch)
+            self._metrics['batches'] += 1
+            self._metrics['largest_batch'] = max(self._metrics['largest_batch'], len(batch))
+
+    def stats(self):
+        return dict(self._metrics, window_ms=self.window * 1000, max_batch=self.max_batch,
+                    queued=self._queue.qsize() if self._queue is not None else 0)
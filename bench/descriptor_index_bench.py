@@ -0,0 +1,100 @@
+"""
+Descriptor Index Benchmark
+Smart Attendance System
+
+Times FlatIndex and IVFIndex searches in-process, without HTTP, on a
+synthetic gallery shaped like face-api.js descriptors: random students
+about 1.0 apart, queried with captures about 0.35 from their enrolled
+descriptor (the default RECOGNITION_THRESHOLD is 0.6).
+
+For every batch size and nprobe it reports the search time per call and
+per query, and IVF recall@1 against the exact flat result.
+
+    python bench/descriptor_index_bench.py --size 100000 --batches 1,10,50 --nprobe 4,8,16
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from descriptor_index import DESCRIPTOR_SIZE, create_index  # noqa: E402
+
+
+def parse_list(text):
+    return [int(value) for value in text.split(',') if value.strip()]
+
+
+def time_search(index, queries, batch, repeat, **options):
+    """Median seconds per search() call of `batch` queries, and the keys found"""
+    timings, keys = [], []
+    for start in range(0, len(queries), batch):
+        chunk = queries[start:start + batch]
+        if len(chunk) < batch:
+            break
+        for _ in range(repeat):
+            began = time.perf_counter()
+            found, _ = index.search(chunk, k=1, **options)
+            timings.append(time.perf_counter() - began)
+        keys.extend(row[0] if row else None for row in found)
+    return float(np.median(timings)), keys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Flat vs IVF descriptor search latency and recall')
+    parser.add_argument('--size', type=int, default=100000, help='Descriptors in the gallery')
+    parser.add_argument('--queries', type=int, default=500, help='Queries per configuration')
+    parser.add_argument('--batches', default='1,10,50', help='Queries per search() call')
+    parser.add_argument('--nprobe', default='4,8,16', help='IVF lists scanned per query')
+    parser.add_argument('--nlist', type=int, default=0, help='IVF lists (0 = about sqrt(size))')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', default=None, help='Write results to this file')
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    gallery = rng.normal(0.0, 1.0 / np.sqrt(2 * DESCRIPTOR_SIZE),
+                         size=(args.size, DESCRIPTOR_SIZE)).astype(np.float32)
+    targets = rng.choice(args.size, args.queries, replace=False)
+    queries = (gallery[targets] + rng.normal(0.0, 0.35 / np.sqrt(DESCRIPTOR_SIZE),
+                                             size=(args.queries, DESCRIPTOR_SIZE))).astype(np.float32)
+    keys = [f'S{i}' for i in range(args.size)]
+
+    flat = create_index('flat')
+    flat.build(keys, gallery)
+    began = time.perf_counter()
+    ivf = create_index('ivf', nlist=args.nlist)
+    ivf.build(keys, gallery)
+    print(f"✓ {args.size} descriptors; IVF trained with {len(ivf.centroids)} lists "
+          f"in {time.perf_counter() - began:.1f}s")
+
+    results = []
+    print(f"{'index':<10} {'batch':>5} {'ms/call':>9} {'ms/query':>9} {'recall@1':>9}")
+    for batch in parse_list(args.batches):
+        seconds, exact = time_search(flat, queries, batch, args.repeat)
+        rows = [('flat', None, seconds, 1.0)]
+        for nprobe in parse_list(args.nprobe):
+            seconds, found = time_search(ivf, queries, batch, args.repeat, nprobe=nprobe)
+            recall = float(np.mean([a == b for a, b in zip(found, exact)]))
+            rows.append((f'ivf/{nprobe}', nprobe, seconds, recall))
+        for name, nprobe, seconds, recall in rows:
+            print(f"{name:<10} {batch:>5} {seconds * 1000:>9.3f} {seconds * 1000 / batch:>9.3f} {recall:>9.3f}")
+            results.append({'index': 'flat' if nprobe is None else 'ivf', 'nprobe': nprobe, 'batch': batch,
+                            'ms_per_call': round(seconds * 1000, 3),
+                            'ms_per_query': round(seconds * 1000 / batch, 3), 'recall_at_1': round(recall, 4)})
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'size': args.size, 'nlist': len(ivf.centroids), 'queries': args.queries,
+                       'cpus': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"✓ Results written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark Data Generator
+Smart Attendance System
+
+Fills a fresh database with N students and M working days of attendance,
+the same way the app would store them (schema and migrations from
+init_db(), descriptors through write_student_samples(), attendance rows
+through the triggers that maintain the rollups and student stats).
+
+The output only depends on the arguments: the same --seed, sizes and
+--end date always produce the same rows. --end defaults to yesterday so
+"today" stays free for the load driver's marks.
+
+    python bench/generate_data.py --db bench/attendance.db --students 2000 --days 120
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def working_days(end, count):
+    """The `count` weekdays up to and including `end`, oldest first"""
+    days, day = [], end
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return [day.strftime('%Y-%m-%d') for day in reversed(days)]
+
+
+def generate(conn, app, students, days, seed, departments, sections):
+    """Insert students (with a random 128-d descriptor each) and their attendance"""
+    rng = np.random.default_rng(seed)
+    enrolled = f'{days[0]} 00:00:00' if days else None
+
+    roster = []
+    for i in range(students):
+        roster.append((f'S{i + 1:05d}', f'Student {i + 1}', departments[i % len(departments)],
+                       str(1 + (i // len(departments)) % 4), sections[(i // 7) % len(sections)]))
+    conn.executemany('''
+        INSERT INTO students (student_id, name, department, year, section, image_path, created_at)
+        VALUES (?, ?, ?, ?, ?, NULL, ?)
+    ''', [row + (enrolled,) for row in roster])
+
+    # face-api.js descriptors are unnormalised with components around +-0.1
+    descriptors = rng.normal(0.0, 0.1, size=(students, app.DESCRIPTOR_SIZE)).astype(np.float32)
+    for (student_id, *_), descriptor in zip(roster, descriptors):
+        app.write_student_samples(conn, student_id, descriptor[None], descriptor)
+    conn.commit()
+
+    # Each student has their own attendance rate, so some fall below 75%
+    rates = rng.beta(8, 2, size=students)
+    for day in days:
+        present = np.flatnonzero(rng.random(students) < rates)
+        seconds = rng.integers(8 * 3600 + 1800, 10 * 3600, size=len(present))
+        conn.executemany('''
+            INSERT INTO attendance (student_id, name, department, date, time, status)
+            VALUES (?, ?, ?, ?, ?, 'Present')
+        ''', [(roster[i][0], roster[i][1], roster[i][2], day,
+               f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}') for i, s in zip(present, seconds)])
+        conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fill a database with synthetic students and attendance')
+    parser.add_argument('--db', default=os.path.join('bench', 'attendance.db'), help='Database file to create')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=120, help='Working days (Mon-Fri) of attendance')
+    parser.add_argument('--end', default=None, help='Last attendance day, YYYY-MM-DD (default: yesterday)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--departments', default='CSE,ECE,EEE,MECH,CIVIL')
+    parser.add_argument('--sections', default='A,B,C')
+    parser.add_argument('--overwrite', action='store_true', help='Replace an existing database file')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.overwrite:
+            parser.error(f'{args.db} exists; pass --overwrite to replace it')
+        os.remove(args.db)
+    end = (datetime.strptime(args.end, '%Y-%m-%d').date() if args.end
+           else date.today() - timedelta(days=1))
+
+    # The app creates the schema on import, against DATABASE_PATH
+    os.environ['DATABASE_PATH'] = os.path.abspath(args.db)
+    sys.path.insert(0, ROOT)
+    import app
+
+    started = time.perf_counter()
+    days = working_days(end, args.days)
+    with app.db_pool.connection() as conn:
+        generate(conn, app, args.students, days, args.seed,
+                 args.departments.split(','), args.sections.split(','))
+        rows = conn.execute('SELECT COUNT(*) FROM attendance').fetchone()[0]
+    print(f"✓ {args.students} students, {len(days)} days ({days[0] if days else '-'} to "
+          f"{days[-1] if days else '-'}), {rows} attendance rows in {time.perf_counter() - started:.1f}s")
+    print(f"✓ Written to {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+"""
+HTTP Load Driver
+Smart Attendance System
+
+Replays a weighted mix of the app's hot requests from several client
+threads and reports p50/p95/p99 latency per operation plus throughput:
+
+- mark         POST /mark_attendance for a random enrolled student
+- status       GET  /get_attendance_status
+- descriptors  GET  /api/students/descriptors, half of them revalidating
+               with the client's last ETag (304) like the attendance page
+- view         GET  /view_attendance with a random filter
+- report       POST /reports (monthly CSV), polled until the job is done,
+               then downloaded; timed end to end
+
+By default requests go through Flask's test client in this process,
+against a copy of --db so every run starts from the same data. With
+--url they go to a running server (e.g. gunicorn) over HTTP instead.
+
+Results can be saved (--save) and compared against a saved baseline
+(--compare): the run fails when an operation's p95 is more than
+--tolerance slower than the baseline's. A baseline recorded with another
+request config (target, requests, clients, mix, seed, data size) or CPU
+count is refused before the run, since its latencies are not comparable;
+--force compares anyway, with a warning.
+
+    python bench/load_test.py --db bench/attendance.db --requests 2000 --clients 8 \\
+        --compare bench/baseline.json
+"""
+
+import argparse
+import contextlib
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = 'mark=40,status=25,descriptors=15,view=15,report=5'
+PERCENTILES = (50, 95, 99)
+
+
+# ---------- clients: (status code, headers, body bytes) per request ----------
+
+class TestClient:
+    """Flask test client, logged in as the default admin"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, json_body=None, headers=None):
+        response = self.client.open(path, method=method, data=form, json=json_body, headers=headers or {})
+        return response.status_code, response.headers, response.get_data()
+
+
+class HttpClient:
+    """urllib client with a cookie jar, for a server started separately"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, form=None, json_body=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+
+def login(client):
+    status, _, _ = client.request('POST', '/login', form={'username': 'admin', 'password': 'admin123'})
+    if status >= 400:
+        raise RuntimeError(f'Login failed with HTTP {status}')
+
+
+# ---------- operations: return True on success ----------
+
+def json_ok(status, body):
+    if status >= 400:
+        return False
+    try:
+        return json.loads(body).get('status') != 'error'
+    except (ValueError, AttributeError):
+        return True
+
+
+def op_mark(client, ctx, rng):
+    student_id = rng.choice(ctx['students'])
+    status, _, body = client.request('POST', '/mark_attendance', json_body={'student_id': student_id})
+    return json_ok(status, body)
+
+
+def op_status(client, ctx, rng):
+    status, _, body = client.request('GET', '/get_attendance_status')
+    return json_ok(status, body)
+
+
+def op_descriptors(client, ctx, rng):
+    headers = {}
+    if getattr(ctx['local'], 'etag', None) and rng.random() < 0.5:
+        headers['If-None-Match'] = ctx['local'].etag
+    status, response_headers, _ = client.request('GET', '/api/students/descriptors', headers=headers)
+    if status == 200:
+        ctx['local'].etag = response_headers.get('ETag')
+    return status in (200, 304)
+
+
+def op_view(client, ctx, rng):
+    choice = rng.random()
+    if choice < 0.3:
+        query = ''
+    elif choice < 0.55:
+        query = '?' + urllib.parse.urlencode({'department': rng.choice(ctx['departments'])})
+    elif choice < 0.8:
+        query = '?' + urllib.parse.urlencode({'date': rng.choice(ctx['days'])})
+    else:
+        query = '?' + urllib.parse.urlencode({'section': rng.choice(ctx['sections'])})
+    status, _, _ = client.request('GET', '/view_attendance' + query)
+    return status == 200
+
+
+def op_report(client, ctx, rng):
+    month = rng.choice(ctx['months'])
+    status, _, body = client.request('POST', '/reports', form={
+        'report_type': 'monthly', 'month': month, 'export_format': 'csv'})
+    if not json_ok(status, body):
+        return False
+    payload = json.loads(body)
+    deadline = time.monotonic() + 60
+    while payload['job']['state'] in ('queued', 'running'):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+        status, _, body = client.request('GET', f"/api/jobs/{payload['job']['id']}")
+        if not json_ok(status, body):
+            return False
+        payload = json.loads(body)
+    if payload['job']['state'] != 'done':
+        return False
+    status, _, _ = client.request('GET', payload['download_url'])
+    return status == 200
+
+
+OPERATIONS = {
+    'mark': op_mark,
+    'status': op_status,
+    'descriptors': op_descriptors,
+    'view': op_view,
+    'report': op_report,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# ---------- running ----------
+
+def read_context(db_path):
+    """Student ids, departments, sections, days and months to draw requests from"""
+    conn = sqlite3.connect(db_path)
+    try:
+        students = [row[0] for row in conn.execute('SELECT student_id FROM students ORDER BY id')]
+        departments = [row[0] for row in conn.execute('SELECT DISTINCT department FROM students ORDER BY 1')]
+        sections = [row[0] for row in conn.execute('SELECT DISTINCT section FROM students ORDER BY 1')]
+        days = [row[0] for row in conn.execute(
+            'SELECT DISTINCT date FROM attendance_department_daily ORDER BY date')]
+    finally:
+        conn.close()
+    if not students or not days:
+        raise SystemExit('✗ The database has no students or attendance; run bench/generate_data.py first')
+    return {'students': students, 'departments': departments, 'sections': sections, 'days': days,
+            'months': sorted({day[:7] for day in days})}
+
+
+def run(make_client, ctx, mix, total, clients, seed):
+    """Issue `total` requests from `clients` threads; returns (samples by op, errors by op, seconds)"""
+    # The schedule is fixed up front, so a seed always replays the same requests
+    names, weights = list(mix), list(mix.values())
+    schedule = random.Random(seed).choices(names, weights=weights, k=total)
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    ctx = dict(ctx, local=threading.local())
+    position = iter(range(total))
+
+    def worker(index):
+        client = make_client()
+        login(client)
+        rng = random.Random(seed * 1000 + index)
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            name = schedule[i]
+            started = time.perf_counter()
+            try:
+                ok = OPERATIONS[name](client, ctx, rng)
+            except Exception as e:
+                print(f"✗ {name}: {e}", file=sys.__stderr__)
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f'bench-{i}') for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+
+def summarize(samples, errors, seconds):
+    ops = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        ms = np.array(values) * 1000
+        ops[name] = {'count': len(values), 'errors': errors[name],
+                     **{f'p{p}_ms': round(float(np.percentile(ms, p)), 2) for p in PERCENTILES},
+                     'max_ms': round(float(ms.max()), 2)}
+    count = sum(len(values) for values in samples.values())
+    return {'requests': count, 'errors': sum(errors.values()), 'seconds': round(seconds, 2),
+            'throughput_rps': round(count / seconds, 1) if seconds else 0.0, 'ops': ops}
+
+
+def print_report(result):
+    print(f"{'operation':<12} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, op in result['ops'].items():
+        print(f"{name:<12} {op['count']:>6} {op['errors']:>6} {op['p50_ms']:>8.2f} {op['p95_ms']:>8.2f} "
+              f"{op['p99_ms']:>8.2f} {op['max_ms']:>8.2f}")
+    print(f"{result['requests']} requests in {result['seconds']}s: {result['throughput_rps']} req/s, "
+          f"{result['errors']} errors")
+
+
+def baseline_mismatches(baseline, config, machine):
+    """Describe how a baseline's config and CPU count differ from this run's"""
+    before = baseline.get('config') or {}
+    mismatches = [f"{key}: {before.get(key)!r} (baseline) vs {value!r}"
+                  for key, value in config.items() if before.get(key) != value]
+    cpus = (baseline.get('machine') or {}).get('cpus')
+    if cpus != machine['cpus']:
+        mismatches.append(f"cpus: {cpus!r} (baseline) vs {machine['cpus']!r}")
+    return mismatches
+
+
+def compare(result, baseline, tolerance):
+    """Print p95 changes against a baseline; returns the names of regressed operations"""
+    regressed = []
+    for name, op in result['ops'].items():
+        before = baseline['ops'].get(name)
+        if not before:
+            continue
+        ratio = op['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1.0
+        mark = '✗' if ratio > 1 + tolerance else '✓'
+        print(f"{mark} {name:<12} p95 {before['p95_ms']:.2f} -> {op['p95_ms']:.2f} ms ({(ratio - 1) * 100:+.0f}%)")
+        if ratio > 1 + tolerance:
+            regressed.append(name)
+    before, after = baseline['throughput_rps'], result['throughput_rps']
+    if before:
+        print(f"  throughput {before} -> {after} req/s ({(after / before - 1) * 100:+.0f}%)")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a request mix and report latency percentiles')
+    parser.add_argument('--db', default=os.path.join('bench', 'attendance.db'),
+                        help='Generated database (bench/generate_data.py)')
+    parser.add_argument('--url', default=None, help='Base URL of a running server instead of the test client')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent client threads')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Operation weights (default {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', default=None, help='Write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed p95 slowdown against the baseline (0.25 = 25%%)')
+    parser.add_argument('--force', action='store_true',
+                        help='Compare even when the baseline was recorded with another config or CPU count')
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's request logging")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} not found; run bench/generate_data.py first')
+    ctx = read_context(args.db)
+    config = {'target': args.url or 'test-client', 'requests': args.requests, 'clients': args.clients,
+              'mix': mix, 'seed': args.seed, 'students': len(ctx['students']), 'days': len(ctx['days'])}
+    machine = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        mismatches = baseline_mismatches(baseline, config, machine)
+        if mismatches:
+            print(f"{'⚠️' if args.force else '✗'} {args.compare} was recorded under different conditions:")
+            for mismatch in mismatches:
+                print(f"  {mismatch}")
+            if not args.force:
+                print("✗ Not comparable: match the baseline's options, re-record it with --save on this "
+                      "machine, or pass --force")
+                sys.exit(2)
+
+    workdir = None
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        # Marks and reports write to the database: run against a copy
+        workdir = tempfile.mkdtemp(prefix='attendance-bench-')
+        db_copy = os.path.join(workdir, 'attendance.db')
+        source, target = sqlite3.connect(args.db), sqlite3.connect(db_copy)
+        source.backup(target)
+        source.close()
+        target.close()
+        os.environ['DATABASE_PATH'] = db_copy
+        os.environ.setdefault('REPORT_CACHE_DIR', os.path.join(workdir, 'report_cache'))
+        sys.path.insert(0, ROOT)
+        import app
+        make_client = lambda: TestClient(app.app)
+
+    try:
+        quiet = open(os.devnull, 'w') if not args.verbose else None
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            samples, errors, seconds = run(make_client, ctx, mix, args.requests, args.clients, args.seed)
+        if quiet:
+            quiet.close()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = summarize(samples, errors, seconds)
+    result['config'] = config
+    result['machine'] = machine
+    result['recorded_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    print_report(result)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"✓ Results saved to {args.save}")
+    if baseline is not None:
+        regressed = compare(result, baseline, args.tolerance)
+        if regressed:
+            print(f"✗ p95 regressed by more than {args.tolerance:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
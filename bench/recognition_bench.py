@@ -0,0 +1,229 @@
+"""
+Recognition Pipeline Benchmark
+Smart Attendance System
+
+Times the server-side recognition path of /video_feed one stage at a
+time, on frames replayed from a video file, an image directory or the
+synthetic generator (video_pipeline.open_source with pacing off):
+
+- decode     read the next frame from the source
+- resize     scale it to the configured resolution (0 at native size)
+- detect     grayscale conversion + Haar detectMultiScale
+- recognize  100x100 crop + LBPH predict for every face
+- draw       boxes, labels and the watermark
+- encode     JPEG encoding at --jpeg-quality
+
+Every combination of --resolutions, --scale-factors and --min-neighbors
+is run over the same frames, single-threaded, and reported as per-stage
+mean/p50/p95, frames per second and faces per second. --json writes the
+results for tracking across commits.
+
+Synthetic frames contain no face, so they time decode, resize, detect,
+draw and encode only: recognize stays at 0 ms and faces/s at 0. Pass
+--source with a video or photos of faces to measure recognition.
+
+LBPH prediction cost grows with the number of trained samples: --model
+loads the app's saved model (LBPH_MODEL_PATH), otherwise a stand-in is
+trained on --identities random crops.
+
+    python bench/recognition_bench.py --source path/to/photos --frames 200 \\
+        --resolutions 640x480,1280x720 --scale-factors 1.1,1.3 --json recognition.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from video_pipeline import draw_annotations, draw_watermark, open_source  # noqa: E402
+
+STAGES = ('decode', 'resize', 'detect', 'recognize', 'draw', 'encode')
+
+
+def parse_list(text, convert):
+    return [convert(value.strip()) for value in text.split(',') if value.strip()]
+
+
+def parse_resolution(value):
+    """'640x480' -> (640, 480); 'native' -> None"""
+    if value == 'native':
+        return None
+    width, _, height = value.lower().partition('x')
+    return int(width), int(height)
+
+
+def load_recognizer(model_path, identities, seed):
+    """The app's saved LBPH model, or one trained on random crops (returns recognizer, samples)"""
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    if model_path:
+        recognizer.read(model_path)
+        return recognizer, len(recognizer.getHistograms())
+    rng = np.random.default_rng(seed)
+    crops = [rng.integers(0, 256, size=(100, 100), dtype=np.uint8) for _ in range(identities)]
+    recognizer.train(crops, np.arange(identities, dtype=np.int32))
+    return recognizer, identities
+
+
+def run_config(source_spec, frames, resolution, scale_factor, min_neighbors, min_size,
+               cascade, recognizer, jpeg_quality, warmup):
+    """Time every stage over `frames` frames; returns {stage: [seconds]} and the face count"""
+    timings = {stage: [] for stage in STAGES}
+    faces = 0
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+    source = open_source(source_spec, realtime=False)
+    try:
+        for i in range(warmup + frames):
+            marks = [time.perf_counter()]
+            ok, frame = source.read()
+            if not ok:
+                raise ValueError(f'Source {source_spec} ended after {i} frames; pass fewer --frames')
+            marks.append(time.perf_counter())
+
+            if resolution is not None and (frame.shape[1], frame.shape[0]) != resolution:
+                frame = cv2.resize(frame, resolution, interpolation=cv2.INTER_AREA)
+            marks.append(time.perf_counter())
+
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            boxes = cascade.detectMultiScale(gray, scale_factor, min_neighbors,
+                                             minSize=(min_size, min_size))
+            marks.append(time.perf_counter())
+
+            annotations = []
+            for box in boxes:
+                x, y, w, h = (int(v) for v in box)
+                label, confidence = recognizer.predict(cv2.resize(gray[y:y+h, x:x+w], (100, 100)))
+                known = confidence < 100
+                annotations.append((x, y, w, h, str(label) if known else 'Unknown',
+                                    (0, 255, 0) if known else (0, 0, 255)))
+            marks.append(time.perf_counter())
+
+            frame = frame.copy()
+            draw_annotations(frame, annotations)
+            draw_watermark(frame)
+            marks.append(time.perf_counter())
+
+            cv2.imencode('.jpg', frame, params)
+            marks.append(time.perf_counter())
+
+            if i >= warmup:
+                faces += len(boxes)
+                for stage, started, finished in zip(STAGES, marks, marks[1:]):
+                    timings[stage].append(finished - started)
+    finally:
+        source.release()
+    return timings, faces
+
+
+def summarize(timings, faces):
+    total = sum(sum(values) for values in timings.values())
+    frames = len(timings['decode'])
+    stages = {}
+    for stage, values in timings.items():
+        ms = np.array(values) * 1000
+        stages[stage] = {'mean_ms': round(float(ms.mean()), 3), 'p50_ms': round(float(np.percentile(ms, 50)), 3),
+                         'p95_ms': round(float(np.percentile(ms, 95)), 3)}
+    return {'frames': frames, 'faces': faces, 'faces_per_frame': round(faces / frames, 2) if frames else 0,
+            'fps': round(frames / total, 1) if total else 0.0,
+            'faces_per_sec': round(faces / total, 1) if total else 0.0,
+            'frame_ms': round(total / frames * 1000, 2) if frames else 0.0, 'stages': stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-stage timings of the server recognition path')
+    parser.add_argument('--source', default='synthetic',
+                        help="Video file, image directory or 'synthetic' (default; has no faces, so "
+                             "recognize and faces/s need a --source with faces)")
+    parser.add_argument('--frames', type=int, default=200, help='Frames timed per configuration')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed frames before each configuration')
+    parser.add_argument('--resolutions', default='640x480',
+                        help="Comma-separated WIDTHxHEIGHT list, or 'native'")
+    parser.add_argument('--scale-factors', default='1.3', help='Haar scaleFactor values (app: 1.3)')
+    parser.add_argument('--min-neighbors', default='5', help='Haar minNeighbors values (app: 5)')
+    parser.add_argument('--min-size', type=int, default=0, help='Haar minSize in pixels (app: none)')
+    parser.add_argument('--model', default=None, help='Saved LBPH model (LBPH_MODEL_PATH) to predict with')
+    parser.add_argument('--identities', type=int, default=200,
+                        help='Samples in the stand-in LBPH model when no --model is given')
+    parser.add_argument('--jpeg-quality', type=int, default=80, help='JPEG quality (app: VIDEO_JPEG_QUALITY)')
+    parser.add_argument('--threads', type=int, default=None, help='cv2.setNumThreads() value')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', default=None, help="Write results to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        resolutions = parse_list(args.resolutions, parse_resolution)
+        scale_factors = parse_list(args.scale_factors, float)
+        min_neighbors = parse_list(args.min_neighbors, int)
+    except ValueError as e:
+        parser.error(f'Bad list value: {e}')
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+
+    try:
+        open_source(args.source, realtime=False).release()
+    except ValueError as e:
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(1)
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    recognizer, samples = load_recognizer(args.model, args.identities, args.seed)
+    log = sys.stderr if args.json_path == '-' else sys.stdout
+
+    results = []
+    print(f"{'resolution':<11} {'scale':>5} {'neigh':>5} {'fps':>7} {'faces/s':>8} "
+          + ' '.join(f'{stage:>9}' for stage in STAGES) + '   (mean ms)', file=log)
+    for resolution, scale_factor, neighbors in itertools.product(resolutions, scale_factors, min_neighbors):
+        try:
+            timings, faces = run_config(args.source, args.frames, resolution, scale_factor, neighbors,
+                                        args.min_size, cascade, recognizer, args.jpeg_quality, args.warmup)
+        except ValueError as e:
+            print(f"✗ {e}", file=sys.stderr)
+            sys.exit(1)
+        summary = summarize(timings, faces)
+        label = 'native' if resolution is None else f'{resolution[0]}x{resolution[1]}'
+        results.append({'resolution': label, 'scale_factor': scale_factor, 'min_neighbors': neighbors,
+                        **summary})
+        print(f"{label:<11} {scale_factor:>5} {neighbors:>5} {summary['fps']:>7.1f} "
+              f"{summary['faces_per_sec']:>8.1f} "
+              + ' '.join(f"{summary['stages'][stage]['mean_ms']:>9.2f}" for stage in STAGES), file=log)
+        if not faces:
+            print(f"⚠️ No faces detected at {label}: recognize and faces/s are not "
+                  f"measured; pass --source with a video or photos of faces", file=log)
+
+    if args.json_path:
+        report = {
+            'source': args.source, 'frames': args.frames, 'min_size': args.min_size,
+            'lbph_samples': samples, 'jpeg_quality': args.jpeg_quality,
+            'commit': git_commit(), 'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': {'python': platform.python_version(), 'opencv': cv2.__version__,
+                        'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'opencv_threads': cv2.getNumThreads()},
+            'results': results,
+        }
+        if args.json_path == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"✓ Results written to {args.json_path}", file=log)
+
+
+if __name__ == '__main__':
+    main()
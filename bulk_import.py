@@ -0,0 +1,280 @@
+"""
+Bulk Student Enrolment
+Smart Attendance System
+
+Imports a roster CSV (student_id, name, department, year, section and an
+optional photo column) together with a directory or zip archive of
+photos, instead of one registration request per student:
+
+- photos are matched by the roster's photo column, or else by a file
+  named after the student_id (S001.jpg, S001.png, ...)
+- face detection, cropping and (when the engine settings include an
+  embedder) descriptor extraction run in a pool of spawned processes (forking the
+  threaded web worker could copy locks held by its other threads)
+- rows are inserted with executemany, one transaction per batch, so an
+  interrupted import keeps the batches already committed
+- each photo waits in a temporary file until its row is committed, so a
+  student who registered the same ID meanwhile keeps their own photo
+
+Rows whose student_id is already enrolled are reported as 'exists' and
+left untouched, which makes a rerun of the same files resume where the
+previous run stopped. Every roster row gets a line in the report.
+"""
+
+import csv
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from face_engine import create_engine
+
+ROSTER_COLUMNS = ('student_id', 'name', 'department', 'year', 'section')
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def read_roster(stream):
+    """Return [(line number, row dict)] from a CSV text stream; ValueError on a bad header"""
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        raise ValueError('Roster is empty')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [column for column in ROSTER_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise ValueError(f"Roster is missing columns: {', '.join(missing)}")
+    return [(reader.line_num, {key: (value or '').strip() for key, value in row.items() if key})
+            for row in reader]
+
+
+class PhotoSet:
+    """Photos in a directory or a zip archive (path or binary file object)"""
+
+    def __init__(self, source):
+        self._zip = None
+        self._directory = None
+        if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+            self._directory = source
+            names = [entry.name for entry in os.scandir(source) if entry.is_file()]
+        else:
+            try:
+                self._zip = zipfile.ZipFile(source)
+            except (zipfile.BadZipFile, OSError) as e:
+                raise ValueError(f'Photos must be a directory or a zip archive: {e}') from e
+            names = [info.filename for info in self._zip.infolist() if not info.is_dir()]
+
+        # Lookups by base name and by stem, case-insensitive; folders inside
+        # the archive are ignored
+        self._by_name, self._by_stem = {}, {}
+        for name in names:
+            base = os.path.basename(name)
+            stem, extension = os.path.splitext(base)
+            if extension.lower() not in PHOTO_EXTENSIONS or base.startswith('.'):
+                continue
+            self._by_name.setdefault(base.lower(), name)
+            self._by_stem.setdefault(stem.lower(), name)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def find(self, student_id, filename=None):
+        if filename:
+            return self._by_name.get(os.path.basename(filename).lower())
+        return self._by_stem.get(student_id.lower())
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self._directory, name), 'rb') as f:
+            return f.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+# ---------- worker process ----------
+
+_engine = None
+
+
+def _init_worker(engine_settings):
+    global _engine
+    # One process per core already; OpenCV's own threads would oversubscribe
+    _engine = create_engine(**dict(engine_settings, threads=1))
+
+
+def process_photo(data):
+    """Detect and crop the face in one photo
+
+    Returns (100x100 crop bytes, descriptor or None, JPEG bytes, None) or
+    (None, None, None, error message).
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None, None, None, 'Photo is not a readable image'
+    faces = _engine.detect([image])[0]
+    if not faces:
+        return None, None, None, 'No face detected in photo'
+    # Portraits: the largest face is the student
+    box = max(faces, key=lambda face: face[2] * face[3])
+    x, y, w, h = box[:4]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    crop = cv2.resize(gray[y:y+h, x:x+w], (100, 100))
+    descriptor = _engine.embed([image], [[box]])[0][0] if _engine.can_embed else None
+
+    if not data.startswith(b'\xff\xd8'):
+        data = cv2.imencode('.jpg', image)[1].tobytes()
+    return crop.tobytes(), descriptor, data, None
+
+
+def _write_pending_photo(image_folder, student_id, data):
+    """Write a photo under a temporary name; _insert_batch renames it once the row is in"""
+    fd, path = tempfile.mkstemp(prefix=f'.{student_id}.', suffix='.jpg.part', dir=image_folder)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# ---------- import ----------
+
+def existing_student_ids(conn, student_ids, chunk=500):
+    student_ids = list(student_ids)
+    found = set()
+    for i in range(0, len(student_ids), chunk):
+        part = student_ids[i:i + chunk]
+        rows = conn.execute(f"SELECT student_id FROM students WHERE student_id IN ({','.join('?' * len(part))})",
+                            part).fetchall()
+        found.update(row[0] for row in rows)
+    return found
+
+
+def import_students(conn, roster, photos, image_folder, engine_settings,
+                    workers=None, batch_size=200, write_samples=None, on_batch=None):
+    """Enrol every new student of a roster; returns the per-row report
+
+    roster is read_roster() output, photos a PhotoSet and engine_settings
+    the create_engine() arguments for the worker processes. Photos are
+    saved as `<image_folder>/<student_id>.jpg`, image_path is stored
+    relative to the folder's parent like registration does.
+
+    write_samples(conn, student_id, samples, centroid) stores a descriptor
+    inside the batch transaction and returns the gallery version; without
+    it no descriptor is stored.
+    on_batch(students) is called after each commit with one dict per
+    inserted row: label (students.id), student_id, name, department,
+    section, crop, descriptor and gallery_version (None without a descriptor).
+    """
+    report, pending, seen = [], [], set()
+    for line, row in roster:
+        entry = {'row': line, 'student_id': row.get('student_id', ''), 'status': 'error', 'message': None}
+        report.append(entry)
+        student_id = entry['student_id']
+        empty = [column for column in ROSTER_COLUMNS if not row.get(column)]
+        if empty:
+            entry['message'] = f"Missing {', '.join(empty)}"
+        elif os.path.basename(student_id) != student_id or student_id.startswith('.'):
+            entry['message'] = 'Invalid student ID'
+        elif student_id in seen:
+            entry['message'] = 'Duplicate student ID in roster'
+        else:
+            seen.add(student_id)
+            pending.append((entry, row))
+
+    existing = existing_student_ids(conn, seen)
+    jobs = []
+    for entry, row in pending:
+        if entry['student_id'] in existing:
+            entry['status'], entry['message'] = 'exists', 'Already enrolled'
+            continue
+        photo = photos.find(entry['student_id'], row.get('photo'))
+        if photo is None:
+            entry['message'] = 'Photo not found'
+            continue
+        jobs.append((entry, row, photo))
+
+    if jobs:
+        os.makedirs(image_folder, exist_ok=True)
+        image_prefix = os.path.basename(os.path.normpath(image_folder))
+
+        def photo_jobs():
+            # Read lazily so only the pool's backlog of photos is in memory
+            for _, _, photo in jobs:
+                yield photos.read(photo)
+
+        batch = []
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(engine_settings,),
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = executor.map(process_photo, photo_jobs(), chunksize=4)
+                for (entry, row, _), (crop, descriptor, jpeg, error) in zip(jobs, results):
+                    if error:
+                        entry['message'] = error
+                        continue
+                    pending_path = _write_pending_photo(image_folder, entry['student_id'], jpeg)
+                    batch.append((entry, row, f"{image_prefix}/{entry['student_id']}.jpg", crop, descriptor,
+                                  pending_path))
+                    if len(batch) >= batch_size:
+                        _insert_batch(conn, batch, image_folder, write_samples, on_batch)
+                        batch = []
+                if batch:
+                    _insert_batch(conn, batch, image_folder, write_samples, on_batch)
+                    batch = []
+        finally:
+            # Photos of a batch that never committed
+            for *_, pending_path in batch:
+                _discard(pending_path)
+    return report
+
+
+def _insert_batch(conn, batch, image_folder, write_samples, on_batch):
+    try:
+        # Another registration may have taken an ID since the roster was checked
+        taken = existing_student_ids(conn, [entry['student_id'] for entry, *_ in batch])
+        new = [item for item in batch if item[0]['student_id'] not in taken]
+        conn.executemany('''
+            INSERT INTO students (student_id, name, department, year, section, image_path, face_crop)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(student_id) DO NOTHING
+        ''', [(row['student_id'], row['name'], row['department'], row['year'], row['section'],
+               image_path, crop) for _, row, image_path, crop, _, _ in new])
+        versions = {}
+        if write_samples:
+            for entry, _, _, _, descriptor, _ in new:
+                if descriptor is not None:
+                    versions[entry['student_id']] = write_samples(conn, entry['student_id'],
+                                                                  descriptor[None], descriptor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Only rows this batch inserted get their photo
+    for entry, *_, pending_path in batch:
+        if entry['student_id'] in taken:
+            _discard(pending_path)
+            entry['status'], entry['message'] = 'exists', 'Already enrolled'
+        else:
+            os.replace(pending_path, os.path.join(image_folder, f"{entry['student_id']}.jpg"))
+            entry['status'] = 'imported'
+    if on_batch and new:
+        labels = {row[1]: row[0] for row in conn.execute(
+            f"SELECT id, student_id FROM students WHERE student_id IN ({','.join('?' * len(new))})",
+            [entry['student_id'] for entry, *_ in new])}
+        on_batch([{'label': labels[row['student_id']], 'student_id': row['student_id'],
+                   'name': row['name'], 'department': row['department'], 'section': row['section'],
+                   'crop': np.frombuffer(crop, np.uint8).reshape((100, 100)),
+                   'descriptor': descriptor if row['student_id'] in versions else None,
+                   'gallery_version': versions.get(row['student_id'])}
+                  for _, row, _, crop, descriptor, _ in new])
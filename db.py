@@ -0,0 +1,152 @@
+"""
+SQLite Connection Pool
+Smart Attendance System
+
+Connections are opened once and reused instead of connect/close per query:
+
+- WAL journal + synchronous=NORMAL: readers never block the writer and a
+  commit does not fsync the main database file
+- busy_timeout: concurrent writers (threads or gunicorn workers) wait for
+  the lock instead of failing with "database is locked"
+- a per-connection prepared statement cache, which only pays off because
+  connections live across requests
+
+One pool exists per process. After a fork (gunicorn preloading) the child
+discards inherited connections and starts a fresh pool.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the pool timeout"""
+
+
+class ConnectionPool:
+    """Bounded pool of pre-configured sqlite3 connections"""
+
+    def __init__(self, database, max_size=8, timeout=30.0, busy_timeout_ms=5000,
+                 cached_statements=256):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._metrics = {
+            'created': 0,
+            'acquired': 0,
+            'reused': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'peak_in_use': 0,
+        }
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        return conn
+
+    def acquire(self):
+        """Borrow a connection; blocks while all max_size connections are in use"""
+        if os.getpid() != self._pid:
+            # Forked child: inherited SQLite handles must not be shared
+            self._reset()
+
+        with self._cond:
+            waited = None
+            while not self._idle and self._size >= self.max_size:
+                if waited is None:
+                    waited = time.monotonic()
+                    self._metrics['waits'] += 1
+                remaining = self.timeout - (time.monotonic() - waited)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._size >= self.max_size:
+                        self._metrics['timeouts'] += 1
+                        raise PoolTimeout(f'No database connection free after {self.timeout}s')
+            if waited is not None:
+                self._metrics['wait_seconds'] += time.monotonic() - waited
+
+            self._metrics['acquired'] += 1
+            if self._idle:
+                self._metrics['reused'] += 1
+                conn = self._idle.pop()
+            else:
+                self._size += 1
+                self._metrics['created'] += 1
+                conn = None
+            in_use = self._size - len(self._idle)
+            self._metrics['peak_in_use'] = max(self._metrics['peak_in_use'], in_use)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        """Return a connection, rolling back anything left uncommitted"""
+        if os.getpid() != self._pid:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """`with pool.connection() as conn:` for code outside a request"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close all idle connections"""
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._metrics)
+            stats.update({
+                'pid': self._pid,
+                'max_size': self.max_size,
+                'open': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            })
+        stats['wait_seconds'] = round(stats['wait_seconds'], 4)
+        return stats
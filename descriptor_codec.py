@@ -0,0 +1,82 @@
+"""
+Face Descriptor Storage Format
+Smart Attendance System
+
+Descriptors are stored in students.encoding_data as a packed binary blob:
+
+    offset  size  field
+    0       2     magic b'FD'
+    2       2     format version (uint16, little-endian)
+    4       2     dimension      (uint16)
+    6       2     descriptor count (uint16)
+    8       4*dim*count  float32 values, little-endian, row-major
+
+One 128-d descriptor is 520 bytes instead of ~2.5 KB of JSON text, and
+decoding is a zero-copy np.frombuffer view over the SQLite bytes.
+
+Older rows may still hold JSON text/bytes from face-api.js or a 100x100
+grayscale crop from the legacy OpenCV path; decode_legacy() handles those
+until `flask migrate-descriptors` has rewritten them.
+"""
+
+import json
+import struct
+import numpy as np
+
+MAGIC = b'FD'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<2sHHH')
+DESCRIPTOR_SIZE = 128
+LEGACY_CROP_SIZE = 100 * 100  # 100x100 uint8 grayscale face crop
+
+
+def is_packed(blob):
+    return isinstance(blob, (bytes, bytearray, memoryview)) and bytes(blob[:2]) == MAGIC
+
+
+def encode_descriptors(descriptors):
+    """Pack one descriptor (1-d) or several (2-d) into the binary format"""
+    vectors = np.asarray(descriptors, dtype='<f4')
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    count, dim = vectors.shape
+    return HEADER.pack(MAGIC, FORMAT_VERSION, dim, count) + np.ascontiguousarray(vectors).tobytes()
+
+
+def decode_descriptors(blob):
+    """Return a read-only (count, dim) float32 view over a packed blob"""
+    magic, version, dim, count = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError('Not a packed descriptor blob')
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unsupported descriptor format version {version}')
+    return np.frombuffer(blob, dtype='<f4', count=dim * count, offset=HEADER.size).reshape(count, dim)
+
+
+def decode_legacy(raw_data):
+    """Classify a pre-migration value: ('descriptor', vector), ('crop', image) or (None, None)"""
+    if isinstance(raw_data, str):
+        raw_data = raw_data.encode('utf-8')
+    if len(raw_data) == LEGACY_CROP_SIZE:
+        return 'crop', np.frombuffer(raw_data, np.uint8).reshape(100, 100)
+    try:
+        encoding = json.loads(raw_data.decode('utf-8'))
+        if isinstance(encoding, list) and len(encoding) == DESCRIPTOR_SIZE:
+            return 'descriptor', np.asarray(encoding, dtype=np.float32)
+    except (UnicodeDecodeError, ValueError):
+        pass
+    if len(raw_data) == DESCRIPTOR_SIZE * 8:
+        # Raw float64 array written by early experiments
+        return 'descriptor', np.frombuffer(raw_data, np.float64).astype(np.float32)
+    return None, None
+
+
+def decode_descriptor(raw_data):
+    """Return the first stored descriptor as float32, or None if there is none"""
+    if not raw_data:
+        return None
+    if is_packed(raw_data):
+        vectors = decode_descriptors(raw_data)
+        return vectors[0] if len(vectors) else None
+    kind, value = decode_legacy(raw_data)
+    return value if kind == 'descriptor' else None
@@ -0,0 +1,406 @@
+"""
+Face Descriptor Index
+Smart Attendance System
+
+Pluggable nearest-neighbour indexes over 128-d face descriptors, keyed by
+student_id:
+
+- FlatIndex: exact brute-force search over one contiguous matrix
+- IVFIndex:  approximate search; descriptors are bucketed by a k-means
+             coarse quantizer and only the `nprobe` closest buckets are
+             scanned. Raising nprobe trades latency for recall.
+             Probed buckets are cached as contiguous blocks, and a batch
+             of queries does one matrix product per probed bucket
+             (each cached bucket holds a copy of its descriptors).
+
+Both support incremental add/remove and persist to a single .npz file.
+"""
+
+import os
+import numpy as np
+
+from descriptor_codec import DESCRIPTOR_SIZE
+
+
+class FlatIndex:
+    """Exact index: every query is compared against every stored vector"""
+
+    kind = 'flat'
+
+    def __init__(self, dim=DESCRIPTOR_SIZE):
+        self.dim = dim
+        self.version = 0  # caller-defined tag saved with the index (e.g. gallery version)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._keys = []
+        self._rows = {}  # key -> row in the matrix
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def keys(self):
+        return list(self._keys)
+
+    def _as_vector(self, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f'Descriptor must have {self.dim} values, got {vector.shape[0]}')
+        return vector
+
+    def _as_queries(self, queries):
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f'Descriptors must have {self.dim} values, got {queries.shape[1]}')
+        return queries
+
+    def _reserve(self, size):
+        """Grow the backing matrix geometrically so appends stay amortised O(1)"""
+        capacity = self._vectors.shape[0]
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2, 64)
+        vectors = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        sq_norms = np.zeros(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._vectors, self._sq_norms = vectors, sq_norms
+        self._on_reserve(new_capacity)
+
+    def _on_reserve(self, capacity):
+        pass
+
+    def add(self, key, vector):
+        """Insert a vector, or overwrite the existing vector for `key`"""
+        vector = self._as_vector(vector)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._size
+            self._reserve(row + 1)
+            self._keys.append(key)
+            self._rows[key] = row
+            self._size += 1
+        self._vectors[row] = vector
+        self._sq_norms[row] = float(vector @ vector)
+        self._on_store(row, vector)
+        return row
+
+    def _on_store(self, row, vector):
+        pass
+
+    def remove(self, key):
+        """Drop `key` by moving the last row into its slot"""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+        last = self._size - 1
+        self._on_remove(row, last)
+        if row != last:
+            self._vectors[row] = self._vectors[last]
+            self._sq_norms[row] = self._sq_norms[last]
+            self._keys[row] = self._keys[last]
+            self._rows[self._keys[row]] = row
+        self._keys.pop()
+        self._size = last
+        return True
+
+    def _on_remove(self, row, last):
+        pass
+
+    def _top_k(self, queries, rows, k):
+        """Exact top-k over a subset of rows (None = all rows)"""
+        if rows is None:
+            vectors = self._vectors[:self._size]
+            sq_norms = self._sq_norms[:self._size]
+        else:
+            vectors = self._vectors[rows]
+            sq_norms = self._sq_norms[rows]
+        sq_dist = (np.einsum('ij,ij->i', queries, queries)[:, None]
+                   + sq_norms[None, :]
+                   - 2.0 * queries @ vectors.T)
+        k = min(k, sq_dist.shape[1])
+        if k == 1:
+            best = np.argmin(sq_dist, axis=1)[:, None]
+        else:
+            best = np.argpartition(sq_dist, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(sq_dist, best, axis=1), axis=1)
+            best = np.take_along_axis(best, order, axis=1)
+        distances = np.sqrt(np.maximum(np.take_along_axis(sq_dist, best, axis=1), 0.0))
+        if rows is not None:
+            best = rows[best]
+        return best, distances
+
+    def search(self, queries, k=1):
+        """Return (keys, distances) for the k nearest vectors of each query"""
+        queries = self._as_queries(queries)
+        if self._size == 0:
+            return [[] for _ in range(len(queries))], np.empty((len(queries), 0), dtype=np.float32)
+        best, distances = self._top_k(queries, None, k)
+        return [[self._keys[row] for row in rows] for rows in best.tolist()], distances
+
+    def _state(self):
+        return {
+            'kind': np.array(self.kind),
+            'dim': np.array(self.dim),
+            'version': np.array(self.version),
+            'keys': np.array(self._keys, dtype=str),
+            'vectors': self._vectors[:self._size],
+        }
+
+    def save(self, path):
+        """Write the index atomically so concurrent readers never see a partial file"""
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **self._state())
+        os.replace(tmp_path, path)
+
+    def build(self, keys, vectors):
+        """Replace the contents with keys/vectors in one vectorised step"""
+        keys = list(keys)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dim)
+        if len(set(keys)) != len(keys):
+            raise ValueError('Duplicate keys in descriptor index build')
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._reserve(len(keys))
+        self._vectors[:len(keys)] = vectors
+        self._sq_norms[:len(keys)] = np.einsum('ij,ij->i', vectors, vectors)
+        self._keys = keys
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._size = len(keys)
+
+    def _restore(self, data):
+        self.build(data['keys'].tolist(), data['vectors'])
+
+
+class IVFIndex(FlatIndex):
+    """Inverted-file index with a k-means coarse quantizer"""
+
+    kind = 'ivf'
+
+    def __init__(self, dim=DESCRIPTOR_SIZE, nlist=0, nprobe=8,
+                 min_train_per_list=39, retrain_factor=4, seed=0):
+        super().__init__(dim)
+        self.nlist = nlist            # 0 = pick ~sqrt(N) at training time
+        self.nprobe = nprobe
+        self.min_train_per_list = min_train_per_list
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        self.centroids = None
+        self._trained_size = 0
+        self._assign = np.empty(0, dtype=np.int32)   # row -> list id
+        self._lists = []                              # list id -> rows
+        self._list_arrays = []                        # cached np views of _lists
+        self._list_blocks = {}                        # list id -> (vectors, sq_norms) copies
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _on_reserve(self, capacity):
+        assign = np.full(capacity, -1, dtype=np.int32)
+        assign[:len(self._assign)] = self._assign
+        self._assign = assign
+
+    def _nearest_centroids(self, vectors, n):
+        sq_dist = (np.einsum('ij,ij->i', self.centroids, self.centroids)[None, :]
+                   - 2.0 * vectors @ self.centroids.T)
+        if n == 1:
+            return np.argmin(sq_dist, axis=1)[:, None]
+        return np.argpartition(sq_dist, n - 1, axis=1)[:, :n]
+
+    def _on_store(self, row, vector):
+        if not self.is_trained:
+            if self._size >= self._train_threshold():
+                self.train()
+            return
+        if self._size > self._trained_size * self.retrain_factor:
+            self.train()
+            return
+        list_id = int(self._nearest_centroids(vector[None, :], 1)[0, 0])
+        previous = int(self._assign[row])
+        if previous == list_id:
+            self._list_blocks.pop(list_id, None)   # same list, new vector
+            return
+        if previous >= 0:
+            self._lists[previous].remove(row)
+            self._list_arrays[previous] = None
+        self._lists[list_id].append(row)
+        self._list_arrays[list_id] = None
+        self._assign[row] = list_id
+
+    def _on_remove(self, row, last):
+        if not self.is_trained:
+            return
+        list_id = int(self._assign[row])
+        self._lists[list_id].remove(row)
+        self._list_arrays[list_id] = None
+        if row != last:
+            moved_list = int(self._assign[last])
+            members = self._lists[moved_list]
+            members[members.index(last)] = row
+            self._list_arrays[moved_list] = None
+            self._assign[row] = moved_list
+        self._assign[last] = -1
+
+    def _train_threshold(self):
+        nlist = self.nlist or 16
+        return nlist * self.min_train_per_list
+
+    def train(self, n_iter=10):
+        """(Re)build the coarse quantizer and reassign every stored vector"""
+        vectors = self._vectors[:self._size]
+        nlist = self.nlist or max(16, int(np.sqrt(self._size)))
+        nlist = min(nlist, self._size)
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(self._size, nlist * 64)
+        sample = vectors[rng.choice(self._size, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        # Lloyd's iterations on a sample keep training cost bounded
+        for _ in range(n_iter):
+            self.centroids = centroids
+            labels = self._nearest_centroids(sample, 1)[:, 0]
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        self.centroids = centroids
+        self._assign_all()
+        self._trained_size = self._size
+
+    def _assign_all(self, labels=None):
+        nlist = len(self.centroids)
+        if labels is None:
+            labels = self._nearest_centroids(self._vectors[:self._size], 1)[:, 0]
+        self._assign[:] = -1
+        self._assign[:self._size] = labels
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(nlist + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]].tolist() for i in range(nlist)]
+        self._list_arrays = [None] * nlist
+        self._list_blocks = {}
+
+    def _list_rows(self, list_id):
+        rows = self._list_arrays[list_id]
+        if rows is None:
+            rows = np.array(self._lists[list_id], dtype=np.int64)
+            self._list_arrays[list_id] = rows
+            self._list_blocks.pop(list_id, None)
+        return rows
+
+    def _list_block(self, list_id):
+        """(rows, vectors, squared norms) of one list, contiguous so scans need no gather"""
+        rows = self._list_rows(list_id)
+        block = self._list_blocks.get(list_id)
+        if block is None:
+            block = self._list_blocks[list_id] = (self._vectors[rows], self._sq_norms[rows])
+        return rows, block[0], block[1]
+
+    def search(self, queries, k=1, nprobe=None):
+        """Approximate search over the nprobe closest inverted lists"""
+        if not self.is_trained:
+            return super().search(queries, k)
+        queries = self._as_queries(queries)
+        if self._size == 0:
+            return [[] for _ in range(len(queries))], np.empty((len(queries), 0), dtype=np.float32)
+
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = self._nearest_centroids(queries, nprobe)
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+
+        # Each query keeps its k best per probed list in its own slots; a
+        # list probed by several queries is scanned once for all of them
+        candidate_dist = np.full((len(queries), nprobe * k), np.inf, dtype=np.float32)
+        candidate_rows = np.full((len(queries), nprobe * k), -1, dtype=np.int64)
+        probed = probes.ravel()
+        by_list = np.argsort(probed, kind='stable')
+        starts = np.flatnonzero(np.diff(probed[by_list])) + 1
+        for group in np.split(by_list, starts):
+            rows, vectors, sq_norms = self._list_block(int(probed[group[0]]))
+            if len(rows) == 0:
+                continue
+            members, member_slots = group // nprobe, group % nprobe
+            sq_dist = q_norms[members, None] + sq_norms[None, :] - 2.0 * queries[members] @ vectors.T
+            take = min(k, len(rows))
+            if take == 1:
+                best = np.argmin(sq_dist, axis=1)[:, None]
+            else:
+                best = np.argpartition(sq_dist, take - 1, axis=1)[:, :take]
+            columns = member_slots[:, None] * k + np.arange(take)
+            candidate_dist[members[:, None], columns] = np.take_along_axis(sq_dist, best, axis=1)
+            candidate_rows[members[:, None], columns] = rows[best]
+
+        # k best of each query's candidates, nearest first; missing ones stay inf
+        order = np.argsort(candidate_dist, axis=1, kind='stable')[:, :k]
+        width = min(k, int(np.isfinite(candidate_dist).sum(axis=1).max()))
+        order = order[:, :width]
+        distances = np.sqrt(np.maximum(np.take_along_axis(candidate_dist, order, axis=1), 0.0))
+        best_rows = np.take_along_axis(candidate_rows, order, axis=1)
+        keys = [[self._keys[row] for row, distance in zip(rows, dists) if np.isfinite(distance)]
+                for rows, dists in zip(best_rows.tolist(), distances.tolist())]
+        return keys, distances
+
+    def _state(self):
+        state = super()._state()
+        state['params'] = np.array([self.nlist, self.nprobe, self.min_train_per_list,
+                                    self.retrain_factor, self.seed, self._trained_size])
+        if self.is_trained:
+            state['centroids'] = self.centroids
+            state['assign'] = self._assign[:self._size]
+        return state
+
+    def build(self, keys, vectors, centroids=None, assign=None):
+        """Bulk load, training the quantizer once instead of on every insert"""
+        self.centroids = None
+        self._trained_size = 0
+        self._assign = np.empty(0, dtype=np.int32)
+        super().build(keys, vectors)
+        if centroids is not None:
+            self.centroids = np.asarray(centroids, dtype=np.float32)
+            self._trained_size = self._size
+            self._assign_all(assign)
+        elif self._size >= self._train_threshold():
+            self.train()
+
+    def _restore(self, data):
+        self.nlist, self.nprobe, self.min_train_per_list, self.retrain_factor, self.seed, _ = \
+            data['params'].tolist()
+        centroids = data['centroids'] if 'centroids' in data else None
+        assign = data['assign'] if 'assign' in data else None
+        self.build(data['keys'].tolist(), data['vectors'], centroids, assign)
+
+
+INDEX_TYPES = {
+    FlatIndex.kind: FlatIndex,
+    IVFIndex.kind: IVFIndex,
+}
+
+
+def create_index(kind='flat', dim=DESCRIPTOR_SIZE, **options):
+    """Create an empty index of the given kind ('flat' or 'ivf')"""
+    try:
+        index_class = INDEX_TYPES[kind]
+    except KeyError:
+        raise ValueError(f'Unknown descriptor index type: {kind}')
+    return index_class(dim, **options)
+
+
+def load_index(path, **options):
+    """Load an index saved with save(); search-time options override saved ones"""
+    with np.load(path, allow_pickle=False) as data:
+        kind = str(data['kind'])
+        index = create_index(kind, int(data['dim']))
+        index._restore(data)
+        index.version = int(data['version']) if 'version' in data else 0
+    for name, value in options.items():
+        setattr(index, name, value)
+    return index
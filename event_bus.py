@@ -0,0 +1,171 @@
+"""
+Attendance Event Bus
+Smart Attendance System
+
+Fan-out of attendance marks to browsers over Server-Sent Events. The
+attendance table is the event log: an event's id is its row id, which
+AUTOINCREMENT never reuses and SQLite's single writer commits in order,
+so every worker process sees the same stream with the same ids:
+
+- poll() reads the rows committed after the last one it saw, hands them
+  to on_events and wakes the listeners. The write path calls it right
+  after its commit; a background thread calls it every `poll_seconds`
+  for marks committed by other processes
+- the last `history` events are kept in memory; a client reconnecting
+  with Last-Event-ID is replayed what it missed, from memory or, when it
+  is further back, from the table
+
+A client more than `history` events behind, or with an id the table has
+not reached, gets a single 'reset' event and should reload its state in
+full.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class EventBus:
+    """Thread-safe fan-out of the events of an append-only table
+
+    fetch(conn, after_id, limit) returns up to `limit` (id, type, data)
+    events with ids above after_id, oldest first; with after_id None, only
+    the newest event. connect() is a context manager yielding a connection.
+    on_events(events) is called with every new batch, in id order.
+    """
+
+    def __init__(self, fetch, connect, history=1000, poll_seconds=1.0, on_events=None):
+        self.fetch = fetch
+        self.connect = connect
+        self.history = history
+        self.poll_seconds = poll_seconds
+        self.on_events = on_events
+        self._events = deque(maxlen=history)  # (id, type, data)
+        self._last_id = None  # newest event delivered; None until started
+        self._floor = None  # memory holds every event after this id
+        self._cond = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._thread = None
+        self._metrics = {'published': 0, 'polls': 0, 'poll_errors': 0, 'subscribers': 0,
+                         'resumed': 0, 'replayed': 0, 'resets': 0}
+
+    def start(self):
+        """Start from the newest event in the table and poll in the background"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='attendance-events', daemon=True)
+        self.poll()
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.poll()
+            except Exception as e:
+                with self._cond:
+                    self._metrics['poll_errors'] += 1
+                print(f"⚠️ Attendance event poll failed: {e}")
+
+    def poll(self, conn=None):
+        """Deliver the events committed since the last poll; returns how many
+
+        Pass the caller's connection to avoid borrowing a second one.
+        """
+        if conn is None:
+            with self.connect() as conn:
+                return self.poll(conn)
+        delivered = 0
+        with self._poll_lock:
+            if self._last_id is None:
+                newest = self.fetch(conn, None, 1)
+                with self._cond:
+                    self._last_id = self._floor = newest[-1][0] if newest else 0
+            while True:
+                events = self.fetch(conn, self._last_id, self.history)
+                if not events:
+                    break
+                if self.on_events is not None:
+                    self.on_events(events)
+                with self._cond:
+                    for event in events:
+                        if len(self._events) == self.history:
+                            self._floor = self._events[0][0]
+                        self._events.append(event)
+                    self._last_id = events[-1][0]
+                    self._metrics['published'] += len(events)
+                    self._cond.notify_all()
+                delivered += len(events)
+                if len(events) < self.history:
+                    break
+            with self._cond:
+                self._metrics['polls'] += 1
+        return delivered
+
+    def _resume(self, last_event_id):
+        """(cursor, events to replay, reset?) for a client resuming after last_event_id"""
+        with self._cond:
+            if not last_event_id:
+                return self._last_id, [], False
+            requested = int(last_event_id) if str(last_event_id).isdigit() else None
+            ahead = requested is not None and requested > self._last_id
+        if ahead:
+            # Another process may have committed it since this one's last poll
+            self.poll()
+        with self._cond:
+            if requested is None or requested > self._last_id:
+                self._metrics['resets'] += 1
+                return self._last_id, [], True
+            if requested >= self._floor:
+                self._metrics['resumed'] += 1
+                return requested, [], False
+
+        # Further back than memory: read what was missed from the table
+        with self.connect() as conn:
+            events = self.fetch(conn, requested, self.history + 1)
+        with self._cond:
+            if len(events) > self.history:
+                self._metrics['resets'] += 1
+                return self._last_id, [], True
+            self._metrics['replayed'] += 1
+        return (events[-1][0] if events else requested), events, False
+
+    def listen(self, last_event_id=None, heartbeat=15.0, max_seconds=None):
+        """Yield (event id, type, data) for new events, None every `heartbeat` idle seconds
+
+        With last_event_id, events after it are replayed first.
+        Ends after max_seconds (the client reconnects and resumes).
+        """
+        self.start()
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        cursor, pending, reset = self._resume(last_event_id)
+        with self._cond:
+            self._metrics['subscribers'] += 1
+        try:
+            if reset:
+                yield cursor, 'reset', {}
+            while True:
+                for event in pending:
+                    yield event
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                with self._cond:
+                    self._cond.wait_for(lambda: self._last_id > cursor, timeout=heartbeat)
+                    if self._last_id > cursor and cursor < self._floor:
+                        # Fell further behind than the history holds
+                        pending = [(self._last_id, 'reset', {})]
+                        self._metrics['resets'] += 1
+                    else:
+                        pending = [event for event in self._events if event[0] > cursor]
+                    if pending:
+                        cursor = pending[-1][0]
+                if not pending:
+                    yield None
+        finally:
+            with self._cond:
+                self._metrics['subscribers'] -= 1
+
+    def stats(self):
+        with self._cond:
+            return dict(self._metrics, last_event_id=self._last_id, history=len(self._events))
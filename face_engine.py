@@ -0,0 +1,288 @@
+"""
+Face Detection / Embedding Engine
+Smart Attendance System
+
+One interface over the server-side face backends, used by the group photo
+endpoint and the bulk importer:
+
+- haar: the Haar cascade the app always used
+- dnn:  OpenCV's dnn module with a local detector model, YuNet (.onnx,
+        cv2.FaceDetectorYN) or the res10 SSD (.caffemodel + deploy.prototxt,
+        or any cv2.dnn.readNet model with the same output layout), the SSD
+        running every frame of a call in one batch
+
+Either can have an embedder: a local network producing 128-d descriptors.
+YuNet's five landmarks (eyes, nose tip, mouth corners) align each face
+onto a fixed template before it is embedded; SSD and Haar boxes have no
+landmarks and are embedded as square crops. Whether an export of the
+face-api.js / dlib ResNet-34 model gives descriptors comparable with the
+browser's is unverified: face-api.js aligns with its own 68-point
+landmarks, so compare distances for a few enrolled students (and retune
+RECOGNITION_THRESHOLD) before mixing server and browser descriptors in one
+gallery.
+
+Both backends take a list of BGR frames and return boxes per frame, so
+several photos (or a batch of video frames) cost one call. `threads` sets
+OpenCV's worker thread count for the whole process, `input_size` the side
+frames are scaled to for the DNN detector.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+ENGINE_BACKENDS = ('haar', 'dnn')
+
+# face-api.js / dlib input normalisation: (rgb - mean) / 256 on 150x150 chips
+EMBEDDER_MEAN = (122.782, 117.001, 104.298)
+EMBEDDER_SCALE = 1 / 256
+
+# Landmark template of cv2.FaceRecognizerSF.alignCrop, as fractions of the
+# chip side, in YuNet's order: right eye, left eye, nose tip, right and
+# left mouth corners
+ALIGN_TEMPLATE = np.array([[38.2946, 51.6963], [73.5318, 51.5014], [56.0252, 71.7366],
+                           [41.5493, 92.3655], [70.7299, 92.2041]], dtype=np.float32) / 112
+
+
+def to_bgr(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR) if frame.ndim == 2 else frame
+
+
+def to_gray(frame):
+    return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+class HaarDetector:
+    """Haar cascade; one classifier per thread, which is not safe to share"""
+
+    name = 'haar'
+
+    def __init__(self, cascade_path, scale_factor=1.3, min_neighbors=5, min_size=24):
+        self.cascade_path = cascade_path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self._local = threading.local()
+
+    def detect(self, frames):
+        cascade = getattr(self._local, 'cascade', None)
+        if cascade is None:
+            cascade = self._local.cascade = cv2.CascadeClassifier(self.cascade_path)
+        results = []
+        for frame in frames:
+            rects, neighbours = cascade.detectMultiScale2(
+                to_gray(frame), scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                minSize=(self.min_size, self.min_size))
+            results.append([(int(x), int(y), int(w), int(h), float(n))
+                            for (x, y, w, h), n in zip(rects, neighbours)])
+        return results
+
+
+class YuNetDetector:
+    """cv2.FaceDetectorYN; frames are scaled so their long side is input_size
+
+    Boxes carry a sixth item, the (5, 2) landmarks in frame pixels.
+    """
+
+    name = 'yunet'
+
+    def __init__(self, model_path, input_size=320, score_threshold=0.6, nms_threshold=0.3):
+        self.model_path = model_path
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self._local = threading.local()
+        self._create()  # fail at startup on a bad model file
+
+    def _create(self):
+        detector = cv2.FaceDetectorYN.create(self.model_path, '', (self.input_size, self.input_size),
+                                             self.score_threshold, self.nms_threshold)
+        self._local.detector = detector
+        return detector
+
+    def detect(self, frames):
+        detector = getattr(self._local, 'detector', None) or self._create()
+        results = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            scale = min(1.0, self.input_size / max(height, width))
+            resized = to_bgr(frame)
+            if scale < 1.0:
+                resized = cv2.resize(resized, (round(width * scale), round(height * scale)),
+                                     interpolation=cv2.INTER_AREA)
+            detector.setInputSize((resized.shape[1], resized.shape[0]))
+            _, faces = detector.detect(resized)
+            boxes = []
+            for face in faces if faces is not None else ():
+                # Boxes may overhang the frame edge; clip them to it
+                x1, y1 = max(0, int(face[0] / scale)), max(0, int(face[1] / scale))
+                x2 = min(width, int((face[0] + face[2]) / scale))
+                y2 = min(height, int((face[1] + face[3]) / scale))
+                if x2 > x1 and y2 > y1:
+                    landmarks = face[4:14].reshape(5, 2) / scale
+                    boxes.append((x1, y1, x2 - x1, y2 - y1, float(face[-1]), landmarks))
+            results.append(boxes)
+        return results
+
+
+class SsdDetector:
+    """res10-style SSD via cv2.dnn; every frame of a call goes through one forward()"""
+
+    name = 'ssd'
+    MEAN = (104.0, 177.0, 123.0)
+
+    def __init__(self, model_path, config_path=None, input_size=300, score_threshold=0.6,
+                 nms_threshold=0.3):
+        self.net = cv2.dnn.readNet(model_path, config_path or '')
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self._lock = threading.Lock()
+
+    def detect(self, frames):
+        if not frames:
+            return []
+        blob = cv2.dnn.blobFromImages([to_bgr(frame) for frame in frames], 1.0,
+                                      (self.input_size, self.input_size), self.MEAN)
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward().reshape(-1, 7)
+
+        candidates = [([], []) for _ in frames]
+        for batch_id, _, score, x1, y1, x2, y2 in detections:
+            if score < self.score_threshold:
+                continue
+            height, width = frames[int(batch_id)].shape[:2]
+            x1, x2 = max(0.0, x1) * width, min(1.0, x2) * width
+            y1, y2 = max(0.0, y1) * height, min(1.0, y2) * height
+            if x2 > x1 and y2 > y1:
+                boxes, scores = candidates[int(batch_id)]
+                boxes.append([int(x1), int(y1), int(x2 - x1), int(y2 - y1)])
+                scores.append(float(score))
+
+        results = []
+        for boxes, scores in candidates:
+            keep = cv2.dnn.NMSBoxes(boxes, scores, self.score_threshold, self.nms_threshold) if boxes else []
+            results.append([(*boxes[i], scores[i]) for i in (int(i) for i in keep)])
+        return results
+
+
+class DnnEmbedder:
+    """Face crops -> descriptors with a cv2.dnn network, one forward() per batch"""
+
+    def __init__(self, model_path, config_path=None, input_size=150, mean=EMBEDDER_MEAN,
+                 scale=EMBEDDER_SCALE, swap_rb=True, margin=0.0):
+        self.net = cv2.dnn.readNet(model_path, config_path or '')
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.mean = mean
+        self.scale = scale
+        self.swap_rb = swap_rb
+        self.margin = margin
+        self._lock = threading.Lock()
+
+    def crop(self, frame, box):
+        """Face chip for a box: aligned on its landmarks when it has them (YuNet),
+        else a square crop around it; either widened by `margin` on each side
+        """
+        if len(box) > 5 and box[5] is not None:
+            size = self.input_size
+            template = ((ALIGN_TEMPLATE - 0.5) / (1 + 2 * self.margin) + 0.5) * size
+            matrix, _ = cv2.estimateAffinePartial2D(np.asarray(box[5], dtype=np.float32), template,
+                                                    method=cv2.LMEDS)
+            if matrix is not None:
+                return cv2.warpAffine(to_bgr(frame), matrix, (size, size), flags=cv2.INTER_LINEAR,
+                                      borderMode=cv2.BORDER_REPLICATE)
+        x, y, w, h = box[:4]
+        side = max(w, h) * (1 + 2 * self.margin)
+        cx, cy = x + w / 2, y + h / 2
+        height, width = frame.shape[:2]
+        x1, y1 = max(0, int(cx - side / 2)), max(0, int(cy - side / 2))
+        x2, y2 = min(width, int(cx + side / 2)), min(height, int(cy + side / 2))
+        return to_bgr(frame)[y1:y2, x1:x2]
+
+    def embed(self, crops):
+        """Return an (N, dim) float32 array for N BGR face crops"""
+        if not crops:
+            return np.zeros((0, 0), dtype=np.float32)
+        blob = cv2.dnn.blobFromImages(crops, self.scale, (self.input_size, self.input_size),
+                                      self.mean, swapRB=self.swap_rb)
+        with self._lock:
+            self.net.setInput(blob)
+            output = self.net.forward()
+        return output.reshape(len(crops), -1).astype(np.float32)
+
+
+class FaceEngine:
+    """A detector plus an optional embedder behind one batch API"""
+
+    def __init__(self, detector, embedder=None):
+        self.detector = detector
+        self.embedder = embedder
+
+    @property
+    def name(self):
+        return self.detector.name
+
+    @property
+    def can_embed(self):
+        return self.embedder is not None
+
+    def detect(self, frames):
+        """[[(x, y, w, h, score), ...] per frame]; YuNet adds landmarks (see YuNetDetector)"""
+        return self.detector.detect(frames)
+
+    def embed(self, frames, boxes):
+        """Descriptors for the given boxes of each frame: one (n, dim) array per frame"""
+        crops, counts = [], []
+        for frame, frame_boxes in zip(frames, boxes):
+            crops.extend(self.embedder.crop(frame, box) for box in frame_boxes)
+            counts.append(len(frame_boxes))
+        descriptors = self.embedder.embed(crops)
+        return np.split(descriptors, np.cumsum(counts)[:-1]) if counts else []
+
+    def analyze(self, frames):
+        """Detect and (if there is an embedder) describe every face of every frame"""
+        boxes = self.detect(frames)
+        descriptors = self.embed(frames, boxes) if self.can_embed else [None] * len(frames)
+        return [[{'box': box[:4], 'score': box[4],
+                  'descriptor': None if frame_descriptors is None else frame_descriptors[i]}
+                 for i, box in enumerate(frame_boxes)]
+                for frame_boxes, frame_descriptors in zip(boxes, descriptors)]
+
+
+def create_engine(backend='haar', cascade_path=None, detector_model=None, detector_config=None,
+                  embedder_model=None, embedder_config=None, input_size=320, embedder_input_size=150,
+                  score_threshold=0.6, threads=0, descriptor_size=None):
+    """Build a FaceEngine from settings (plain values, so worker processes can rebuild it)
+
+    Raises ValueError for an unusable configuration and cv2.error when a
+    model file cannot be loaded.
+    """
+    if backend not in ENGINE_BACKENDS:
+        raise ValueError(f'Unknown face engine: {backend}')
+    if threads > 0:
+        cv2.setNumThreads(threads)
+
+    if backend == 'haar':
+        detector = HaarDetector(cascade_path)
+    elif not detector_model:
+        raise ValueError('The dnn face engine needs a detector model file')
+    elif detector_model.lower().endswith('.onnx'):
+        detector = YuNetDetector(detector_model, input_size, score_threshold)
+    else:
+        detector = SsdDetector(detector_model, detector_config, input_size, score_threshold)
+
+    embedder = None
+    if embedder_model:
+        embedder = DnnEmbedder(embedder_model, embedder_config, embedder_input_size)
+        if descriptor_size is not None:
+            probe = np.zeros((embedder_input_size, embedder_input_size, 3), dtype=np.uint8)
+            dim = embedder.embed([probe]).shape[1]
+            if dim != descriptor_size:
+                raise ValueError(f'Embedder produces {dim}-d descriptors, expected {descriptor_size}')
+    return FaceEngine(detector, embedder)
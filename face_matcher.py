@@ -0,0 +1,285 @@
+"""
+Server-side Face Matcher
+Smart Attendance System
+
+Matches face-api.js descriptors against every enrolled student in one
+batched search. The vectors live in a pluggable descriptor index
+(exact flat matrix or approximate IVF, see descriptor_index.py); this
+module adds student names, locking and persistence on top.
+
+Students may enrol several samples. Two match modes are supported:
+
+- centroid: one mean descriptor per student (outliers pruned first)
+- kbest:    every sample is indexed; a student's score is the mean distance
+            of their k nearest samples, which tolerates pose/lighting spread.
+            Samples a student does not have count at the threshold, so
+            every student is scored on k distances and a sparsely enrolled
+            student cannot win on one lucky sample
+"""
+
+import os
+import threading
+import numpy as np
+
+from descriptor_index import DESCRIPTOR_SIZE, create_index, load_index
+
+MATCH_MODES = ('centroid', 'kbest')
+
+
+def summarize_samples(samples, outlier_distance=0.4, max_samples=10):
+    """Prune outlier captures and average the rest
+
+    Samples further than `outlier_distance` from the element-wise median
+    (blurred frames, a second face, bad landmarks) are dropped; at most
+    `max_samples` of the closest ones are kept. Returns (kept, centroid,
+    pruned_count); centroid is None when every sample was an outlier.
+    """
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1, DESCRIPTOR_SIZE)
+    center = np.median(samples, axis=0)
+    distances = np.linalg.norm(samples - center, axis=1)
+    order = np.argsort(distances)
+    order = order[distances[order] <= outlier_distance][:max_samples]
+    kept = samples[np.sort(order)]
+    if len(kept) == 0:
+        return kept, None, len(samples)
+    return kept, kept.mean(axis=0), len(samples) - len(kept)
+
+
+class FaceGallery:
+    """Enrolled descriptors keyed by student_id, backed by a descriptor index"""
+
+    def __init__(self, index_kind='flat', index_path=None, dim=DESCRIPTOR_SIZE,
+                 match_mode='centroid', k_best=3, **index_options):
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f'Unknown match mode: {match_mode}')
+        self.dim = dim
+        self.loaded = False
+        self.index_kind = index_kind
+        self.index_path = index_path
+        self.index_options = index_options
+        self.match_mode = match_mode
+        self.k_best = k_best
+        self._lock = threading.RLock()
+        self._index = create_index(index_kind, dim, **index_options)
+        self._samples = create_index(index_kind, dim, **index_options) if match_mode == 'kbest' else None
+        self._sample_counts = {}  # student_id -> number of samples in self._samples
+        self._names = {}
+        self._save_timer = None
+
+    @property
+    def samples_path(self):
+        if not self.index_path or self._samples is None:
+            return None
+        return os.path.splitext(self.index_path)[0] + '_samples.npz'
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def version(self):
+        """Gallery version (see gallery_state in app.py) this gallery reflects"""
+        return self._index.version
+
+    def __contains__(self, student_id):
+        return student_id in self._index
+
+    def load(self, entries, version=0):
+        """Replace the gallery with (student_id, name, descriptor, samples) entries
+
+        `samples` may be None, in which case the descriptor is the only sample.
+        """
+        entries = list(entries)
+        with self._lock:
+            index = create_index(self.index_kind, self.dim, **self.index_options)
+            vectors = np.array([entry[2] for entry in entries],
+                               dtype=np.float32).reshape(len(entries), self.dim)
+            index.build([entry[0] for entry in entries], vectors)
+            index.version = version
+            self._index = index
+            self._names = {entry[0]: entry[1] for entry in entries}
+            if self._samples is not None:
+                keys, blocks, self._sample_counts = [], [], {}
+                for student_id, _, descriptor, samples in entries:
+                    block = self._sample_block(descriptor, samples)
+                    keys.extend(f'{student_id}#{i}' for i in range(len(block)))
+                    blocks.append(block)
+                    self._sample_counts[student_id] = len(block)
+                samples_index = create_index(self.index_kind, self.dim, **self.index_options)
+                samples_index.build(keys, np.concatenate(blocks) if blocks
+                                    else np.empty((0, self.dim), dtype=np.float32))
+                samples_index.version = version
+                self._samples = samples_index
+            self.loaded = True
+        self.save()
+
+    def _sample_block(self, descriptor, samples):
+        if samples is None or len(samples) == 0:
+            samples = [descriptor]
+        return np.asarray(samples, dtype=np.float32).reshape(-1, self.dim)
+
+    def _set_samples(self, student_id, descriptor, samples):
+        for i in range(self._sample_counts.pop(student_id, 0)):
+            self._samples.remove(f'{student_id}#{i}')
+        if descriptor is None:
+            return
+        block = self._sample_block(descriptor, samples)
+        for i, vector in enumerate(block):
+            self._samples.add(f'{student_id}#{i}', vector)
+        self._sample_counts[student_id] = len(block)
+
+    def load_saved(self, names, version):
+        """Load the persisted index if it was saved at `version` with the given students
+
+        `names` maps student_id -> name for every student with a descriptor.
+        Returns False when there is no usable file and a rebuild is needed.
+        """
+        if not self.index_path or not os.path.exists(self.index_path):
+            return False
+        try:
+            index = load_index(self.index_path, **self.index_options)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"✗ Could not read descriptor index {self.index_path}: {e}")
+            return False
+        if (index.kind != self.index_kind or index.version != version
+                or set(index.keys()) != set(names)):
+            return False
+        samples_index, sample_counts = None, {}
+        if self._samples is not None:
+            if not os.path.exists(self.samples_path):
+                return False
+            try:
+                samples_index = load_index(self.samples_path, **self.index_options)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"✗ Could not read descriptor samples {self.samples_path}: {e}")
+                return False
+            if samples_index.version != version:
+                return False
+            for key in samples_index.keys():
+                student_id = key.rsplit('#', 1)[0]
+                sample_counts[student_id] = sample_counts.get(student_id, 0) + 1
+        with self._lock:
+            self._index = index
+            if samples_index is not None:
+                self._samples, self._sample_counts = samples_index, sample_counts
+            self._names = dict(names)
+            self.loaded = True
+        return True
+
+    def save(self):
+        """Persist the index next to the database
+
+        No-op without a path, and until load() or load_saved() has run: an
+        edit applied to the empty startup gallery must not overwrite the
+        saved index with a partial one.
+        """
+        if not self.index_path or not self.loaded:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            self._index.save(self.index_path)
+            if self._samples is not None:
+                self._samples.version = self._index.version
+                self._samples.save(self.samples_path)
+
+    def schedule_save(self, delay=5.0):
+        """Coalesce bursts of edits into a single write of the index file"""
+        if not self.index_path or not self.loaded:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(delay, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _advance(self, version):
+        # Only move forward one step: a gap means another worker changed the
+        # gallery and a delta sync (apply_changes) is still needed
+        if version is not None and version == self._index.version + 1:
+            self._index.version = version
+
+    def upsert(self, student_id, name, descriptor, version=None, samples=None):
+        """Add a student or overwrite their descriptor (and samples) in place"""
+        with self._lock:
+            self._index.add(student_id, descriptor)
+            if self._samples is not None:
+                self._set_samples(student_id, descriptor, samples)
+            self._names[student_id] = name
+            self._advance(version)
+        self.schedule_save()
+
+    def remove(self, student_id, version=None):
+        """Drop a student from the gallery"""
+        with self._lock:
+            self._names.pop(student_id, None)
+            removed = self._index.remove(student_id)
+            if self._samples is not None:
+                self._set_samples(student_id, None, None)
+            self._advance(version)
+        self.schedule_save()
+        return removed
+
+    def apply_changes(self, upserts, deleted, version):
+        """Apply a delta of (student_id, name, descriptor, samples) upserts and deleted ids"""
+        with self._lock:
+            for student_id in deleted:
+                self._names.pop(student_id, None)
+                self._index.remove(student_id)
+                if self._samples is not None:
+                    self._set_samples(student_id, None, None)
+            for student_id, name, descriptor, samples in upserts:
+                self._index.add(student_id, descriptor)
+                if self._samples is not None:
+                    self._set_samples(student_id, descriptor, samples)
+                self._names[student_id] = name
+            self._index.version = version
+        self.schedule_save()
+
+    def _best_by_samples(self, descriptors, threshold):
+        """k-best scoring: mean of each student's k nearest sample distances, padded to k"""
+        # Over-fetch so several students' k nearest samples are all present
+        keys, distances = self._samples.search(descriptors, k=self.k_best * 8)
+        best = []
+        for row_keys, row_distances in zip(keys, distances.tolist()):
+            per_student = {}
+            for key, distance in zip(row_keys, row_distances):
+                nearest = per_student.setdefault(key.rsplit('#', 1)[0], [])
+                if len(nearest) < self.k_best:
+                    nearest.append(distance)
+            # Samples outside the fetched window are at least this far away
+            # (IVF pads rows with fewer hits with inf)
+            horizon = row_distances[len(row_keys) - 1] if row_keys else threshold
+            scores = []
+            for student_id, nearest in per_student.items():
+                enrolled = min(self.k_best, self._sample_counts.get(student_id, 1))
+                padded = (sum(nearest) + horizon * max(0, enrolled - len(nearest))
+                          + threshold * (self.k_best - enrolled))
+                scores.append((padded / self.k_best, student_id))
+            best.append(min(scores) if scores else None)
+        return best
+
+    def match(self, descriptors, threshold):
+        """Match a batch of descriptors; returns one result dict per query"""
+        with self._lock:
+            if self._samples is not None:
+                best = self._best_by_samples(descriptors, threshold)
+            else:
+                keys, distances = self._index.search(descriptors)
+                best = [(row_distances[0], row_keys[0]) if row_keys else None
+                        for row_keys, row_distances in zip(keys, distances.tolist())]
+            results = []
+            for candidate in best:
+                if candidate is None:
+                    results.append({'student_id': None, 'name': 'unknown', 'distance': None})
+                    continue
+                distance, student_id = candidate
+                if distance < threshold:
+                    results.append({'student_id': student_id,
+                                    'name': self._names[student_id],
+                                    'distance': round(distance, 4)})
+                else:
+                    results.append({'student_id': None, 'name': 'unknown',
+                                    'distance': round(distance, 4)})
+            return results
@@ -0,0 +1,170 @@
+"""
+Face Tracking Between Recognition Passes
+Smart Attendance System
+
+A seated student stays in view for the whole session, so the video
+analysis stage should not re-detect and re-recognize the same face
+many times a minute. Here an identified face becomes a track:
+
+- between full passes, each track follows its face with a cheap OpenCV
+  correlation tracker (MOSSE or KCF) and no detection runs at all
+- a full pass (Haar detection) runs every `detect_interval` seconds, or
+  immediately when a tracker loses its face; detections are matched to
+  tracks by IoU and only unmatched boxes (new faces) are recognized
+- with kind='iou' there is no correlation tracker: detection runs every
+  frame, but recognition still only runs for new boxes
+
+Unknown faces are retried on each full pass in case a better view
+comes along. Identified tracks keep their identity until they are lost.
+"""
+
+import itertools
+import threading
+import time
+
+import cv2
+
+TRACKER_KINDS = ('mosse', 'kcf', 'iou')
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = ix * iy
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union else 0.0
+
+
+def create_cv_tracker(kind):
+    if kind == 'mosse':
+        return cv2.legacy.TrackerMOSSE_create()
+    if kind == 'kcf':
+        return cv2.legacy.TrackerKCF_create()
+    return None
+
+
+class Track:
+    """One face followed across frames"""
+
+    def __init__(self, track_id, box, label, color, identified):
+        self.id = track_id
+        self.box = box
+        self.label = label
+        self.color = color
+        self.identified = identified
+        self.misses = 0
+        self.tracker = None
+
+
+class TrackingAnalyzer:
+    """Analysis step for VideoPipeline that tracks faces between full passes
+
+    detect(frame, gray) -> list of (x, y, w, h)
+    identify(gray, box) -> (label, bgr_color, identified)
+
+    identify() is where recognition (and attendance marking) happens; it
+    only runs for new or still-unknown faces.
+    """
+
+    def __init__(self, detect, identify, kind='mosse', detect_interval=1.0,
+                 iou_threshold=0.3, max_misses=2):
+        if kind not in TRACKER_KINDS:
+            raise ValueError(f'Unknown tracker: {kind}')
+        self.detect = detect
+        self.identify = identify
+        self.kind = kind
+        self.detect_interval = detect_interval
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._last_detection = 0.0
+        self._lock = threading.Lock()
+        self._metrics = {'frames': 0, 'detections': 0, 'tracked_frames': 0,
+                         'recognitions': 0, 'skipped_recognitions': 0, 'lost_tracks': 0}
+
+    def __call__(self, frame):
+        """Annotate a frame; None when another worker holds the tracks (frame skipped)"""
+        # Tracks need frames in order, so only one worker at a time
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            self._metrics['frames'] += 1
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            due = time.monotonic() - self._last_detection >= self.detect_interval
+            if self.kind == 'iou' or not self.tracks or due or not self._follow(frame):
+                self._full_pass(frame, gray)
+            return [(*track.box, track.label, track.color) for track in self.tracks]
+        finally:
+            self._lock.release()
+
+    def _follow(self, frame):
+        """Move every track with its correlation tracker; False if one was lost"""
+        for track in self.tracks:
+            ok, box = track.tracker.update(frame)
+            if not ok:
+                self._metrics['lost_tracks'] += 1
+                return False
+            track.box = tuple(int(v) for v in box)
+        self._metrics['tracked_frames'] += 1
+        return True
+
+    def _full_pass(self, frame, gray):
+        self._last_detection = time.monotonic()
+        self._metrics['detections'] += 1
+        boxes = [tuple(int(v) for v in box) for box in self.detect(frame, gray)]
+
+        # Greedy IoU association, best overlaps first
+        pairs = sorted(((iou(track.box, box), t, b) for t, track in enumerate(self.tracks)
+                        for b, box in enumerate(boxes)), reverse=True)
+        matched_tracks, matched_boxes = set(), set()
+        for overlap, t, b in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+            track = self.tracks[t]
+            track.box, track.misses = boxes[b], 0
+            if track.identified:
+                self._metrics['skipped_recognitions'] += 1
+            else:
+                self._recognize(track, gray)
+            self._start_tracker(track, frame)
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+                # Not seen by the detector this time: keep it, re-anchored where
+                # its tracker last had it
+                self._start_tracker(track, frame)
+            survivors.append(track)
+
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                track = Track(next(self._ids), box, 'Unknown', (0, 0, 255), False)
+                self._recognize(track, gray)
+                self._start_tracker(track, frame)
+                survivors.append(track)
+        self.tracks = survivors
+
+    def _recognize(self, track, gray):
+        self._metrics['recognitions'] += 1
+        track.label, track.color, track.identified = self.identify(gray, track.box)
+
+    def _start_tracker(self, track, frame):
+        track.tracker = create_cv_tracker(self.kind)
+        if track.tracker is not None:
+            track.tracker.init(frame, track.box)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._metrics, kind=self.kind, active_tracks=len(self.tracks),
+                        detect_interval=self.detect_interval)
@@ -0,0 +1,85 @@
+"""
+Background Jobs
+Smart Attendance System
+
+Slow work (report exports) runs on a small thread pool instead of inside
+the gunicorn worker handling the request. The request gets a job id back
+and polls GET /api/jobs/<id>.
+
+Jobs are plain dicts. Callers choose the job id; submitting an id that is
+queued, running or finished returns the existing job, so identical report
+requests share one computation. Failed jobs are retried on resubmission.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+
+class JobQueue:
+    """Thread pool plus a bounded registry of recent jobs"""
+
+    def __init__(self, max_workers=2, keep_finished=200):
+        self.max_workers = max_workers
+        self.keep_finished = keep_finished
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pid = None
+        self._executor = None
+
+    def _ensure_started(self):
+        # One executor per process; forked workers start their own
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='job')
+            self._jobs = {}
+            self._pid = os.getpid()
+
+    def submit(self, job_id, fn, *args, **meta):
+        """Run fn(*args) in the background; returns the job dict (a copy)"""
+        with self._lock:
+            self._ensure_started()
+            job = self._jobs.get(job_id)
+            if job is not None and job['state'] != 'failed':
+                return dict(job)
+            job = dict(meta, id=job_id, state='queued', error=None, result=None,
+                       created_at=time.time(), started_at=None, finished_at=None)
+            self._jobs[job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args)
+        return dict(job)
+
+    def _run(self, job, fn, args):
+        job['state'], job['started_at'] = 'running', time.time()
+        try:
+            job['result'] = fn(*args)
+            job['state'] = 'done'
+        except Exception as e:
+            print(f"❌ Job {job['id']} failed: {e}")
+            job['state'], job['error'] = 'failed', str(e)
+        job['finished_at'] = time.time()
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job['state'] in ('done', 'failed')]
+        if len(finished) <= self.keep_finished:
+            return
+        finished.sort(key=lambda job: job['finished_at'])
+        for job in finished[:len(finished) - self.keep_finished]:
+            del self._jobs[job['id']]
+
+    def get(self, job_id):
+        """Return a copy of the job, or None if this process does not know it"""
+        with self._lock:
+            job = self._jobs.get(job_id) if self._pid == os.getpid() else None
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values()) if self._pid == os.getpid() else []
+        counts = {state: 0 for state in JOB_STATES}
+        for job in jobs:
+            counts[job['state']] += 1
+        return dict(counts, max_workers=self.max_workers)
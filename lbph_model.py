@@ -0,0 +1,300 @@
+"""
+LBPH Model Manager
+Smart Attendance System
+
+The OpenCV (LBPH) recognizer used by the server-side video feed is trained
+once and then kept up to date instead of being rebuilt from every stored
+face crop each time a stream starts:
+
+- the trained model is saved with write() next to a JSON sidecar (format
+  version, model version, label -> student map) and read() at startup
+- a new registration is added with LBPH's incremental update()
+- LBPH cannot forget a sample, so deleting a student removes their label
+  from the map at once and retrains from the database in the background
+
+Labels are students.id, which never changes for a student, so a model
+trained by one worker process stays valid for the others. Worker
+processes share the files through a lock file: writes are exclusive,
+reads shared, and at startup one worker trains while the others wait
+and load its model. Without fcntl (Windows) only the per-process
+temporary names protect the files.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MODEL_FORMAT = 1
+
+
+class LBPHModel:
+    """Thread-safe LBPH recognizer with persistence and incremental updates
+
+    load_crops(labels=None) yields (label, info, 100x100 uint8 crop) for the
+    given labels (all when None); list_labels() returns the labels that
+    currently have a crop in the database.
+    """
+
+    def __init__(self, path, load_crops, list_labels, retrain_delay=5.0):
+        self.path = path
+        self.meta_path = None
+        if path:
+            base = path[:-3] if path.endswith('.gz') else path
+            self.meta_path = os.path.splitext(base)[0] + '.json'
+        self.load_crops = load_crops
+        self.list_labels = list_labels
+        self.retrain_delay = retrain_delay
+        self.version = 0
+        self._lock = threading.RLock()
+        self._recognizer = None
+        self._students = {}   # label -> {'id', 'name', 'department'}
+        self._trained = set()  # labels whose samples are inside the recognizer
+        self._retrain_timer = None
+        self._save_timer = None
+        self._training = False
+
+    @property
+    def ready(self):
+        return self._recognizer is not None
+
+    def __len__(self):
+        return len(self._students)
+
+    # ---------- persistence ----------
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        """Hold the model files against other worker processes"""
+        if not self.path or fcntl is None:
+            yield
+            return
+        with open(f'{self.path}.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self):
+        """Read the saved model; False when there is none or it is unreadable"""
+        with self._file_lock(shared=True):
+            return self._read()
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path) or not os.path.exists(self.meta_path):
+            return False
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta.get('format') != MODEL_FORMAT:
+                return False
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.read(self.path)
+        except (OSError, ValueError, cv2.error) as e:
+            print(f"✗ Could not read LBPH model {self.path}: {e}")
+            return False
+        students = {int(label): info for label, info in meta['students'].items()}
+        with self._lock:
+            self._recognizer = recognizer
+            self._students = students
+            self._trained = set(students)
+            self.version = meta['version']
+        return True
+
+    def save(self):
+        """Write the model and its sidecar atomically (no-op without a path)
+
+        write() serialises every histogram, so predictions wait for it; it
+        runs after a retrain and after registrations (debounced). The video
+        pipeline keeps streaming meanwhile, only recognition pauses.
+        """
+        if not self.path:
+            return
+        with self._file_lock():
+            self._write()
+
+    def _write(self):
+        if not self.path:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self._recognizer is None:
+                return
+            self.version += 1
+            # Temporary names are unique per process and keep the extension,
+            # which selects OpenCV's format
+            directory, name = os.path.split(self.path)
+            temporary = []
+            try:
+                for target in (self.path, self.meta_path):
+                    fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=f'.tmp-{os.getpid()}-',
+                                                    suffix=f'-{os.path.basename(target)}')
+                    os.close(fd)
+                    temporary.append(tmp_path)
+                tmp_model, tmp_meta = temporary
+                self._recognizer.write(tmp_model)
+                with open(tmp_meta, 'w') as f:
+                    json.dump({'format': MODEL_FORMAT, 'version': self.version, 'saved_at': time.time(),
+                               'students': {str(label): info for label, info in self._students.items()}}, f)
+                os.replace(tmp_model, self.path)
+                os.replace(tmp_meta, self.meta_path)
+            finally:
+                for tmp_path in temporary:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+
+    def _schedule(self, attr, fn, delay):
+        with self._lock:
+            if getattr(self, attr) is not None:
+                return
+            timer = threading.Timer(delay, fn)
+            timer.daemon = True
+            setattr(self, attr, timer)
+            timer.start()
+
+    def schedule_save(self, delay=10.0):
+        """Coalesce several registrations into one model write"""
+        if self.path:
+            self._schedule('_save_timer', self.save, delay)
+
+    # ---------- training ----------
+
+    def train(self):
+        """Full retrain from the database, swapped in when finished"""
+        with self._lock:
+            self._retrain_timer = None
+            if self._training:
+                return
+            self._training = True
+        try:
+            self._fit()
+            self.save()
+        finally:
+            with self._lock:
+                self._training = False
+        # Pick up registrations that arrived while the crops were being read
+        self.sync()
+
+    def _fit(self):
+        started = time.monotonic()
+        images, labels, students = [], [], {}
+        for label, info, crop in self.load_crops():
+            images.append(crop)
+            labels.append(label)
+            students[label] = info
+        recognizer = None
+        if images:
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.train(images, np.array(labels, dtype=np.int32))
+        with self._lock:
+            self._recognizer, self._students, self._trained = recognizer, students, set(students)
+        print(f"✓ LBPH model trained on {len(images)} faces in {time.monotonic() - started:.2f}s")
+
+    def schedule_retrain(self):
+        """Retrain in the background, once, shortly after a burst of deletes"""
+        self._schedule('_retrain_timer', self.train, self.retrain_delay)
+
+    def _load_or_train(self):
+        # sync() stays a no-op while the saved model is being read or trained
+        with self._lock:
+            self._training = True
+        try:
+            # Workers starting together: the first trains and saves, the
+            # others wait for the lock and load its model
+            with self._file_lock():
+                loaded = self._read()
+                if not loaded:
+                    self._fit()
+                    self._write()
+        finally:
+            with self._lock:
+                self._training = False
+        if loaded:
+            print(f"✓ LBPH model loaded from {self.path} ({len(self)} students, version {self.version})")
+        # Pick up registrations that arrived meanwhile
+        self.sync()
+
+    def start(self):
+        """Startup: load the saved model (or train one) in the background"""
+        thread = threading.Thread(target=self._load_or_train, name='lbph-load', daemon=True)
+        thread.start()
+
+    def add(self, label, info, crop):
+        """Add one student's face with update() instead of retraining"""
+        self.add_many([(label, info, crop)])
+
+    def add_many(self, students):
+        """Add (label, info, crop) faces in a single update() call"""
+        if not students:
+            return
+        crops = [crop for _, _, crop in students]
+        labels = np.array([label for label, _, _ in students], dtype=np.int32)
+        with self._lock:
+            if self._recognizer is None:
+                self._recognizer = cv2.face.LBPHFaceRecognizer_create()
+                self._recognizer.train(crops, labels)
+            else:
+                self._recognizer.update(crops, labels)
+            for label, info, _ in students:
+                self._students[label] = info
+                self._trained.add(label)
+        self.schedule_save()
+
+    def remove(self, label):
+        """Forget a student now; their samples leave the model on the next retrain"""
+        with self._lock:
+            self._students.pop(label, None)
+            if label not in self._trained:
+                return
+        self.schedule_retrain()
+
+    def sync(self):
+        """Catch up with changes made by other worker processes
+
+        Costs one query over student ids; new students are added with
+        update(), and removed ones trigger a background retrain.
+        """
+        if self._training:
+            return
+        current = self.list_labels()
+        with self._lock:
+            added = current - self._trained
+            removed = set(self._students) - current
+        for label in removed:
+            self.remove(label)
+        if added:
+            self.add_many(list(self.load_crops(added)))
+
+    # ---------- prediction ----------
+
+    def predict(self, face):
+        """Return (student info or None, confidence) for a 100x100 grayscale face"""
+        with self._lock:
+            if self._recognizer is None:
+                return None, None
+            label, confidence = self._recognizer.predict(face)
+            return self._students.get(label), confidence
+
+    def predict_many(self, faces):
+        """predict() for a list of faces, against one consistent model"""
+        with self._lock:
+            if self._recognizer is None:
+                return [(None, None)] * len(faces)
+            results = []
+            for face in faces:
+                label, confidence = self._recognizer.predict(face)
+                results.append((self._students.get(label), confidence))
+            return results
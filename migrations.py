@@ -0,0 +1,376 @@
+"""
+Database Schema Migrations
+Smart Attendance System
+
+The applied schema version is kept in SQLite's PRAGMA user_version.
+init_db() creates the original tables, then migrate() runs every newer
+migration in order, each in its own transaction.
+
+Migrations must be safe on databases that already have part of the
+change, because some columns existed before this mechanism did.
+To change the schema, append a function to MIGRATIONS and never edit or
+reorder the ones already released.
+"""
+
+from datetime import datetime, timezone
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _add_column(conn, table, column, definition):
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def descriptor_storage(conn):
+    """Packed descriptors, enrolment samples and gallery versioning"""
+    # 100x100 LBPH crops get their own column; descriptor_version records
+    # the gallery version of a student's last descriptor change
+    _add_column(conn, 'students', 'face_crop', 'BLOB')
+    _add_column(conn, 'students', 'descriptor_version', 'INTEGER NOT NULL DEFAULT 1')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_students_descriptor_version ON students(descriptor_version)')
+
+    # Gallery version counter (single row) and deleted-student tombstones,
+    # used for ETags and ?since= delta sync of face descriptors
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gallery_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO gallery_state (id, version, updated_at) VALUES (1, 1, ?)",
+                 (datetime.now(timezone.utc).isoformat(timespec='seconds'),))
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS descriptor_tombstones (
+            student_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+
+    # Enrolment samples; students.encoding_data holds their centroid
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS face_descriptors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            descriptor BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (student_id) REFERENCES students(student_id)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_face_descriptors_student ON face_descriptors(student_id)')
+
+
+def attendance_indexes(conn):
+    """One attendance row per student per day, indexed both ways"""
+    # Older code could insert the same student twice in one day (SELECT-then-
+    # INSERT race); keep the earliest mark before enforcing uniqueness
+    removed = conn.execute('''
+        DELETE FROM attendance WHERE id NOT IN (
+            SELECT MIN(id) FROM attendance GROUP BY student_id, date
+        )
+    ''').rowcount
+    if removed:
+        print(f"✓ Removed {removed} duplicate attendance rows")
+
+    # SQLite cannot add a table constraint in place; a unique index enforces
+    # UNIQUE(student_id, date) identically and is the ON CONFLICT target
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance(student_id, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_attendance_date_student ON attendance(date, student_id)')
+
+
+def attendance_rollups(conn):
+    """Daily attendance rollups per student and per department"""
+    # Per student per day: what range reports aggregate instead of scanning
+    # attendance. The (date, student_id) primary key makes month/range
+    # queries a contiguous range scan.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_daily_summary (
+            date TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            department TEXT NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            first_time TEXT,
+            PRIMARY KEY (date, student_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_daily_summary_student ON attendance_daily_summary(student_id, date)')
+    # Per department per day; a row exists for every day attendance was taken
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_department_daily (
+            date TEXT NOT NULL,
+            department TEXT NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, department)
+        ) WITHOUT ROWID
+    ''')
+
+    # Kept in step with attendance by triggers, so every writer (requests,
+    # the write-behind queue, the camera stream, sqlite3 shell) updates them
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_insert AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO attendance_daily_summary (date, student_id, name, department, present, first_time)
+            VALUES (NEW.date, NEW.student_id, NEW.name, NEW.department,
+                    NEW.status = 'Present', NEW.time)
+            ON CONFLICT(date, student_id) DO UPDATE SET
+                present = present + excluded.present,
+                first_time = MIN(first_time, excluded.first_time);
+            INSERT INTO attendance_department_daily (date, department, present)
+            VALUES (NEW.date, NEW.department, NEW.status = 'Present')
+            ON CONFLICT(date, department) DO UPDATE SET present = present + excluded.present;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_delete AFTER DELETE ON attendance
+        BEGIN
+            UPDATE attendance_daily_summary SET present = present - (OLD.status = 'Present')
+            WHERE date = OLD.date AND student_id = OLD.student_id;
+            DELETE FROM attendance_daily_summary
+            WHERE date = OLD.date AND student_id = OLD.student_id
+              AND NOT EXISTS (SELECT 1 FROM attendance WHERE date = OLD.date AND student_id = OLD.student_id);
+            UPDATE attendance_department_daily SET present = present - (OLD.status = 'Present')
+            WHERE date = OLD.date AND department = OLD.department;
+            DELETE FROM attendance_department_daily
+            WHERE date = OLD.date AND department = OLD.department
+              AND NOT EXISTS (SELECT 1 FROM attendance WHERE date = OLD.date AND department = OLD.department);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_update
+        AFTER UPDATE OF date, student_id, department, status ON attendance
+        BEGIN
+            UPDATE attendance_daily_summary SET present = present - (OLD.status = 'Present')
+            WHERE date = OLD.date AND student_id = OLD.student_id;
+            DELETE FROM attendance_daily_summary
+            WHERE date = OLD.date AND student_id = OLD.student_id
+              AND NOT EXISTS (SELECT 1 FROM attendance WHERE date = OLD.date AND student_id = OLD.student_id);
+            UPDATE attendance_department_daily SET present = present - (OLD.status = 'Present')
+            WHERE date = OLD.date AND department = OLD.department;
+            DELETE FROM attendance_department_daily
+            WHERE date = OLD.date AND department = OLD.department
+              AND NOT EXISTS (SELECT 1 FROM attendance WHERE date = OLD.date AND department = OLD.department);
+            INSERT INTO attendance_daily_summary (date, student_id, name, department, present, first_time)
+            VALUES (NEW.date, NEW.student_id, NEW.name, NEW.department,
+                    NEW.status = 'Present', NEW.time)
+            ON CONFLICT(date, student_id) DO UPDATE SET
+                present = present + excluded.present,
+                first_time = MIN(first_time, excluded.first_time);
+            INSERT INTO attendance_department_daily (date, department, present)
+            VALUES (NEW.date, NEW.department, NEW.status = 'Present')
+            ON CONFLICT(date, department) DO UPDATE SET present = present + excluded.present;
+        END
+    ''')
+
+    # Backfill from existing history
+    conn.execute('DELETE FROM attendance_daily_summary')
+    conn.execute('DELETE FROM attendance_department_daily')
+    conn.execute('''
+        INSERT INTO attendance_daily_summary (date, student_id, name, department, present, first_time)
+        SELECT date, student_id, MIN(name), MIN(department), SUM(status = 'Present'), MIN(time)
+        FROM attendance GROUP BY date, student_id
+    ''')
+    conn.execute('''
+        INSERT INTO attendance_department_daily (date, department, present)
+        SELECT date, department, SUM(status = 'Present') FROM attendance GROUP BY date, department
+    ''')
+
+
+def attendance_browse_indexes(conn):
+    """Indexes for paging attendance newest-first, by date, department and section"""
+    # view_attendance pages in (date, time, id) order with a keyset cursor;
+    # the rowid rides along in every index, so (date, time) is enough
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_attendance_date_time ON attendance(date, time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_attendance_department_date_time ON attendance(department, date, time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_students_section ON students(section)')
+
+
+# Latest 10 marks of a student as a JSON array, newest first (trigger SQL)
+RECENT_MARKS_SQL = '''(
+    SELECT json_group_array(json_object('date', date, 'time', time, 'status', status)) FROM (
+        SELECT date, time, status FROM attendance WHERE student_id = {student}
+        ORDER BY date DESC, time DESC LIMIT 10
+    )
+)'''
+
+
+# A student's Present marks on working days (trigger SQL)
+PRESENT_DAYS_SQL = '''
+    SELECT COUNT(*) FROM attendance a JOIN working_days w ON w.date = a.date
+    WHERE a.student_id = {student} AND a.status = 'Present'
+'''
+
+
+def working_calendar(conn):
+    """Working-day calendar and per-student attendance stats"""
+    # The days attendance is expected on. Until a calendar is configured
+    # (calendar_state.auto = 1), days attendance was taken on are added
+    # automatically, so the count stays "any day someone was marked";
+    # `flask calendar add/remove` switches that off. version is bumped on
+    # every change, so other processes know to drop cached counts
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS working_days (
+            date TEXT PRIMARY KEY,
+            term TEXT NOT NULL DEFAULT '',
+            note TEXT NOT NULL DEFAULT ''
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS calendar_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            auto INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO calendar_state (id, version, auto) VALUES (1, 1, 1)')
+    conn.execute('''
+        INSERT OR IGNORE INTO working_days (date)
+        SELECT DISTINCT date FROM attendance_department_daily
+    ''')
+
+    # One row per student, what the student dashboard shows. present_days
+    # counts Present marks on working days; eligible_days counts working
+    # days from enrolled_on up to eligible_as_of, and is brought up to date
+    # by the app on the first read of each day
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS student_stats (
+            student_id TEXT PRIMARY KEY,
+            enrolled_on TEXT NOT NULL,
+            present_days INTEGER NOT NULL DEFAULT 0,
+            eligible_days INTEGER NOT NULL DEFAULT 0,
+            eligible_as_of TEXT,
+            last_seen TEXT,
+            recent TEXT NOT NULL DEFAULT '[]'
+        )
+    ''')
+
+    # A day joining or leaving the calendar changes the eligible days of
+    # everyone enrolled by then, and the present days of everyone marked on it
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_working_days_insert AFTER INSERT ON working_days
+        BEGIN
+            UPDATE student_stats SET eligible_days = eligible_days + 1
+            WHERE enrolled_on <= NEW.date AND NEW.date <= eligible_as_of;
+            UPDATE student_stats SET present_days = present_days + 1
+            WHERE student_id IN (SELECT student_id FROM attendance
+                                 WHERE date = NEW.date AND status = 'Present');
+            UPDATE calendar_state SET version = version + 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_working_days_delete AFTER DELETE ON working_days
+        BEGIN
+            UPDATE student_stats SET eligible_days = eligible_days - 1
+            WHERE enrolled_on <= OLD.date AND OLD.date <= eligible_as_of;
+            UPDATE student_stats SET present_days = present_days - 1
+            WHERE student_id IN (SELECT student_id FROM attendance
+                                 WHERE date = OLD.date AND status = 'Present');
+            UPDATE calendar_state SET version = version + 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_students_stats_insert AFTER INSERT ON students
+        BEGIN
+            INSERT OR IGNORE INTO student_stats (student_id, enrolled_on)
+            VALUES (NEW.student_id, date(COALESCE(NEW.created_at, 'now'), 'localtime'));
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_students_stats_delete AFTER DELETE ON students
+        BEGIN
+            DELETE FROM student_stats WHERE student_id = OLD.student_id;
+        END
+    ''')
+    # A mark from before the enrolment date (imported history) moves the
+    # enrolment back; clearing eligible_as_of makes the app recount.
+    # The day is added to an automatic calendar after the row is counted,
+    # so trg_working_days_insert counts it exactly once
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_stats_insert AFTER INSERT ON attendance
+        BEGIN
+            UPDATE student_stats SET
+                present_days = present_days + (NEW.status = 'Present' AND
+                    EXISTS (SELECT 1 FROM working_days WHERE date = NEW.date)),
+                last_seen = MAX(COALESCE(last_seen, ''), NEW.date || ' ' || NEW.time),
+                recent = {RECENT_MARKS_SQL.format(student='NEW.student_id')},
+                enrolled_on = MIN(enrolled_on, NEW.date),
+                eligible_as_of = CASE WHEN NEW.date < enrolled_on THEN NULL ELSE eligible_as_of END
+            WHERE student_id = NEW.student_id;
+            INSERT OR IGNORE INTO working_days (date)
+            SELECT NEW.date WHERE (SELECT auto FROM calendar_state WHERE id = 1);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_stats_delete AFTER DELETE ON attendance
+        BEGIN
+            UPDATE student_stats SET
+                present_days = present_days - (OLD.status = 'Present' AND
+                    EXISTS (SELECT 1 FROM working_days WHERE date = OLD.date)),
+                last_seen = (SELECT MAX(date || ' ' || time) FROM attendance WHERE student_id = OLD.student_id),
+                recent = {RECENT_MARKS_SQL.format(student='OLD.student_id')}
+            WHERE student_id = OLD.student_id;
+        END
+    ''')
+    # Recounted after the day is added, so the count is exact either way
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_stats_update
+        AFTER UPDATE OF student_id, date, time, status ON attendance
+        BEGIN
+            INSERT OR IGNORE INTO working_days (date)
+            SELECT NEW.date WHERE (SELECT auto FROM calendar_state WHERE id = 1);
+            UPDATE student_stats SET
+                present_days = ({PRESENT_DAYS_SQL.format(student='student_stats.student_id')}),
+                last_seen = (SELECT MAX(date || ' ' || time) FROM attendance
+                             WHERE student_id = student_stats.student_id),
+                recent = {RECENT_MARKS_SQL.format(student='student_stats.student_id')},
+                enrolled_on = MIN(enrolled_on, NEW.date),
+                eligible_as_of = CASE WHEN NEW.date < enrolled_on THEN NULL ELSE eligible_as_of END
+            WHERE student_id IN (OLD.student_id, NEW.student_id);
+        END
+    ''')
+
+    # Backfill; eligible days are counted by the app on first read
+    conn.execute('DELETE FROM student_stats')
+    conn.execute(f'''
+        INSERT INTO student_stats (student_id, enrolled_on, present_days, last_seen, recent)
+        SELECT s.student_id,
+               MIN(date(COALESCE(s.created_at, 'now'), 'localtime'),
+                   COALESCE((SELECT MIN(date) FROM attendance WHERE student_id = s.student_id), '9999-12-31')),
+               ({PRESENT_DAYS_SQL.format(student='s.student_id')}),
+               (SELECT MAX(date || ' ' || time) FROM attendance WHERE student_id = s.student_id),
+               {RECENT_MARKS_SQL.format(student='s.student_id')}
+        FROM students s
+    ''')
+
+
+MIGRATIONS = [
+    descriptor_storage,
+    attendance_indexes,
+    attendance_rollups,
+    attendance_browse_indexes,
+    working_calendar,
+]
+
+
+def migrate(conn):
+    """Apply pending migrations; safe to run from several workers at once"""
+    while True:
+        # BEGIN IMMEDIATE takes the write lock before reading the version, so
+        # two gunicorn workers starting together cannot apply the same step
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= len(MIGRATIONS):
+            conn.rollback()
+            return version
+        migration = MIGRATIONS[version]
+        try:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"✓ Applied database migration {version + 1}: {migration.__doc__}")
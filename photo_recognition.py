@@ -0,0 +1,86 @@
+"""
+Group Photo Face Detection
+Smart Attendance System
+
+Classroom photos contain many small faces at different distances. One
+detectMultiScale call over a full-resolution photo walks every scale
+serially. Here the work is split into size bands on an image pyramid:
+
+    band k: the photo downscaled by 2**k, searching faces of
+            min_face .. 2 * min_face pixels at that level, i.e. faces of
+            min_face * 2**k .. min_face * 2**(k+1) pixels in the original
+
+Each band is an independent job for a thread pool (OpenCV releases the
+GIL), the small levels are cheap, and the results are merged with
+non-maximum suppression where neighbouring bands found the same face.
+Every worker thread has its own CascadeClassifier, which is not safe to
+share between threads.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+
+class PyramidDetector:
+    """Haar face detection over a size-banded image pyramid on a thread pool"""
+
+    def __init__(self, cascade_path, workers=4, min_face=24, scale_factor=1.2,
+                 min_neighbors=5, nms_threshold=0.3):
+        self.cascade_path = cascade_path
+        self.min_face = min_face
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.nms_threshold = nms_threshold
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo-detect')
+
+    def _cascade(self):
+        cascade = getattr(self._local, 'cascade', None)
+        if cascade is None:
+            cascade = self._local.cascade = cv2.CascadeClassifier(self.cascade_path)
+        return cascade
+
+    def bands(self, shape):
+        """Pyramid levels (k) needed for an image of this shape"""
+        smallest_side = min(shape[:2])
+        k = 0
+        while self.min_face * 2 ** k <= smallest_side:
+            yield k
+            k += 1
+
+    def _detect_band(self, gray, k, last):
+        scale = 2 ** k
+        level = gray if k == 0 else cv2.resize(
+            gray, (gray.shape[1] // scale, gray.shape[0] // scale), interpolation=cv2.INTER_AREA)
+        max_size = (0, 0) if last else (2 * self.min_face, 2 * self.min_face)
+        rects, neighbours = self._cascade().detectMultiScale2(
+            level, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+            minSize=(self.min_face, self.min_face), maxSize=max_size)
+        return [((int(x * scale), int(y * scale), int(w * scale), int(h * scale)), int(n))
+                for (x, y, w, h), n in zip(rects, neighbours)]
+
+    def detect_many(self, grays):
+        """Detect faces in several grayscale images at once; one box list per image"""
+        jobs = []
+        for index, gray in enumerate(grays):
+            levels = list(self.bands(gray.shape))
+            for k in levels:
+                jobs.append((index, self._executor.submit(self._detect_band, gray, k, k == levels[-1])))
+
+        found = [[] for _ in grays]
+        for index, job in jobs:
+            found[index].extend(job.result())
+        return [self._suppress(candidates) for candidates in found]
+
+    def detect(self, gray):
+        return self.detect_many([gray])[0]
+
+    def _suppress(self, candidates):
+        if not candidates:
+            return []
+        boxes = [list(box) for box, _ in candidates]
+        scores = [float(score) for _, score in candidates]
+        keep = cv2.dnn.NMSBoxes(boxes, scores, 0.0, self.nms_threshold)
+        return sorted((tuple(boxes[i]) for i in (int(i) for i in keep)), key=lambda b: (b[1], b[0]))
@@ -0,0 +1,173 @@
+"""
+Streaming Report Export
+Smart Attendance System
+
+Reports are written straight from a SQLite cursor, a chunk of rows at a
+time, so memory stays bounded however long the period is:
+
+- CSV:  text chunks from csv_chunks(), streamed or written to a file
+- XLSX: openpyxl write-only workbook (rows go to temporary XML parts on
+        disk, not an in-memory sheet), saved into a caller-supplied file
+
+Finished reports are kept in a ReportCache on disk, keyed by what they
+contain (report type, period, format and a fingerprint of the underlying
+rows), so a closed month is generated once and then served as a file.
+While a report is being generated, a small state file next to it records
+'queued', 'running' or 'failed', so every worker process can answer a
+poll for a job another one is running.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+CHUNK_ROWS = 500
+
+
+def iter_rows(cursor, chunk_rows=CHUNK_ROWS):
+    """Yield rows from a cursor via fetchmany() instead of fetchall()"""
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield from rows
+
+
+def csv_chunks(columns, rows, chunk_rows=CHUNK_ROWS):
+    """Yield CSV text (header first) in chunks of about `chunk_rows` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(tuple(row))
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(columns, rows, fileobj, sheet_title='Attendance'):
+    """Write a single-sheet workbook to a binary file object"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title)
+    sheet.append(list(columns))
+    for row in rows:
+        sheet.append(tuple(row))
+    workbook.save(fileobj)
+
+
+class ReportCache:
+    """Directory of generated report files plus a small JSON sidecar each"""
+
+    def __init__(self, directory, max_entries=200, stale_seconds=900):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds  # a job state older than this was interrupted
+
+    @staticmethod
+    def key_id(key):
+        """Stable id for a key tuple; also used as the job id"""
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:24]
+
+    def _meta_path(self, artifact_id):
+        return os.path.join(self.directory, f'{artifact_id}.json')
+
+    def _state_path(self, artifact_id):
+        return os.path.join(self.directory, f'{artifact_id}.state')
+
+    def set_state(self, artifact_id, state, error=None):
+        """Record a job's state ('queued', 'running', 'failed') for every worker process"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'state': state, 'error': error, 'updated_at': time.time()}, f)
+        os.replace(tmp_path, self._state_path(artifact_id))
+
+    def clear_state(self, artifact_id):
+        try:
+            os.unlink(self._state_path(artifact_id))
+        except FileNotFoundError:
+            pass
+
+    def state(self, artifact_id):
+        """Return {'state', 'error', 'updated_at'} for an unfinished job, or None
+
+        A queued or running state not updated for `stale_seconds` belonged
+        to a process that died, and is reported as failed.
+        """
+        if not artifact_id.isalnum():
+            return None
+        try:
+            with open(self._state_path(artifact_id)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state['state'] != 'failed' and time.time() - state['updated_at'] > self.stale_seconds:
+            state = dict(state, state='failed', error='Report generation was interrupted')
+        return state
+
+    def get(self, artifact_id):
+        """Return {'path', 'filename', 'mimetype', ...} for a cached artifact, or None"""
+        if not artifact_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(artifact_id)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        meta['path'] = os.path.join(self.directory, meta['file'])
+        return meta if os.path.exists(meta['path']) else None
+
+    def write(self, artifact_id, filename, mimetype, write_fn):
+        """Create an artifact with write_fn(binary file); atomic for concurrent readers"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = artifact_id + os.path.splitext(filename)[1]
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write_fn(f)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        meta = {'file': name, 'filename': filename, 'mimetype': mimetype}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(artifact_id))
+        self.clear_state(artifact_id)
+        self.prune()
+        return self.get(artifact_id)
+
+    def prune(self):
+        """Drop the least recently written artifacts beyond max_entries, and old job states"""
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        now = time.time()
+        for entry in entries:
+            if entry.name.endswith('.state') and now - entry.stat().st_mtime > self.stale_seconds:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+        metas = [entry for entry in entries if entry.name.endswith('.json')]
+        if len(metas) <= self.max_entries:
+            return
+        metas.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in metas[:len(metas) - self.max_entries]:
+            artifact_id = entry.name[:-len('.json')]
+            for name in os.listdir(self.directory):
+                if name.startswith(artifact_id):
+                    try:
+                        os.unlink(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
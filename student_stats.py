@@ -0,0 +1,98 @@
+"""
+Student Stats Cache
+Smart Attendance System
+
+The student dashboard reads one row of the student_stats table (present
+days, eligible days, last seen, latest 10 marks), which triggers keep up
+to date on every attendance and calendar change (see migrations.py).
+
+Eligible days grow when a working day arrives without any write, so they
+are recounted for every stale row by the first read of each day. Rows
+are then kept in a small LRU cache per worker process:
+
+- entries are dropped when the student is marked or deleted
+- the whole cache is dropped when the calendar version changes, which
+  every read checks first, so `flask calendar` edits made from another
+  process apply to the next read
+- entries expire after `ttl_seconds`, which picks up marks made by
+  other processes, and at midnight
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+
+def refresh_eligible_days(conn, today):
+    """Recount eligible days up to `today` for rows not yet counted for it; returns the row count"""
+    return conn.execute('''
+        UPDATE student_stats SET
+            eligible_days = (SELECT COUNT(*) FROM working_days
+                             WHERE date BETWEEN student_stats.enrolled_on AND ?),
+            eligible_as_of = ?
+        WHERE eligible_as_of IS NOT ?
+    ''', (today, today, today)).rowcount
+
+
+class StudentStatsCache:
+    """LRU cache of student_stats rows
+
+    load(student_id, today) returns the student's stats dict (eligible
+    days counted up to `today`) or None; version() returns the calendar
+    version.
+    """
+
+    def __init__(self, load, max_entries=4096, ttl_seconds=60.0, version=None):
+        self.load = load
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # student_id -> (day, loaded_at, stats)
+        self._generation = 0  # bumped by every invalidation
+        self._calendar_version = None
+
+    def get(self, student_id):
+        today = date.today().strftime('%Y-%m-%d')
+        calendar_version = self.version() if self.version is not None else None
+        with self._lock:
+            if calendar_version != self._calendar_version:
+                self._calendar_version = calendar_version
+                self._generation += 1
+                self._entries.clear()
+            entry = self._entries.get(student_id)
+            if entry is not None and entry[0] == today and time.monotonic() - entry[1] <= self.ttl_seconds:
+                self._entries.move_to_end(student_id)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation
+
+        # Loaded outside the lock; only cached when no invalidation ran
+        # meanwhile, which could have been for a write this read missed
+        stats = self.load(student_id, today)
+        with self._lock:
+            if stats is not None and generation == self._generation:
+                self._entries[student_id] = (today, time.monotonic(), stats)
+                self._entries.move_to_end(student_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return stats
+
+    def invalidate(self, student_ids):
+        with self._lock:
+            self._generation += 1
+            for student_id in student_ids:
+                self._entries.pop(student_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,39 @@
+"""
+Test fixtures
+Smart Attendance System
+
+app.py opens its database, report cache and model files at import time,
+all next to DATABASE_PATH, so it is pointed at a temporary directory
+before the first import.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix='attendance-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(_workdir, 'attendance.db')
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def db(app_module, tmp_path, monkeypatch):
+    """A fresh database with the app's full schema (init_db + migrations)"""
+    path = str(tmp_path / 'attendance.db')
+    monkeypatch.setattr(app_module, 'DATABASE', path)
+    app_module.init_db()
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
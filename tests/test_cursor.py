@@ -0,0 +1,42 @@
+"""
+Keyset cursors of the attendance browser (encode_cursor / decode_cursor)
+"""
+
+import base64
+import json
+
+import pytest
+
+
+def test_round_trip(app_module):
+    row = {'date': '2026-10-05', 'time': '09:15:00', 'id': 123456}
+    token = app_module.encode_cursor(row)
+    assert '=' not in token
+    assert app_module.decode_cursor(token) == ('2026-10-05', '09:15:00', 123456)
+
+
+def test_round_trip_any_padding(app_module):
+    # Tokens of every length modulo 4 decode without their stripped padding
+    for row_id in (1, 12, 123, 1234):
+        row = {'date': '2026-10-05', 'time': '09:15:00', 'id': row_id}
+        assert app_module.decode_cursor(app_module.encode_cursor(row))[2] == row_id
+
+
+def token(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('bad', [
+    '',
+    'not a cursor',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    token({'date': '2026-10-05'}),
+    token(['2026-10-05', '09:15:00']),
+    token(['2026-10-05', '09:15:00', 1, 2]),
+    token(['2026-10-05', '09:15:00', '7']),
+    token(['2026-10-05', 915, 7]),
+    token([None, '09:15:00', 7]),
+])
+def test_malformed_cursor(app_module, bad):
+    with pytest.raises(ValueError):
+        app_module.decode_cursor(bad)
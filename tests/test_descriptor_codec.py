@@ -0,0 +1,76 @@
+"""
+Binary descriptor storage format (descriptor_codec.py)
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from descriptor_codec import (DESCRIPTOR_SIZE, HEADER, decode_descriptor, decode_descriptors,
+                              decode_legacy, encode_descriptors, is_packed)
+
+
+def test_single_descriptor_round_trip():
+    vector = np.random.default_rng(0).normal(size=DESCRIPTOR_SIZE).astype(np.float32)
+    blob = encode_descriptors(vector)
+    assert len(blob) == HEADER.size + 4 * DESCRIPTOR_SIZE == 520
+    assert is_packed(blob)
+    decoded = decode_descriptors(blob)
+    assert decoded.shape == (1, DESCRIPTOR_SIZE)
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded[0], vector)
+    np.testing.assert_array_equal(decode_descriptor(blob), vector)
+
+
+def test_several_descriptors_round_trip():
+    vectors = np.random.default_rng(1).normal(size=(5, DESCRIPTOR_SIZE))
+    decoded = decode_descriptors(encode_descriptors(vectors))
+    np.testing.assert_array_equal(decoded, vectors.astype(np.float32))
+    # A read-only view over the stored bytes, not a copy
+    assert not decoded.flags.writeable
+
+
+def test_sqlite_round_trip(db):
+    vectors = np.random.default_rng(2).normal(size=(3, DESCRIPTOR_SIZE)).astype(np.float32)
+    db.execute("INSERT INTO students (student_id, name, department, year, section, encoding_data) "
+               "VALUES ('S001', 'A', 'CSE', '3', 'A', ?)", (encode_descriptors(vectors),))
+    blob = db.execute("SELECT encoding_data FROM students WHERE student_id = 'S001'").fetchone()[0]
+    np.testing.assert_array_equal(decode_descriptors(blob), vectors)
+
+
+def test_empty_blob():
+    blob = encode_descriptors(np.empty((0, DESCRIPTOR_SIZE)))
+    assert decode_descriptors(blob).shape == (0, DESCRIPTOR_SIZE)
+    assert decode_descriptor(blob) is None
+    assert decode_descriptor(None) is None
+    assert decode_descriptor(b'') is None
+
+
+def test_rejects_bad_header():
+    blob = bytearray(encode_descriptors(np.zeros(DESCRIPTOR_SIZE)))
+    blob[2] = 99  # format version
+    with pytest.raises(ValueError):
+        decode_descriptors(bytes(blob))
+    with pytest.raises(ValueError):
+        decode_descriptors(b'XX' + bytes(blob[2:]))
+
+
+def test_legacy_formats():
+    vector = np.arange(DESCRIPTOR_SIZE, dtype=np.float32) / 100
+    kind, value = decode_legacy(json.dumps(vector.tolist()))
+    assert kind == 'descriptor'
+    np.testing.assert_allclose(value, vector)
+    np.testing.assert_allclose(decode_descriptor(json.dumps(vector.tolist()).encode()), vector)
+
+    kind, value = decode_legacy(vector.astype(np.float64).tobytes())
+    assert kind == 'descriptor'
+    np.testing.assert_allclose(value, vector)
+
+    crop = np.full((100, 100), 7, dtype=np.uint8)
+    kind, value = decode_legacy(crop.tobytes())
+    assert kind == 'crop'
+    np.testing.assert_array_equal(value, crop)
+    assert decode_descriptor(crop.tobytes()) is None
+
+    assert decode_legacy(b'garbage') == (None, None)
@@ -0,0 +1,26 @@
+"""
+Client timestamps of queued marks (resolve_mark_time)
+"""
+
+from datetime import datetime
+
+import pytest
+
+NOW = datetime(2026, 10, 5, 9, 15, 0)
+
+
+def test_epoch_millis_and_iso(app_module):
+    moment = datetime(2026, 10, 5, 8, 30, 0)
+    millis = moment.timestamp() * 1000
+    assert app_module.resolve_mark_time(millis, NOW) == ('2026-10-05', '08:30:00')
+    assert app_module.resolve_mark_time('2026-10-05T08:30:00', NOW) == ('2026-10-05', '08:30:00')
+    assert app_module.resolve_mark_time(None, NOW) == ('2026-10-05', '09:15:00')
+
+
+@pytest.mark.parametrize('bad', [
+    1e20, -1e20, float('inf'), float('nan'),
+    '0001-01-01T00:00:00+14:00', 'yesterday', True, [1],
+])
+def test_invalid_timestamp(app_module, bad):
+    with pytest.raises(ValueError):
+        app_module.resolve_mark_time(bad, NOW)
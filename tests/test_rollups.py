@@ -0,0 +1,197 @@
+"""
+Trigger-maintained rollups (migrations.py) against a recount from attendance
+
+attendance_daily_summary, attendance_department_daily, student_stats and
+working_days are written only by triggers; after every mark, update and
+delete they must equal what a query over attendance gives.
+"""
+
+import json
+
+import pytest
+
+from migrations import attendance_rollups, working_calendar
+from student_stats import refresh_eligible_days
+
+TODAY = '2026-10-30'
+
+
+def enrol(conn, student_id, department='CSE', created_at='2026-10-01 12:00:00'):
+    conn.execute('''
+        INSERT INTO students (student_id, name, department, year, section, created_at)
+        VALUES (?, ?, ?, '3', 'A', ?)
+    ''', (student_id, f'Student {student_id}', department, created_at))
+
+
+def mark(conn, student_id, day, time='09:00:00', status='Present'):
+    """Insert a mark the way mark_attendance_rows does"""
+    conn.execute('''
+        INSERT INTO attendance (student_id, name, department, date, time, status)
+        SELECT student_id, name, department, ?, ?, ? FROM students WHERE student_id = ?
+        ON CONFLICT(student_id, date) DO NOTHING
+    ''', (day, time, status, student_id))
+
+
+def rows(conn, sql, params=()):
+    return sorted(tuple(row) for row in conn.execute(sql, params))
+
+
+def working_days(conn):
+    return {row[0] for row in conn.execute('SELECT date FROM working_days')}
+
+
+def calendar_version(conn):
+    return conn.execute('SELECT version FROM calendar_state WHERE id = 1').fetchone()[0]
+
+
+def assert_rollups(conn):
+    assert rows(conn, 'SELECT * FROM attendance_daily_summary') == rows(conn, '''
+        SELECT date, student_id, MIN(name), MIN(department), SUM(status = 'Present'), MIN(time)
+        FROM attendance GROUP BY date, student_id
+    ''')
+    assert rows(conn, 'SELECT * FROM attendance_department_daily') == rows(conn, '''
+        SELECT date, department, SUM(status = 'Present') FROM attendance GROUP BY date, department
+    ''')
+
+    refresh_eligible_days(conn, TODAY)
+    for stats in conn.execute('SELECT * FROM student_stats').fetchall():
+        student_id = stats['student_id']
+        present = conn.execute('''
+            SELECT COUNT(*) FROM attendance
+            WHERE student_id = ? AND status = 'Present' AND date IN (SELECT date FROM working_days)
+        ''', (student_id,)).fetchone()[0]
+        eligible = conn.execute('SELECT COUNT(*) FROM working_days WHERE date BETWEEN ? AND ?',
+                                (stats['enrolled_on'], TODAY)).fetchone()[0]
+        marks = conn.execute('''
+            SELECT date, time, status FROM attendance WHERE student_id = ?
+            ORDER BY date DESC, time DESC
+        ''', (student_id,)).fetchall()
+        assert stats['present_days'] == present, student_id
+        assert stats['eligible_days'] == eligible, student_id
+        assert stats['last_seen'] == (f"{marks[0]['date']} {marks[0]['time']}" if marks else None)
+        assert json.loads(stats['recent']) == [dict(mark) for mark in marks[:10]]
+    assert {row[0] for row in conn.execute('SELECT student_id FROM student_stats')} == \
+        {row[0] for row in conn.execute('SELECT student_id FROM students')}
+
+
+@pytest.fixture
+def school(db):
+    enrol(db, 'S001')
+    enrol(db, 'S002')
+    enrol(db, 'S003', department='ECE')
+    db.commit()
+    return db
+
+
+def test_rollups_follow_marks_updates_and_deletes(school):
+    conn = school
+    for day in ('2026-10-05', '2026-10-06', '2026-10-07'):
+        mark(conn, 'S001', day)
+        mark(conn, 'S003', day, time='09:30:00')
+    mark(conn, 'S002', '2026-10-06', time='08:45:00')
+    mark(conn, 'S001', '2026-10-05', time='10:00:00')  # repeat of the day: ignored
+    assert_rollups(conn)
+    # Automatic calendar: every day attendance was taken on is a working day
+    assert working_days(conn) == {'2026-10-05', '2026-10-06', '2026-10-07'}
+
+    conn.execute("UPDATE attendance SET status = 'Absent' WHERE student_id = 'S003' AND date = '2026-10-06'")
+    assert_rollups(conn)
+
+    conn.execute("UPDATE attendance SET date = '2026-10-08' WHERE student_id = 'S001' AND date = '2026-10-07'")
+    assert_rollups(conn)
+    assert '2026-10-08' in working_days(conn)
+
+    conn.execute("DELETE FROM attendance WHERE student_id = 'S002'")
+    assert_rollups(conn)
+    assert 'S002' not in {row[1] for row in conn.execute('SELECT * FROM attendance_daily_summary')}
+
+    # A mark from before enrolment moves the enrolment date back
+    mark(conn, 'S002', '2026-09-28')
+    assert_rollups(conn)
+    assert conn.execute("SELECT enrolled_on FROM student_stats WHERE student_id = 'S002'").fetchone()[0] \
+        == '2026-09-28'
+
+    conn.execute("DELETE FROM attendance WHERE student_id = 'S003'")
+    conn.execute("DELETE FROM students WHERE student_id = 'S003'")
+    assert_rollups(conn)
+
+
+def test_manual_calendar(school, app_module):
+    conn = school
+    app_module.set_calendar_auto(conn, False)
+    conn.executemany('INSERT INTO working_days (date) VALUES (?)',
+                     [('2026-10-05',), ('2026-10-06',), ('2026-10-07',)])
+    version = calendar_version(conn)
+
+    mark(conn, 'S001', '2026-10-05')
+    mark(conn, 'S001', '2026-10-10')  # a Saturday: not a working day
+    mark(conn, 'S002', '2026-10-10')
+    assert_rollups(conn)
+    assert working_days(conn) == {'2026-10-05', '2026-10-06', '2026-10-07'}
+    assert calendar_version(conn) == version
+
+    conn.execute("INSERT INTO working_days (date) VALUES ('2026-10-10')")
+    assert_rollups(conn)
+    assert calendar_version(conn) == version + 1
+
+    conn.execute("DELETE FROM working_days WHERE date = '2026-10-05'")
+    assert_rollups(conn)
+    assert calendar_version(conn) == version + 2
+
+    conn.execute("UPDATE attendance SET date = '2026-10-11' WHERE student_id = 'S002'")
+    assert_rollups(conn)
+    assert '2026-10-11' not in working_days(conn)
+
+    # Deleting a mark from a day outside the calendar leaves present days alone
+    mark(conn, 'S003', '2026-10-06')
+    mark(conn, 'S003', '2026-10-17')
+    conn.execute("DELETE FROM attendance WHERE student_id IN ('S002', 'S003') AND date IN ('2026-10-11', '2026-10-17')")
+    assert_rollups(conn)
+
+
+def test_backfill_matches_triggers(school):
+    conn = school
+    for i, day in enumerate(('2026-10-05', '2026-10-06', '2026-10-07', '2026-10-08')):
+        for student_id in ('S001', 'S002', 'S003')[:i + 1]:
+            mark(conn, student_id, day, time=f'09:0{i}:00', status='Absent' if i == 2 else 'Present')
+    conn.execute("DELETE FROM attendance WHERE student_id = 'S001' AND date = '2026-10-06'")
+    conn.commit()
+
+    summary = rows(conn, 'SELECT * FROM attendance_daily_summary')
+    departments = rows(conn, 'SELECT * FROM attendance_department_daily')
+    stats = rows(conn, 'SELECT student_id, present_days, last_seen, recent FROM student_stats')
+
+    # The migrations recompute every rollup from attendance
+    attendance_rollups(conn)
+    working_calendar(conn)
+    assert rows(conn, 'SELECT * FROM attendance_daily_summary') == summary
+    assert rows(conn, 'SELECT * FROM attendance_department_daily') == departments
+    assert rows(conn, 'SELECT student_id, present_days, last_seen, recent FROM student_stats') == stats
+    assert_rollups(conn)
+
+
+def test_period_summary_counts_working_days(school, app_module):
+    conn = school
+    app_module.set_calendar_auto(conn, False)
+    conn.executemany('INSERT INTO working_days (date) VALUES (?)',
+                     [('2026-10-05',), ('2026-10-06',), ('2026-10-07',), ('2026-10-08',)])
+    enrol(conn, 'S004', created_at='2026-10-07 12:00:00')
+    mark(conn, 'S001', '2026-10-05')
+    mark(conn, 'S001', '2026-10-06')
+    mark(conn, 'S001', '2026-10-10')  # not a working day: not counted
+    mark(conn, 'S002', '2026-10-05', status='Absent')
+    mark(conn, 'S004', '2026-10-07')
+
+    def summary(start, end):
+        return {row['student_id']: (row['total_present'], row['total_days'], row['percentage'])
+                for row in app_module.fetch_period_summary(conn, start, end)}
+
+    # Working days count from enrolment, not from the department's marks
+    assert summary('2026-10-01', '2026-10-31') == {
+        'S001': (2, 4, 50.0), 'S002': (0, 4, 0.0), 'S004': (1, 2, 50.0)}
+    assert summary('2026-10-06', '2026-10-31') == {'S001': (1, 3, 33.3), 'S004': (1, 2, 50.0)}
+    assert summary('2026-10-10', '2026-10-10') == {'S001': (0, 0, 0.0)}
+
+    version = app_module.report_fingerprint(conn, '2026-10-01', '2026-10-31')
+    conn.execute("INSERT INTO working_days (date) VALUES ('2026-10-09')")
+    assert app_module.report_fingerprint(conn, '2026-10-01', '2026-10-31') != version
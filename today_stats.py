@@ -0,0 +1,135 @@
+"""
+Today's Attendance Counters
+Smart Attendance System
+
+The dashboard and the attendance page ask for today's totals on load and
+after every mark. Instead of COUNT queries on each request, every worker
+process keeps the numbers in memory:
+
+- built from SQL on first use and again when the date changes
+- updated from the attendance event stream (every process's marks, in
+  id order) and after each registration and deletion
+- rebuilt every `resync_seconds`, which picks up registrations and
+  deletions made by other worker processes
+
+Totals are kept overall, per department and per section, together with
+the id of the last attendance event they include: a client showing the
+totals and then streaming events after that id counts every mark once.
+"""
+
+import threading
+import time
+from collections import Counter
+from datetime import date
+
+GROUPS = ('department', 'section')
+
+
+class TodayStats:
+    """In-memory student and present counts for the current day
+
+    load(day) returns ({student_id: (department, section)}, set of
+    student_ids present on `day`, id of the newest attendance row), the
+    last two read in one statement so they agree.
+    """
+
+    def __init__(self, load, resync_seconds=60.0):
+        self.load = load
+        self.resync_seconds = resync_seconds
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._day = None
+        self._loaded_at = 0.0
+        self._students = {}
+        self._present = set()
+        self._last_event_id = 0
+        self._totals = {group: Counter() for group in GROUPS}
+        self._present_counts = {group: Counter() for group in GROUPS}
+
+    def _rebuild(self, day):
+        students, present, self._last_event_id = self.load(day)
+        self._students = dict(students)
+        self._present = {student_id for student_id in present if student_id in self._students}
+        self._totals = {group: Counter() for group in GROUPS}
+        self._present_counts = {group: Counter() for group in GROUPS}
+        for student_id, groups in self._students.items():
+            self._count(self._totals, groups, 1)
+            if student_id in self._present:
+                self._count(self._present_counts, groups, 1)
+        self._day = day
+        self._loaded_at = time.monotonic()
+        self.rebuilds += 1
+
+    @staticmethod
+    def _count(counters, groups, delta):
+        for group, value in zip(GROUPS, groups):
+            counters[group][value] += delta
+            if counters[group][value] <= 0:
+                del counters[group][value]
+
+    def _refresh(self):
+        """Rebuild when the day changed or the counts are due a resync (lock held)"""
+        today = date.today().strftime('%Y-%m-%d')
+        if self._day != today or time.monotonic() - self._loaded_at > self.resync_seconds:
+            self._rebuild(today)
+
+    def invalidate(self):
+        with self._lock:
+            self._day = None
+
+    # ---------- reads ----------
+
+    def totals(self):
+        """(date, total students, present today, last attendance event id counted)"""
+        with self._lock:
+            self._refresh()
+            return self._day, len(self._students), len(self._present), self._last_event_id
+
+    def snapshot(self):
+        """Overall counts plus {'departments': {...}, 'sections': {...}} breakdowns"""
+        with self._lock:
+            self._refresh()
+            total, present = len(self._students), len(self._present)
+            breakdown = {}
+            for group in GROUPS:
+                breakdown[f'{group}s'] = {
+                    value: {'total': count, 'present': self._present_counts[group][value],
+                            'absent': count - self._present_counts[group][value]}
+                    for value, count in sorted(self._totals[group].items())
+                }
+            return {'date': self._day, 'total_students': total, 'present': present,
+                    'absent': total - present, 'last_event_id': self._last_event_id, **breakdown}
+
+    # ---------- updates, called after the change is committed ----------
+
+    def marked(self, marks):
+        """Count (event id, day, student_id) marks given in id order"""
+        with self._lock:
+            if self._day is None:
+                return
+            for event_id, day, student_id in marks:
+                # Rows up to _last_event_id were in the last rebuild
+                if event_id <= self._last_event_id:
+                    continue
+                self._last_event_id = event_id
+                groups = self._students.get(student_id)
+                if day == self._day and groups is not None and student_id not in self._present:
+                    self._present.add(student_id)
+                    self._count(self._present_counts, groups, 1)
+
+    def student_added(self, student_id, department, section):
+        with self._lock:
+            if self._day is None or student_id in self._students:
+                return
+            self._students[student_id] = (department, section)
+            self._count(self._totals, (department, section), 1)
+
+    def student_removed(self, student_id):
+        with self._lock:
+            groups = self._students.pop(student_id, None)
+            if groups is None:
+                return
+            self._count(self._totals, groups, -1)
+            if student_id in self._present:
+                self._present.discard(student_id)
+                self._count(self._present_counts, groups, -1)
@@ -0,0 +1,539 @@
+"""
+Threaded Video Pipeline
+Smart Attendance System
+
+The MJPEG feed runs as a small stage graph instead of one serial loop:
+
+    capture thread --> latest frame --> analysis workers (detect + recognize)
+                   \                                  |
+                    \-> latest frame --> encoder <-- latest annotations
+                                            |
+                                   latest JPEG --> /video_feed clients
+
+Each hand-off holds only the newest item. A slow stage skips to the
+freshest frame rather than working through a backlog, so the display
+runs at camera rate and detection at whatever rate it can sustain.
+Boxes are drawn from the most recent analysis result.
+
+Frame sources are interchangeable: a camera index, a video file, a
+directory of images, or a synthetic generator for running the pipeline
+without hardware. File sources pace themselves like a camera unless
+created with realtime=False, which the benchmarks use.
+
+A Broadcaster owns the one pipeline per process. Viewers and explicit
+start requests hold references; the camera is released shortly after the
+last one goes away.
+"""
+
+import collections
+import itertools
+import os
+import threading
+import time
+from datetime import date
+
+import cv2
+import numpy as np
+
+
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+# ==================== FRAME SOURCES ====================
+
+class CameraSource:
+    """cv2.VideoCapture on a local camera"""
+
+    def __init__(self, index=0, width=640, height=480):
+        self.capture = cv2.VideoCapture(index)
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    def read(self):
+        return self.capture.read()
+
+    def release(self):
+        self.capture.release()
+
+
+class Pacer:
+    """Sleeps so successive read()s come at most `fps` times a second"""
+
+    def __init__(self, fps):
+        self.fps = fps
+        self._next = time.monotonic()
+
+    def wait(self):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next, time.monotonic() - 1.0) + 1.0 / self.fps
+
+
+class VideoFileSource:
+    """A video file played at its native frame rate, optionally looping"""
+
+    def __init__(self, path, loop=True, fps=None, realtime=True):
+        if not os.path.exists(path):
+            raise ValueError(f'Video file not found: {path}')
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or 25.0
+        self._pacer = Pacer(self.fps) if realtime else None
+
+    def read(self):
+        # Pace like a camera so downstream timings are realistic
+        if self._pacer is not None:
+            self._pacer.wait()
+        ok, frame = self.capture.read()
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+        return ok, frame
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageDirectorySource:
+    """The images of a directory (sorted by name) played as frames, optionally looping
+
+    Images are decoded on every read(), like frames of a video.
+    """
+
+    EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, path, loop=True, fps=25.0, realtime=True):
+        if not os.path.isdir(path):
+            raise ValueError(f'Image directory not found: {path}')
+        self.paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(self.EXTENSIONS))
+        if not self.paths:
+            raise ValueError(f'No images in {path}')
+        self.loop = loop
+        self.fps = fps
+        self._pacer = Pacer(fps) if realtime else None
+        self._index = 0
+
+    def read(self):
+        if self._pacer is not None:
+            self._pacer.wait()
+        while True:
+            if self._index >= len(self.paths):
+                if not self.loop:
+                    return False, None
+                self._index = 0
+            path = self.paths[self._index]
+            self._index += 1
+            frame = cv2.imread(path, cv2.IMREAD_COLOR)
+            if frame is not None:
+                return True, frame
+            print(f"✗ Skipping unreadable image {path}")
+            if len(self.paths) == 1:
+                return False, None
+
+    def release(self):
+        pass
+
+
+class SyntheticSource:
+    """Generated frames (moving shapes over a gradient), for tests and benchmarks
+
+    The shapes are not a face to a detector: nothing gets recognized.
+    """
+
+    def __init__(self, width=640, height=480, fps=30.0, frames=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames
+        self._count = 0
+        self._pacer = Pacer(fps) if fps else None
+        gradient = np.linspace(40, 200, width, dtype=np.uint8)
+        self._background = np.dstack([np.tile(gradient, (height, 1))] * 3)
+
+    def read(self):
+        if self.frames is not None and self._count >= self.frames:
+            return False, None
+        if self._pacer is not None:
+            self._pacer.wait()
+        frame = self._background.copy()
+        x = int((self._count * 4) % max(1, self.width - 120))
+        cv2.rectangle(frame, (x, 120), (x + 120, 280), (90, 140, 200), -1)
+        cv2.circle(frame, (x + 35, 180), 10, (30, 30, 30), -1)
+        cv2.circle(frame, (x + 85, 180), 10, (30, 30, 30), -1)
+        self._count += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def open_source(spec, width=640, height=480, realtime=True):
+    """Frame source from a spec: camera index ('0'), 'synthetic', an image directory or a video file path"""
+    spec = str(spec)
+    if spec.isdigit():
+        return CameraSource(int(spec), width, height)
+    if spec == 'synthetic':
+        return SyntheticSource(width, height, fps=30.0 if realtime else 0)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec, realtime=realtime)
+    return VideoFileSource(spec, realtime=realtime)
+
+
+def draw_annotations(frame, boxes):
+    """Draw (x, y, w, h, label, bgr_color) boxes onto a frame in place"""
+    for x, y, w, h, label, color in boxes:
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+
+def draw_watermark(frame):
+    """App name and today's date in the top-left corner (the feed's overlay)"""
+    cv2.putText(frame, 'Smart Attendance System', (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    cv2.putText(frame, f'Date: {date.today().strftime("%Y-%m-%d")}', (10, 60),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+
+# ==================== HAND-OFF BUFFERS AND STATS ====================
+
+class LatestFrame:
+    """Single-slot buffer: put() overwrites, readers only ever see the newest item"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0
+        self._taken = True
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if not self._taken:
+                self.dropped += 1
+            self._item, self._taken = item, False
+            self._seq += 1
+            self._cond.notify_all()
+
+    def take(self, timeout=None):
+        """Consume the newest item (each item goes to at most one taker)"""
+        with self._cond:
+            if self._taken and not self._cond.wait_for(lambda: not self._taken, timeout):
+                return None
+            self._taken = True
+            return self._item
+
+    def wait_newer(self, seq, timeout=None):
+        """Return (seq, item) for an item newer than `seq` without consuming it"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > seq, timeout):
+                return seq, None
+            return self._seq, self._item
+
+
+class StageStats:
+    """Throughput and latency of one stage over a sliding window"""
+
+    def __init__(self, window=120):
+        self._lock = threading.Lock()
+        self._done = collections.deque(maxlen=window)     # completion timestamps
+        self._latency = collections.deque(maxlen=window)  # seconds per item
+        self.count = 0
+
+    def record(self, latency):
+        with self._lock:
+            self._done.append(time.monotonic())
+            self._latency.append(latency)
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            done, latency = list(self._done), sorted(self._latency)
+        fps = 0.0
+        if len(done) > 1 and done[-1] > done[0]:
+            # Frames per second over the window, zero once the stage goes idle
+            if time.monotonic() - done[-1] < 2.0:
+                fps = (len(done) - 1) / (done[-1] - done[0])
+        return {
+            'count': self.count,
+            'fps': round(fps, 1),
+            'latency_ms': round(1000 * sum(latency) / len(latency), 1) if latency else None,
+            'p95_ms': round(1000 * latency[int(0.95 * (len(latency) - 1))], 1) if latency else None,
+        }
+
+
+# ==================== PIPELINE ====================
+
+class VideoPipeline:
+    """Capture -> (analyze workers, encoder) -> latest JPEG
+
+    analyze(frame) returns a list of (x, y, w, h, label, bgr_color)
+    annotations, or None to skip the frame, and may have side effects
+    (marking attendance); an analyze object with a stats() method has its
+    stats included in the pipeline's. overlay(frame) draws static text on
+    every frame before encoding.
+    """
+
+    def __init__(self, source_factory, analyze, overlay=None, workers=2, jpeg_quality=80):
+        self.source_factory = source_factory
+        self.analyze = analyze
+        self.overlay = overlay
+        self.workers = workers
+        self.jpeg_quality = jpeg_quality
+        self._stop = threading.Event()
+        self._threads = []
+        self._source = None
+        self._captured = LatestFrame()   # for analysis workers (consumed)
+        self._display = LatestFrame()    # for the encoder (peeked)
+        self.output = LatestFrame()      # encoded JPEGs for clients (peeked)
+        self._annotations = (0, 0.0, [])  # (frame seq, capture time, boxes)
+        self._annotation_lock = threading.Lock()
+        self.stats_by_stage = {name: StageStats() for name in ('capture', 'analyze', 'encode')}
+        self._end_to_end = StageStats()
+        self._detection_age = StageStats()
+        self.started_at = None
+        self.error = None
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def start(self):
+        if self.running:
+            return self
+        if self._threads:
+            self.stop()  # the source ended; clean up before restarting
+        self._stop.clear()
+        self._annotations = (0, 0.0, [])
+        self._source = self.source_factory()
+        self.started_at = time.time()
+        self._threads = [threading.Thread(target=self._capture_loop, name='video-capture', daemon=True),
+                         threading.Thread(target=self._encode_loop, name='video-encode', daemon=True)]
+        self._threads += [threading.Thread(target=self._analyze_loop, name=f'video-analyze-{i}', daemon=True)
+                          for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        self._threads = []
+        if self._source is not None:
+            self._source.release()
+            self._source = None
+
+    def _capture_loop(self):
+        seq = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                ok, frame = self._source.read()
+            except Exception as e:
+                ok, self.error = False, str(e)
+            if not ok:
+                print("✗ Video source ended or failed, stopping pipeline")
+                self._stop.set()
+                break
+            seq += 1
+            item = (seq, time.monotonic(), frame)
+            self._captured.put(item)
+            self._display.put(item)
+            self.stats_by_stage['capture'].record(time.monotonic() - started)
+
+    def _analyze_loop(self):
+        while not self._stop.is_set():
+            item = self._captured.take(timeout=0.5)
+            if item is None:
+                continue
+            seq, captured_at, frame = item
+            started = time.monotonic()
+            try:
+                boxes = self.analyze(frame)
+            except Exception as e:
+                print(f"❌ Frame analysis failed: {e}")
+                continue
+            if boxes is None:
+                # The analyzer declined this frame (e.g. a tracker busy on another)
+                continue
+            finished = time.monotonic()
+            self.stats_by_stage['analyze'].record(finished - started)
+            self._detection_age.record(finished - captured_at)
+            with self._annotation_lock:
+                # Workers may finish out of order; never replace newer boxes
+                if seq > self._annotations[0]:
+                    self._annotations = (seq, captured_at, boxes)
+
+    def _encode_loop(self):
+        last_seq = 0
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
+        while not self._stop.is_set():
+            last_seq, item = self._display.wait_newer(last_seq, timeout=0.5)
+            if item is None:
+                continue
+            _, captured_at, frame = item
+            started = time.monotonic()
+            frame = frame.copy()
+            with self._annotation_lock:
+                boxes = self._annotations[2]
+            draw_annotations(frame, boxes)
+            if self.overlay is not None:
+                self.overlay(frame)
+            ok, buffer = cv2.imencode('.jpg', frame, params)
+            if not ok:
+                continue
+            # The complete multipart part is built once and shared by every client
+            self.output.put(MJPEG_PART_HEADER + buffer.tobytes() + b'\r\n')
+            finished = time.monotonic()
+            self.stats_by_stage['encode'].record(finished - started)
+            self._end_to_end.record(finished - captured_at)
+
+    def frames(self, timeout=5.0):
+        """Yield multipart MJPEG parts for one client until the pipeline stops"""
+        seq = 0
+        while self.running:
+            seq, part = self.output.wait_newer(seq, timeout)
+            if part is not None:
+                yield part
+
+    def stats(self):
+        stages = {name: stats.snapshot() for name, stats in self.stats_by_stage.items()}
+        stages['capture']['dropped_before_analyze'] = self._captured.dropped
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'workers': self.workers,
+            'stages': stages,
+            'detection_age_ms': self._detection_age.snapshot()['latency_ms'],
+            'end_to_end_ms': self._end_to_end.snapshot()['latency_ms'],
+            'analysis': self.analyze.stats() if hasattr(self.analyze, 'stats') else None,
+            'error': self.error,
+        }
+
+
+# ==================== BROADCASTER ====================
+
+class Broadcaster:
+    """Reference-counted owner of the single shared VideoPipeline
+
+    Holders are named (an MJPEG subscriber, a user who pressed "start"), so
+    releasing twice is harmless. When the last holder leaves, the pipeline
+    keeps running for `linger` seconds to absorb page reloads.
+    """
+
+    def __init__(self, pipeline_factory, linger=5.0):
+        self.pipeline_factory = pipeline_factory
+        self.linger = linger
+        self._lock = threading.Lock()
+        self._holders = set()
+        self._pipeline = None
+        self._starting = None  # Event set once the pipeline being started is installed
+        self._idle_timer = None
+        self._subscriber_ids = itertools.count(1)
+        self.subscribers = 0
+
+    @property
+    def pipeline(self):
+        return self._pipeline
+
+    def acquire(self, holder):
+        """Add a holder, starting the pipeline if it is not running
+
+        Opening the source can take seconds, so it happens outside the lock:
+        one caller starts the pipeline while the others wait for it, and
+        release() and stop() are never blocked behind a camera.
+        """
+        while True:
+            with self._lock:
+                self._holders.add(holder)
+                if self._idle_timer is not None:
+                    self._idle_timer.cancel()
+                    self._idle_timer = None
+                if self._pipeline is not None and self._pipeline.running:
+                    return self._pipeline
+                starting = self._starting
+                if starting is None:
+                    starting = self._starting = threading.Event()
+                    stale, self._pipeline = self._pipeline, None
+                    break
+            starting.wait()
+
+        pipeline = None
+        try:
+            if stale is not None:
+                stale.stop()  # the source ended
+            pipeline = self.pipeline_factory().start()
+        finally:
+            with self._lock:
+                self._starting = None
+                # Every holder may have left (or stop() run) while it started
+                if pipeline is not None and self._holders:
+                    self._pipeline, pipeline = pipeline, None
+                installed = self._pipeline
+            starting.set()
+        if pipeline is not None:
+            pipeline.stop()
+            return pipeline
+        return installed
+
+    def release(self, holder):
+        """Drop a holder; the pipeline stops `linger` seconds after the last one"""
+        with self._lock:
+            self._holders.discard(holder)
+            if self._holders or self._pipeline is None or self._idle_timer is not None:
+                return
+            self._idle_timer = threading.Timer(self.linger, self._stop_if_idle)
+            self._idle_timer.daemon = True
+            self._idle_timer.start()
+
+    def _stop_if_idle(self):
+        with self._lock:
+            self._idle_timer = None
+            if self._holders or self._pipeline is None:
+                return
+            pipeline, self._pipeline = self._pipeline, None
+        pipeline.stop()
+        print("✓ Video pipeline stopped (no viewers)")
+
+    def stop(self):
+        """Stop immediately, whoever still holds it"""
+        with self._lock:
+            self._holders.clear()
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            pipeline, self._pipeline = self._pipeline, None
+        if pipeline is not None:
+            pipeline.stop()
+
+    def subscribe(self):
+        """MJPEG parts for one viewer; holds a reference while being iterated
+
+        The stream ends without a part when no running pipeline is available
+        (stop() ran while it started, or the source failed to open).
+        """
+        holder = f'subscriber-{next(self._subscriber_ids)}'
+        with self._lock:
+            self.subscribers += 1
+        try:
+            pipeline = self.acquire(holder)
+            if pipeline is None or not pipeline.running:
+                return
+            yield from pipeline.frames()
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+            self.release(holder)
+
+    def stats(self):
+        with self._lock:
+            pipeline = self._pipeline
+            info = {'holders': len(self._holders), 'subscribers': self.subscribers,
+                    'stopping': self._idle_timer is not None}
+        if pipeline is None:
+            return dict(info, running=False)
+        return dict(pipeline.stats(), **info)